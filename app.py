@@ -1,8 +1,23 @@
 
 import streamlit as st
 from boamp_scraper import BOAMPScraper
+from boamp_cache import NoticeCache
+from boamp_index import LotIndex
+from boamp_jobs import JobQueue, JobRunner
+from boamp_results import CompanyStore
+from collections import OrderedDict
 import csv
 import io
+import time
+import uuid
+
+# Nb d'extractions gardées en mémoire par session (les plus anciennes sont oubliées)
+MAX_CACHED_EXTRACTIONS = 10
+# Processus workers de la file de tâches de fond, partagés par tous les utilisateurs
+JOB_PROCESSES = 2
+# Plafond du nb d'avis par extraction : les recherches sont planifiées (volume et durée
+# estimés avant le lancement) et découpées en tranches récupérées en parallèle
+MAX_NOTICES = 100000
 
 # Configuration de la page
 st.set_page_config(
@@ -93,11 +108,22 @@ st.markdown("Extracteur d'entreprises intelligent pour les avis de marché.")
 with st.sidebar:
     st.header("Configuration")
     
-    url = st.text_input(
-        "URL de l'avis",
-        placeholder="https://www.boamp.fr/pages/avis/...",
-        help="Collez ici l'URL complète de l'avis d'attribution."
-    )
+    offline = st.radio(
+        "Source", ["API BOAMP (en ligne)", "Index local (hors-ligne)"],
+        help="L'index local contient tous les lots des avis déjà extraits : d'autres mots-clés y sont "
+             "résolus instantanément, sans interroger l'API."
+    ) == "Index local (hors-ligne)"
+    
+    if offline:
+        url = "index:local"
+        departement = st.text_input("Département (optionnel)", placeholder="33").strip()
+    else:
+        departement = ""
+        url = st.text_input(
+            "URL de l'avis",
+            placeholder="https://www.boamp.fr/pages/avis/...",
+            help="Collez ici l'URL complète de l'avis d'attribution."
+        )
     
     keywords_input = st.text_area(
         "Mots-clés (séparés par virgules)",
@@ -109,10 +135,11 @@ with st.sidebar:
     max_notices = st.number_input(
         "Nombre max d'avis à analyser",
         min_value=1,
-        max_value=500,
+        max_value=MAX_NOTICES,
         value=50,
         step=10,
-        help="Nombre maximum d'avis à récupérer depuis la page de recherche."
+        help="Nombre maximum d'avis à récupérer depuis la page de recherche. "
+             "Au-delà de quelques centaines, préférez la recherche en tâche de fond."
     )
     
     st.subheader("Champs à exporter")
@@ -128,75 +155,231 @@ with st.sidebar:
         show_match = st.checkbox("Matchs", False)
         show_lot = st.checkbox("Lot", True)
 
+    merge_companies = st.checkbox(
+        "Regrouper par entreprise", False,
+        help="Une ligne par entreprise (SIRET, sinon nom + ville) avec ses avis et lots cumulés."
+    )
+
+    use_cache = st.checkbox("Utiliser le cache local des avis", True, help="Les avis déjà téléchargés sont relus depuis le disque.")
+    background = st.checkbox(
+        "Recherche en tâche de fond", True,
+        help="L'extraction continue sur le serveur même si l'onglet est fermé ; les résultats restent disponibles."
+    )
+
     launch_btn = st.button("Lancer l'extraction")
 
+@st.cache_resource
+def get_notice_cache():
+    """Cache disque des avis, partagé par toutes les sessions"""
+    return NoticeCache()
+
+@st.cache_resource
+def get_lot_index():
+    """Index local des lots, alimenté par toutes les extractions en ligne"""
+    return LotIndex()
+
+@st.cache_resource
+def get_scraper(use_cache):
+    """Scraper partagé entre sessions et reruns (session HTTP, pool de connexions, métriques)"""
+    return BOAMPScraper(cache=get_notice_cache(), use_cache=use_cache, index=get_lot_index())
+
+@st.cache_resource
+def get_job_queue():
+    """File de tâches de fond, avec ses processus workers démarrés une seule fois par serveur"""
+    JobRunner(processes=JOB_PROCESSES).start()
+    return JobQueue()
+
+@st.cache_data(max_entries=MAX_CACHED_EXTRACTIONS * 4, show_spinner=False)
+def build_csv(run_id, fieldnames, _rows):
+    """CSV des colonnes cochées ; _rows n'est pas haché, l'identifiant d'extraction suffit"""
+    csv_buffer = io.StringIO()
+    writer = csv.DictWriter(csv_buffer, fieldnames=list(fieldnames))
+    writer.writeheader()
+    writer.writerows(_rows)
+    return csv_buffer.getvalue()
+
+def to_display_row(r):
+    """Filtrage des colonnes selon les cases cochées"""
+    entry = {}
+    if show_id: entry['N° Avis'] = r.get('avis_id') or r.get('source_avis_id')
+    if show_nom: entry['Nom'] = r.get('nom')
+    if show_lot: entry['Lot'] = r.get('lot_title')
+    if show_email: entry['Email'] = r.get('email')
+    if show_tel: entry['Téléphone'] = r.get('telephone')
+    if show_ville: entry['Ville'] = r.get('ville')
+    if show_url: entry['URL Source'] = r.get('url_source')
+    if show_match: entry['Matchs'] = r.get('mots_cles_matches')
+    if merge_companies: entry['Nb avis'] = r.get('nb_avis')
+    return entry
+
+def merge_rows(rows):
+    """Fusion des entreprises retenues sur plusieurs avis (si la case est cochée)"""
+    if not merge_companies:
+        return rows
+    store = CompanyStore()
+    store.add_results(rows)
+    return store.companies()
+
+def run_extraction(scraper, url, keywords, max_notices, departement=""):
+    """Extraction (avis unique ou recherche), avec affichage au fil de l'eau"""
+    if url == "index:local":
+        index = get_lot_index()
+        st.caption(f"Index local : {len(index)} avis.")
+        return index.search(keywords, departement=departement or None, max_notices=max_notices)
+    
+    # Détection du type d'URL (Avis unique ou Recherche)
+    if "pages/recherche" not in url:
+        return scraper.scrape_page(url, keywords)
+    
+    st.info("🔎 Détection d'une page de recherche BOAMP. Passage en mode extraction de masse...")
+    plan = scraper.plan_search(url, max_notices)
+    if plan is not None:
+        st.caption(f"Estimation : {plan.summary()}")
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    def update_progress(current, total, msg):
+        if plan is not None and plan.notices:
+            total = max(plan.notices, current) # Nb d'avis réel plutôt que le plafond demandé
+        progress_bar.progress(current / total)
+        status_text.text(f"{msg} ({current}/{total})")
+    
+    # Les lignes s'affichent au fur et à mesure de l'extraction
+    live_table = st.empty()
+    results = []
+    display_data = []
+    try:
+        for r in scraper.iter_search_results(url, keywords, max_results=max_notices, progress_callback=update_progress,
+                                             plan=plan):
+            results.append(r)
+            display_data.append(to_display_row(r))
+            if len(display_data) % 10 == 0:
+                live_table.dataframe(display_data, use_container_width=True)
+    except Exception:
+        # Recherche interrompue : les lignes déjà lues restent affichées, mais rien n'est mémorisé
+        live_table.dataframe(display_data, use_container_width=True)
+        progress_bar.empty()
+        st.warning(f"⚠️ Extraction incomplète : {len(results)} entreprises lues avant l'erreur (relancez pour compléter).")
+        raise
+    live_table.empty()
+    status_text.text("Extraction terminée !")
+    progress_bar.empty()
+    return results
+
+# Extractions mémorisées dans la session : clé (URL, mots-clés, nb max d'avis, cache)
+# Cocher une colonne ou télécharger le CSV relance le script, mais pas l'extraction.
+extractions = st.session_state.setdefault('extractions', OrderedDict())
+
 # Main content
 if launch_btn and url:
     raw_keywords = keywords_input.split(',')
     keywords = [k.strip() for k in raw_keywords if k.strip()]
+    key = (url.strip(), tuple(keywords), int(max_notices), use_cache, departement)
+    
+    if offline:
+        # Réponse immédiate : jamais mémorisée, l'index grossit à chaque extraction en ligne
+        extractions.pop(key, None)
     
-    with st.spinner('Extraction en cours... (Analyse de l\'API DILA etc.)'):
-        try:
-            scraper = BOAMPScraper()
-            
-            # Détection du type d'URL (Avis unique ou Recherche)
-            if "pages/recherche" in url:
-                st.info("🔎 Détection d'une page de recherche BOAMP. Passage en mode extraction de masse...")
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                def update_progress(current, total, msg):
-                    progress_bar.progress(current / total)
-                    status_text.text(f"{msg} ({current}/{total})")
-                
-                results = scraper.scrape_search_results(url, keywords, max_results=max_notices, progress_callback=update_progress)
-                status_text.text("Extraction terminée !")
-                progress_bar.empty()
-                
-            else:
-                results = scraper.scrape_page(url, keywords)
-            
-            if results:
-                st.success(f"✅ {len(results)} entreprises trouvées !")
-                
-                # Filtrage des colonnes
-                display_data = []
-                for r in results:
-                    entry = {}
-                    if show_id: entry['N° Avis'] = r.get('avis_id') or r.get('source_avis_id')
-                    if show_nom: entry['Nom'] = r.get('nom')
-                    if show_lot: entry['Lot'] = r.get('lot_title')
-                    if show_email: entry['Email'] = r.get('email')
-                    if show_tel: entry['Téléphone'] = r.get('telephone')
-                    if show_ville: entry['Ville'] = r.get('ville')
-                    if show_url: entry['URL Source'] = r.get('url_source')
-                    if show_match: entry['Matchs'] = r.get('mots_cles_matches')
-                    display_data.append(entry)
-                
-                # Affichage tableau
-                st.dataframe(display_data, use_container_width=True)
-                
-                # Export CSV
-                csv_buffer = io.StringIO()
-                if display_data:
-                    writer = csv.DictWriter(csv_buffer, fieldnames=display_data[0].keys())
-                    writer.writeheader()
-                    writer.writerows(display_data)
-                
-                st.download_button(
-                    label="📥 Télécharger CSV",
-                    data=csv_buffer.getvalue(),
-                    file_name="entreprises_boamp.csv",
-                    mime="text/csv",
-                )
-                
-            else:
-                st.warning("⚠️ Aucune entreprise trouvée avec ces critères.")
-                
-        except Exception as e:
-            st.error(f"❌ Une erreur est survenue : {e}")
+    if background and not offline and "pages/recherche" in url:
+        job_id = get_job_queue().submit(key[0], keywords, key[2])
+        st.session_state.setdefault('jobs', []).append(job_id)
+        st.query_params['job'] = job_id # Lien à garder pour retrouver la tâche après fermeture de l'onglet
+        key = None
+    elif key in extractions:
+        extractions.move_to_end(key)
+        st.caption("Résultats déjà extraits dans cette session (relancez avec d'autres critères pour rafraîchir).")
+    else:
+        with st.spinner('Extraction en cours... (Analyse de l\'API DILA etc.)'):
+            try:
+                results = run_extraction(get_scraper(use_cache), key[0], keywords, key[2], departement)
+                extractions[key] = (uuid.uuid4().hex, results)
+                while len(extractions) > MAX_CACHED_EXTRACTIONS:
+                    extractions.popitem(last=False)
+            except Exception as e:
+                st.error(f"❌ Une erreur est survenue : {e}")
+    st.session_state['current_extraction'] = key if key in extractions else None
 
 elif launch_btn and not url:
     st.error("⚠️ Veuillez entrer une URL valide.")
-else:
+
+current = st.session_state.get('current_extraction')
+if current in extractions:
+    run_id, results = extractions[current]
+    if results:
+        rows = merge_rows(results)
+        st.success(f"✅ {len(rows)} entreprises trouvées !")
+        
+        # Filtrage des colonnes (sur les résultats mémorisés)
+        display_data = [to_display_row(r) for r in rows]
+        
+        # Affichage tableau
+        st.dataframe(display_data, use_container_width=True)
+        
+        # Export CSV
+        # Schéma fixe = colonnes cochées (indépendant du contenu de la 1re ligne)
+        fieldnames = tuple(to_display_row({}).keys())
+        st.download_button(
+            label="📥 Télécharger CSV",
+            data=build_csv((run_id, merge_companies), fieldnames, display_data),
+            file_name="entreprises_boamp.csv",
+            mime="text/csv",
+        )
+        
+    else:
+        st.warning("⚠️ Aucune entreprise trouvée avec ces critères.")
+    
+    # Où est passé le temps : API, décodage, parsing, fallback...
+    with st.expander("📊 Statistiques d'exécution (cumulées depuis le démarrage du serveur)"):
+        stats = get_scraper(current[3]).metrics.snapshot()
+        st.dataframe([{'Étape': stage, **t} for stage, t in stats['stages'].items()], use_container_width=True)
+        st.json({k: v for k, v in stats.items() if k != 'stages'})
+
+# Tâches de fond de la session (et celle passée dans l'URL : ?job=...)
+jobs = st.session_state.setdefault('jobs', [])
+if st.query_params.get('job') and st.query_params['job'] not in jobs:
+    jobs.append(st.query_params['job'])
+
+pending = False
+if jobs:
+    st.subheader("⏳ Tâches de fond")
+    queue = get_job_queue()
+for job_id in reversed(jobs):
+    job = queue.status(job_id)
+    if job is None:
+        continue
+    active = job['status'] in ('queued', 'running')
+    pending = pending or active
+    label = f"{job['search_url'][:80]} — {job['status']} — {job['n_results']} entreprises"
+    with st.expander(label, expanded=active or job_id == st.query_params.get('job')):
+        st.caption(f"Tâche {job_id} · mots-clés : {', '.join(job['keywords']) or '(aucun)'}")
+        if job['plan_summary']:
+            st.caption(f"Estimation : {job['plan_summary']}")
+        if job['progress_total']:
+            st.progress(min(job['progress_current'] / job['progress_total'], 1.0),
+                        text=f"{job['progress_message'] or ''} ({job['progress_current']}/{job['progress_total']})")
+        if job['error']:
+            st.error(f"❌ {job['error']}")
+        if active and st.button("Annuler", key=f"cancel-{job_id}"):
+            queue.cancel(job_id)
+            st.rerun()
+        
+        if job['n_results']:
+            # Résultats partiels tant que la tâche tourne
+            display_data = [to_display_row(r) for r in merge_rows(queue.results(job_id))]
+            st.dataframe(display_data, use_container_width=True)
+            st.download_button(
+                label="📥 Télécharger CSV",
+                data=build_csv((job_id, job['status'], job['n_results'], merge_companies),
+                               tuple(to_display_row({}).keys()), display_data),
+                file_name=f"entreprises_boamp_{job_id}.csv",
+                mime="text/csv",
+                key=f"download-{job_id}",
+            )
+
+if not launch_btn and not jobs and current not in extractions:
     st.info("👈 Configurez votre recherche dans la barre latérale pour commencer.")
+
+# Suivi des tâches en cours : nouvel affichage toutes les 2 secondes
+if pending:
+    time.sleep(2)
+    st.rerun()
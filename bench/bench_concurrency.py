@@ -0,0 +1,60 @@
+"""
+Benchmark du mode concurrent de scrape_search_results contre un stub local.
+Les avis de la recherche sont servis sans 'donnees' pour forcer un appel par avis.
+
+    python bench/bench_concurrency.py --notices 200 --latency 0.05 --workers 1 4 8 16
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boamp_http import BOAMPSession
+from boamp_scraper import BOAMPScraper
+from stub_server import StubAPI
+
+SEARCH_URL = "https://www.boamp.fr/pages/recherche/?refine.type_avis=6"
+
+
+def run(api_base, notices, workers, rate=None):
+    scraper = BOAMPScraper(api_base=api_base, session=BOAMPSession(rate=rate))
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = scraper.scrape_search_results(SEARCH_URL, [], max_results=notices, workers=workers)
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--notices', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--rate', type=float, default=None, help="Limite req/s de la session (défaut: aucune)")
+    parser.add_argument('--throttle-every', type=int, default=0, help="Le stub renvoie un 429 une requête sur N")
+    args = parser.parse_args()
+
+    stub = StubAPI(n_records=args.notices, latency=args.latency, include_donnees=False,
+                   throttle_every=args.throttle_every)
+    api_base = stub.start()
+    try:
+        baseline = None
+        reference = None
+        for workers in args.workers:
+            elapsed, results = run(api_base, args.notices, workers, args.rate)
+            baseline = baseline or elapsed
+            ids = [r['source_avis_id'] for r in results]
+            if reference is None:
+                reference = ids
+            same_order = "oui" if ids == reference else "NON"
+            print(f"workers={workers:>3}  {elapsed:7.2f}s  x{baseline / elapsed:5.1f}  "
+                  f"{len(results)} entreprises  ordre identique: {same_order}")
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark de parse_structured_data sur des avis EFORMS synthétiques de taille croissante.
+Le temps par lot doit rester à peu près constant (coût linéaire).
+Compare aussi le décodage de 'donnees' : orjson complet, projection EFORMS et json standard
+(c'est ce qui fixe boamp_json.PROJECTION_MIN_BYTES).
+
+    python bench/bench_eforms.py --lots 10 100 500 1000 2000 --filler 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boamp_json
+from boamp_scraper import BOAMPScraper
+from synthetic import make_eforms_notice
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lots', type=int, nargs='+', default=[10, 100, 500, 1000, 2000])
+    parser.add_argument('--tenders-per-lot', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filler', type=int, default=20,
+                        help="texte hors sous-arbres utiles par lot (caractères x lots), pour le décodage")
+    args = parser.parse_args()
+
+    scraper = BOAMPScraper()
+    for n_lots in args.lots:
+        donnees = make_eforms_notice(n_lots=n_lots, tenders_per_lot=args.tenders_per_lot)
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = best_of(lambda: scraper.parse_structured_data(donnees, [], "bench"), args.repeat)
+        print(f"lots={n_lots:>5}  offres={n_lots * args.tenders_per_lot:>6}  "
+              f"{elapsed * 1000:8.2f} ms  {elapsed / n_lots * 1e6:7.1f} µs/lot")
+
+    print("\ndécodage de 'donnees' (ms)")
+    for n_lots in args.lots:
+        raw = json.dumps(make_eforms_notice(n_lots=n_lots, tenders_per_lot=args.tenders_per_lot,
+                                            filler=n_lots * args.filler), ensure_ascii=False)
+        timings = {
+            'projection': best_of(lambda: boamp_json._project_eforms(raw), args.repeat),
+            'json': best_of(lambda: json.loads(raw), args.repeat),
+        }
+        if boamp_json.orjson is not None:
+            timings['orjson'] = best_of(lambda: boamp_json.orjson.loads(raw), args.repeat)
+        print(f"lots={n_lots:>5}  {len(raw) / 1024:8.1f} Ko  " +
+              "  ".join(f"{name} {elapsed * 1000:8.2f}" for name, elapsed in timings.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Corpus de non-régression du parseur FNSimple (bench/fixtures/fnsimple_corpus.json : lots
+simples, multi-attributaires, infructueux, sans en-tête de lot, variantes typographiques ;
+aussi rejoué par tests/test_parsers.py), puis micro-benchmark sur des avis synthétiques
+de taille croissante.
+
+    python bench/bench_fnsimple.py --lots 10 100 1000 5000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boamp_scraper import BOAMPScraper
+from stub_server import FIXTURES_DIR
+from synthetic import make_fnsimple_notice
+
+
+def check_corpus(scraper):
+    """Compare la sortie du parseur aux résultats attendus du corpus ; retourne le nb d'écarts"""
+    with open(os.path.join(FIXTURES_DIR, 'fnsimple_corpus.json'), encoding='utf-8') as f:
+        corpus = json.load(f)
+    failures = 0
+    for case in corpus:
+        donnees = {'FNSimple': {'attribution': {'attributionMarche': case['attributionMarche']}}}
+        got = scraper.parse_fnsimple_data(donnees, case['keywords'], 'corpus')
+        if got != case['expected']:
+            failures += 1
+            print(f"❌ {case['name']}\n   attendu: {case['expected']}\n   obtenu:  {got}")
+        else:
+            print(f"✅ {case['name']} ({len(got)} entreprise(s))")
+    return failures
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lots', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--marches-per-lot', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    scraper = BOAMPScraper()
+    failures = check_corpus(scraper)
+
+    for n_lots in args.lots:
+        donnees = make_fnsimple_notice(n_lots, args.marches_per_lot, infructueux_every=7)
+        elapsed = best_of(lambda: scraper.parse_fnsimple_data(donnees, ["plomberie", "menuiseries"], "bench"),
+                          args.repeat)
+        print(f"lots={n_lots:>5}  marchés={n_lots * args.marches_per_lot:>6}  "
+              f"{elapsed * 1000:8.2f} ms  {elapsed / n_lots * 1e6:7.1f} µs/lot")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
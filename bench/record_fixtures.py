@@ -0,0 +1,34 @@
+"""
+Enregistre des avis réels de l'API opendatasoft dans bench/fixtures/ (nécessite le réseau).
+
+    python bench/record_fixtures.py eforms_award=24-118201 fnsimple_award=24-097512 boamp_html=23-054310:boamp-html
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boamp_scraper import BOAMPScraper
+from stub_server import FIXTURES_DIR
+
+
+def main():
+    scraper = BOAMPScraper()
+    for spec in sys.argv[1:]:
+        name, _, target = spec.partition('=')
+        idweb, _, dataset = target.partition(':')
+        resp = scraper.session.get(scraper.api_search_url, timeout=30, params={
+            'dataset': dataset or 'boamp', 'q': f'idweb:"{idweb}"', 'rows': 1,
+        })
+        records = resp.json().get('records', []) if resp.status_code == 200 else []
+        if not records:
+            print(f"❌ {idweb} introuvable ({resp.status_code})")
+            continue
+        with open(os.path.join(FIXTURES_DIR, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(records[0], f, ensure_ascii=False, indent=1)
+        print(f"✅ {name}.json <- {idweb}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Suite de benchmarks hors-ligne du scraper (fixtures + stub local de l'API opendatasoft).
+
+Mesure pour chaque scénario : débit, latence p50/p95 par appel et pic mémoire (tracemalloc).
+
+    python bench/run.py                       # tous les scénarios
+    python bench/run.py --only parse          # filtre sur le nom
+    python bench/run.py --latency 0.05 --throttle-every 20 --json bench_output.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boamp_async import AsyncBOAMPScraper, AsyncBOAMPSession, httpx
+from boamp_cache import SingleFlight
+from boamp_http import BOAMPSession
+from boamp_index import LotIndex
+from boamp_scraper import BOAMPScraper
+from stub_server import StubAPI, load_fixture
+from synthetic import make_eforms_notice
+
+SEARCH_URL = "https://www.boamp.fr/pages/recherche/?refine.type_avis=6"
+KEYWORDS = ["plomberie", "CVC", "génie climatique", "électricité", "menuiseries"]
+
+
+def measure(fn, iterations, units=1):
+    """Exécute fn `iterations` fois : débit (unités/s), p50/p95 (ms) et pic mémoire (Ko)"""
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn() # Échauffement
+        start = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - t0)
+        total = time.perf_counter() - start
+
+        # Passe séparée pour la mémoire (tracemalloc ralentit fortement l'exécution)
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'throughput': iterations * units / total,
+        'p50_ms': cuts[49] * 1000,
+        'p95_ms': cuts[94] * 1000,
+        'peak_kb': peak / 1024,
+    }
+
+
+def scenarios(args):
+    """Scénarios (nom, fonction, itérations, unités par appel)"""
+    offline = BOAMPScraper(session=BOAMPSession(rate=None))
+    eforms = json.loads(load_fixture('eforms_award')['fields']['donnees'])
+    fnsimple = json.loads(load_fixture('fnsimple_award')['fields']['donnees'])
+    large = make_eforms_notice(n_lots=args.large_lots, tenders_per_lot=3)
+    bulky = json.dumps(make_eforms_notice(n_lots=args.large_lots, tenders_per_lot=3, filler=args.large_lots * 20),
+                       ensure_ascii=False)
+    full_decode = BOAMPScraper(session=offline.session, json_projection=False)
+
+    yield ('parse_structured_data[fixture]',
+           lambda: offline.parse_structured_data(eforms, KEYWORDS, "bench"), args.iterations * 10, 1)
+    yield (f'parse_structured_data[synthetic {args.large_lots} lots]',
+           lambda: offline.parse_structured_data(large, KEYWORDS, "bench"), args.iterations, 1)
+    yield (f'decode_donnees[défaut, {len(bulky) // 1024} Ko]',
+           lambda: offline.decode_donnees(bulky), args.iterations, 1)
+    yield (f'decode_donnees[complet, {len(bulky) // 1024} Ko]',
+           lambda: full_decode.decode_donnees(bulky), args.iterations, 1)
+    yield ('parse_fnsimple_data[fixture]',
+           lambda: offline.parse_fnsimple_data(fnsimple, KEYWORDS, "bench"), args.iterations * 10, 1)
+
+    payloads = [load_fixture('eforms_award')['fields']['donnees'],
+                load_fixture('fnsimple_award')['fields']['donnees']]
+    stub = StubAPI(n_records=args.notices, latency=args.latency, payloads=payloads,
+                   throttle_every=args.throttle_every)
+    api_base = stub.start()
+    # ttl=0 : chaque itération refait ses appels (seuls les appels simultanés sont fusionnés)
+    online = BOAMPScraper(api_base=api_base, session=BOAMPSession(rate=args.rate), flight=SingleFlight(ttl=0))
+    try:
+        notice_url = f"https://www.boamp.fr/pages/avis/?q=idweb:%22{stub.notices[0][0]}%22"
+        yield ('scrape_page[stub]', lambda: online.scrape_page(notice_url, []), args.iterations, 1)
+        for workers in args.workers:
+            yield (f'scrape_search_results[stub, workers={workers}]',
+                   lambda w=workers: online.scrape_search_results(SEARCH_URL, [], max_results=args.notices, workers=w),
+                   max(2, args.iterations // 10), args.notices)
+        for parse_workers in args.parse_workers:
+            yield (f'scrape_search_results[stub, parse_workers={parse_workers}]',
+                   lambda p=parse_workers: online.scrape_search_results(
+                       SEARCH_URL, [], max_results=args.notices, workers=max(args.workers), parse_workers=p),
+                   max(2, args.iterations // 10), args.notices)
+
+        if httpx is not None:
+            # Client et sémaphore créés dans la boucle de chaque itération
+            async def scrape_async(concurrency):
+                session = AsyncBOAMPSession(rate=args.rate, max_connections=concurrency)
+                async with AsyncBOAMPScraper(api_base=api_base, session=session, concurrency=concurrency) as scraper:
+                    return await scraper.scrape_search_results(SEARCH_URL, [], max_results=args.notices)
+            for concurrency in args.concurrency:
+                yield (f'AsyncBOAMPScraper[stub, concurrency={concurrency}]',
+                       lambda c=concurrency: asyncio.run(scrape_async(c)),
+                       max(2, args.iterations // 10), args.notices)
+
+        # Déploiement partagé : la même recherche lancée par 4 utilisateurs en même temps
+        def same_search_x4():
+            shared = BOAMPScraper(api_base=api_base, session=BOAMPSession(rate=args.rate))
+            with ThreadPoolExecutor(4) as users:
+                searches = [users.submit(shared.scrape_search_results, SEARCH_URL, [], max_results=args.notices,
+                                         workers=max(args.workers)) for _ in range(4)]
+                return [s.result() for s in searches]
+        yield (f'scrape_search_results[stub, 4 recherches identiques simultanées, workers={max(args.workers)}]',
+               same_search_x4, max(2, args.iterations // 10), 4 * args.notices)
+
+        # Plan (nhits + facettes) puis tranches de dates récupérées en parallèle
+        yield (f'scrape_search_results[stub, plan 4 tranches, workers={max(args.workers)}]',
+               lambda: online.scrape_search_results(
+                   SEARCH_URL, [], max_results=args.notices, workers=max(args.workers),
+                   plan=online.plan_search(SEARCH_URL, args.notices, shard_size=max(1, args.notices // 4))),
+               max(2, args.iterations // 10), args.notices)
+
+        # Index local : la recherche est récoltée une fois, chaque jeu de mots-clés est résolu hors-ligne
+        index = LotIndex(':memory:')
+        BOAMPScraper(api_base=api_base, session=BOAMPSession(rate=args.rate), index=index).harvest_search_results(
+            SEARCH_URL, max_results=args.notices, workers=max(args.workers))
+        yield (f'LotIndex.search[{len(index)} avis]',
+               lambda: index.search(KEYWORDS), args.iterations, args.notices)
+    finally:
+        online.close() # Processus de parsing (parse_workers) gardés entre les itérations
+        stub.stop()
+
+    # Recherche où aucun avis n'a de format structuré connu : tout passe par le fallback HTML
+    stub = StubAPI(n_records=args.notices, latency=args.latency, payloads=['{"AUTRE": {}}'],
+                   html=load_fixture('boamp_html')['fields']['html'])
+    api_base = stub.start()
+    try:
+        fallback = BOAMPScraper(api_base=api_base, session=BOAMPSession(rate=args.rate), flight=SingleFlight(ttl=0))
+        yield (f'scrape_search_results[stub, fallback HTML, workers={max(args.workers)}]',
+               lambda: fallback.scrape_search_results(SEARCH_URL, ["plomberie"], max_results=args.notices,
+                                                      workers=max(args.workers)),
+               max(2, args.iterations // 10), args.notices)
+    finally:
+        stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', default='', help="Ne lance que les scénarios contenant ce texte")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--notices', type=int, default=100, help="Taille de la recherche simulée")
+    parser.add_argument('--large-lots', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help="Latence du stub (s)")
+    parser.add_argument('--throttle-every', type=int, default=0, help="Le stub renvoie un 429 une requête sur N")
+    parser.add_argument('--rate', type=float, default=None, help="Limite req/s de la session")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--parse-workers', type=int, nargs='*', default=[2],
+                        help="Tailles du pool de processus de parsing à mesurer")
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[50],
+                        help="Appels en vol d'AsyncBOAMPScraper à mesurer (nécessite httpx)")
+    parser.add_argument('--json', help="Écrit aussi les résultats dans ce fichier")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'scénario':<48} {'débit/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'pic Ko':>9}")
+    for name, fn, iterations, units in scenarios(args):
+        if args.only not in name:
+            continue
+        r = measure(fn, iterations, units)
+        results[name] = r
+        print(f"{name:<48} {r['throughput']:>10.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['peak_kb']:>9.0f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Stub local de l'endpoint opendatasoft /api/records/1.0/search/ pour les benchmarks.
+
+- q=idweb:"XX-YYYYY"  -> l'avis demandé (dataset boamp, avec 'donnees')
+- q=... dateparution>="AAAA-MM-JJ" AND dateparution<"AAAA-MM-JJ"
+                      -> la liste paginée (rows/start) des avis publiés dans la fenêtre
+- /api/records/1.0/download/ -> tous les avis de la fenêtre en une seule liste JSON
+- dataset=boamp-html   -> l'avis HTML (champ 'html') si le stub en a un
+- q=... code_departement:("33" OR "24") (ou NOT ...) -> filtre par département
+- facet=dateparution / facet=code_departement -> facet_groups (année > mois > jour, départements)
+Les avis sont répartis à raison de per_day avis par jour, le plus récent aujourd'hui,
+et tour à tour dans les départements de `departements`.
+Une latence artificielle est ajoutée à chaque requête pour simuler le réseau ;
+throttle_every=N renvoie un 429 (avec Retry-After) une requête sur N ;
+fail(path, params) -> True simule une panne (500) sur les requêtes choisies.
+"""
+import json
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from synthetic import make_eforms_notice, make_search_record
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture(name):
+    """Enregistrement opendatasoft enregistré dans bench/fixtures/<name>.json"""
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json"), encoding='utf-8') as f:
+        return json.load(f)
+
+
+class StubAPI:
+    def __init__(self, n_records=200, latency=0.05, include_donnees=True, per_day=5, n_lots=3,
+                 throttle_every=0, retry_after='0.05', payloads=None, html=None,
+                 departements=('33', '24', '75', '69', '13'), fail=None):
+        self.latency = latency
+        self.fail = fail
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.include_donnees = include_donnees
+        self.html = html # Même avis HTML (dataset boamp-html) pour tous les avis, None = absent
+        # 'donnees' sérialisé une fois pour toutes (le stub ne doit pas peser sur la mesure)
+        payloads = payloads or [make_eforms_notice(n_lots=n_lots)]
+        self.payloads = [p if isinstance(p, str) else json.dumps(p) for p in payloads]
+        self.notices = []
+        self.donnees = {}
+        self.departements = {}
+        for i in range(n_records):
+            published = date.today() - timedelta(days=i // per_day)
+            idweb = f"{published:%y}-{i + 1:05d}"
+            self.notices.append((idweb, published.isoformat()))
+            self.donnees[idweb] = self.payloads[i % len(self.payloads)]
+            self.departements[idweb] = departements[i % len(departements)]
+        self.dates = dict(self.notices)
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def handle(self, path, params):
+        with self._lock:
+            self.request_count += 1
+            throttled = self.throttle_every and self.request_count % self.throttle_every == 0
+        time.sleep(self.latency)
+        if throttled:
+            return 429, {'error': 'Too many requests'}
+        if self.fail and self.fail(path, params):
+            return 500, {'error': 'Internal server error'}
+
+        search = path.startswith('/api/records/1.0/search')
+        download = path.startswith('/api/records/1.0/download')
+        if not (search or download):
+            return 404, {}
+
+        q = params.get('q', [''])[0]
+        dataset = params.get('dataset', ['boamp'])[0]
+        rows = int(params.get('rows', ['10' if search else '-1'])[0])
+        start = int(params.get('start', ['0'])[0])
+
+        exact = re.search(r'idweb:"([^"]+)"', q)
+        if exact:
+            idweb = exact.group(1)
+            if dataset == 'boamp-html' and self.html and idweb in self.dates:
+                fields = {'idweb': idweb, 'dateparution': self.dates[idweb], 'html': self.html}
+                return 200, {'nhits': 1, 'records': [{'datasetid': dataset, 'fields': fields}]}
+            if dataset != 'boamp' or idweb not in self.dates:
+                return 200, {'nhits': 0, 'records': []}
+            return 200, {'nhits': 1, 'records': [self.record(idweb, include_donnees=True)]}
+
+        since = re.search(r'dateparution>="([\d-]+)"', q)
+        until = re.search(r'dateparution<"([\d-]+)"', q)
+        departements = re.search(r'(NOT )?code_departement:\(([^)]*)\)', q)
+        codes = set(re.findall(r'"([^"]+)"', departements.group(2))) if departements else None
+        ids = [
+            idweb for idweb, published in self.notices
+            if (not since or published >= since.group(1)) and (not until or published < until.group(1))
+            and (codes is None or (self.departements[idweb] in codes) != bool(departements.group(1)))
+        ]
+        if download:
+            return 200, [self.record(i, self.include_donnees) for i in (ids if rows < 0 else ids[:rows])]
+        page = ids[start:start + rows]
+        payload = {'nhits': len(ids), 'records': [self.record(i, self.include_donnees) for i in page]}
+        if 'facet' in params:
+            payload['facet_groups'] = self.facet_groups(ids, params['facet'])
+        return 200, payload
+
+    def facet_groups(self, ids, names):
+        groups = []
+        if 'dateparution' in names:
+            tree = {}
+            for idweb in ids:
+                node = tree
+                for part in self.dates[idweb].split('-'):
+                    entry = node.setdefault(part, {'count': 0, 'children': {}})
+                    entry['count'] += 1
+                    node = entry['children']
+
+            def facets(node, prefix=''):
+                return [
+                    {'name': name, 'path': prefix + name, 'count': entry['count'], 'state': 'displayed',
+                     **({'facets': facets(entry['children'], prefix + name + '/')} if entry['children'] else {})}
+                    for name, entry in sorted(node.items(), reverse=True)
+                ]
+            groups.append({'name': 'dateparution', 'facets': facets(tree)})
+        if 'code_departement' in names:
+            counts = {}
+            for idweb in ids:
+                counts[self.departements[idweb]] = counts.get(self.departements[idweb], 0) + 1
+            groups.append({'name': 'code_departement', 'facets': [
+                {'name': code, 'path': code, 'count': count, 'state': 'displayed'}
+                for code, count in sorted(counts.items(), key=lambda item: -item[1])
+            ]})
+        return groups
+
+    def record(self, idweb, include_donnees):
+        return make_search_record(idweb, self.donnees[idweb], include_donnees, self.dates[idweb],
+                                  self.departements[idweb])
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True # Sinon ~40 ms d'ACK retardé par réponse en keep-alive
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                status, payload = api.handle(parsed.path, parse_qs(parsed.query))
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', api.retry_after)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 1024 # Clients async : des centaines de connexions ouvertes d'un coup
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,131 @@
+"""
+Générateurs d'avis BOAMP synthétiques (format 'donnees' de l'API opendatasoft).
+Utilisés par les benchmarks : aucune donnée réelle n'est nécessaire.
+"""
+import json
+
+LOT_SUBJECTS = [
+    "plomberie sanitaire",
+    "génie climatique CVC",
+    "électricité courants forts",
+    "menuiseries extérieures",
+    "peinture revêtements de sols",
+    "gros oeuvre maçonnerie",
+]
+
+
+def _text(value):
+    return {'#text': value}
+
+
+def make_eforms_notice(n_lots=3, tenders_per_lot=2, filler=0):
+    """
+    Construit un avis EFORMS (ContractAwardNotice) avec n_lots lots.
+    Chaque lot reçoit tenders_per_lot offres dont une seule gagnante (selec-w).
+    filler: nombre de critères (cac:TenderingTerms) ajoutés, que le parseur ne lit pas.
+    """
+    lots = []
+    organizations = []
+    lot_results = []
+    lot_tenders = []
+    tendering_parties = []
+
+    for i in range(1, n_lots + 1):
+        lot_id = f"LOT-{i:04d}"
+        subject = LOT_SUBJECTS[i % len(LOT_SUBJECTS)]
+        lots.append({
+            'cbc:ID': _text(lot_id),
+            'cac:ProcurementProject': {
+                'cbc:Name': _text(f"Lot {i} - {subject}"),
+                'cbc:Description': _text(f"Travaux de {subject} pour le bâtiment {i}"),
+            },
+        })
+
+        for j in range(tenders_per_lot):
+            n = (i - 1) * tenders_per_lot + j + 1
+            org_id, tpa_id, ten_id = f"ORG-{n:04d}", f"TPA-{n:04d}", f"TEN-{n:04d}"
+            organizations.append({
+                'efac:Company': {
+                    'cac:PartyIdentification': {'cbc:ID': _text(org_id)},
+                    'cac:PartyName': {'cbc:Name': _text(f"SARL ENTREPRISE {n}")},
+                    'cac:Contact': {
+                        'cbc:ElectronicMail': _text(f"contact{n}@exemple.fr"),
+                        'cbc:Telephone': _text(f"+33 5 56 00 {n % 100:02d} {n % 97:02d}"),
+                    },
+                    'cac:PostalAddress': {'cbc:CityName': _text("Bordeaux")},
+                }
+            })
+            tendering_parties.append({
+                'cbc:ID': _text(tpa_id),
+                'efac:Tenderer': {'cbc:ID': _text(org_id)},
+            })
+            lot_tenders.append({
+                'cbc:ID': _text(ten_id),
+                'efac:TenderingParty': {'cbc:ID': _text(tpa_id)},
+                'efac:TenderLot': {'cbc:ID': _text(lot_id)},
+            })
+            lot_results.append({
+                'cbc:TenderResultCode': _text('selec-w' if j == 0 else 'clos-nw'),
+                'efac:TenderLot': {'cbc:ID': _text(lot_id)},
+                'efac:LotTender': {'cbc:ID': _text(ten_id)},
+            })
+
+    extension = {
+        'efac:Organizations': {'efac:Organization': organizations},
+        'efac:NoticeResult': {
+            'efac:LotResult': lot_results,
+            'efac:LotTender': lot_tenders,
+        },
+        'efac:TenderingParty': tendering_parties,
+    }
+    notice = { # Ordre UBL : les extensions en tête
+        'ext:UBLExtensions': {
+            'ext:UBLExtension': {
+                'ext:ExtensionContent': {'efext:EformsExtension': extension}
+            }
+        },
+    }
+    if filler:
+        notice['cac:TenderingTerms'] = {'cac:AwardingTerms': {'cac:AwardingCriterion': [
+            {'cbc:Description': {'#text': f"Critère {k} : valeur technique de l'offre, délais d'exécution", '@languageID': 'FRA'}}
+            for k in range(filler)
+        ]}}
+    notice['cac:ProcurementProjectLot'] = lots
+    return {'EFORMS': {'ContractAwardNotice': notice}}
+
+
+def make_search_record(idweb, donnees=None, include_donnees=True, dateparution=None, code_departement=None):
+    """Enregistrement tel que renvoyé par /api/records/1.0/search/ (dataset boamp)"""
+    fields = {'idweb': idweb, 'dateparution': dateparution or f"20{idweb[:2]}-01-15"}
+    if code_departement:
+        fields['code_departement'] = code_departement
+    if include_donnees:
+        if donnees is None:
+            donnees = make_eforms_notice()
+        fields['donnees'] = donnees if isinstance(donnees, str) else json.dumps(donnees)
+    return {
+        'datasetid': 'boamp',
+        'recordid': idweb,
+        'fields': fields,
+        'record_timestamp': f"{fields['dateparution']}T08:00:00+00:00",
+    }
+
+
+def make_fnsimple_notice(n_lots=3, marches_per_lot=1, infructueux_every=0):
+    """
+    Construit un avis FNSimple : texte 'attributionMarche' de n_lots lots,
+    chacun attribué à marches_per_lot entreprises (accord-cadre multi-attributaires).
+    infructueux_every: un lot sur N est déclaré infructueux.
+    """
+    lines = []
+    for i in range(1, n_lots + 1):
+        lines.append(f"Lot N° {i} - {LOT_SUBJECTS[i % len(LOT_SUBJECTS)].capitalize()}")
+        if infructueux_every and i % infructueux_every == 0:
+            lines.append("Lot déclaré infructueux (aucune offre reçue)")
+            continue
+        for j in range(marches_per_lot):
+            n = (i - 1) * marches_per_lot + j + 1
+            lines.append(f"Marché n° : 2024-{i:04d}-{j + 1}")
+            lines.append(f"SARL ENTREPRISE {n % 500}, {n} rue du Port, 33000 Bordeaux")
+            lines.append(f"Montant HT : {1000 + n},00 euros")
+    return {'FNSimple': {'attribution': {'attributionMarche': "\n".join(lines) + "\n"}}}
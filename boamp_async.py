@@ -0,0 +1,394 @@
+"""
+Version asyncio du scraper, pour l'intégrer à un service async sans lui dédier de threads.
+
+Même traduction des URL, mêmes fenêtres de recherche, même parsing (celui de BOAMPScraper)
+et donc mêmes résultats ; seul le réseau change : un client httpx partagé (keep-alive, HTTP/2
+si le paquet h2 est installé) et un sémaphore qui borne les appels en vol.
+
+    async with AsyncBOAMPScraper(concurrency=200) as scraper:
+        entreprises = await scraper.scrape_search_results(url, ["plomberie"], max_results=5000)
+
+Nécessite httpx (pip install httpx, ou pip install 'httpx[http2]' pour HTTP/2).
+"""
+import asyncio
+import itertools
+import logging
+import math
+import random
+import re
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+import boamp_json
+from boamp_http import RETRY_STATUSES, EndpointStats, parse_retry_after
+from boamp_keywords import KeywordMatcher
+from boamp_results import merge_awards
+from boamp_scraper import API_BASE, HTML_LABEL_RE, BOAMPScraper, _fields_size, _params_key
+
+try:
+    import httpx
+except ImportError: # Optionnel : seulement pour AsyncBOAMPScraper
+    httpx = None
+
+try:
+    import h2 # noqa: F401 (HTTP/2 de httpx)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+log = logging.getLogger("boamp_scraper.async")
+
+DEFAULT_CONCURRENCY = 50
+# Connexions par client httpx : le pool de httpcore (1.0) réexamine toutes ses connexions
+# à chaque requête ; au-delà de quelques dizaines, ce travail CPU dépasse l'attente réseau.
+CONNECTIONS_PER_CLIENT = 8
+
+
+class AsyncTokenBucket:
+    """Limiteur de débit (seau à jetons) partagé par les tâches d'une boucle asyncio"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock: # Les tâches en attente sont servies dans l'ordre
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncBOAMPSession:
+    """
+    Équivalent async de boamp_http.BOAMPSession sur un httpx.AsyncClient : limitation de débit,
+    retries avec backoff exponentiel + jitter (429/5xx/timeouts, Retry-After respecté),
+    connexions persistantes (keep-alive, HTTP/2 si disponible) et métriques par endpoint.
+    Les max_connections sont réparties entre plusieurs clients httpx (voir CONNECTIONS_PER_CLIENT),
+    utilisés à tour de rôle.
+    """
+
+    def __init__(self, rate=10.0, burst=20, max_retries=4, backoff=0.5, max_backoff=30.0, max_connections=100,
+                 http2=None):
+        if httpx is None:
+            raise ImportError("AsyncBOAMPScraper nécessite httpx (pip install httpx)")
+        self.limiter = AsyncTokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        per_client = min(max_connections, CONNECTIONS_PER_CLIENT)
+        self.clients = [
+            httpx.AsyncClient(
+                http2=HTTP2 if http2 is None else http2,
+                limits=httpx.Limits(max_connections=per_client, max_keepalive_connections=per_client),
+            )
+            for _ in range(math.ceil(max_connections / per_client))
+        ]
+        self._next_client = itertools.cycle(self.clients)
+        self.headers = httpx.Headers() # Envoyés avec chaque requête (User-Agent du scraper)
+        self.stats = defaultdict(EndpointStats)
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _record(self, endpoint, **counts):
+        # Une seule boucle : pas de verrou nécessaire
+        stats = self.stats[endpoint]
+        for name, value in counts.items():
+            setattr(stats, name, getattr(stats, name) + value)
+
+    async def get(self, url, params=None, timeout=15):
+        parsed = urlparse(url)
+        endpoint = f"{parsed.netloc}{parsed.path}"
+
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                await self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                resp = await next(self._next_client).get(url, params=params, headers=self.headers, timeout=timeout)
+            except (httpx.TimeoutException, httpx.TransportError):
+                self._record(endpoint, requests=1, errors=1, seconds=time.perf_counter() - start)
+                if attempt == self.max_retries:
+                    raise
+                self._record(endpoint, retries=1)
+                await asyncio.sleep(self._delay(attempt))
+                continue
+
+            self._record(endpoint, requests=1, seconds=time.perf_counter() - start, bytes=len(resp.content))
+            self.stats[endpoint].statuses[resp.status_code] += 1
+
+            if resp.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._record(endpoint, retries=1)
+                await asyncio.sleep(self._delay(attempt, parse_retry_after(resp.headers.get('Retry-After'))))
+                continue
+            if resp.status_code >= 400:
+                self._record(endpoint, errors=1)
+            return resp
+
+    def metrics(self):
+        """Métriques par endpoint : {endpoint: {requests, retries, errors, bytes, seconds, statuses}}"""
+        return {endpoint: stats.to_dict() for endpoint, stats in self.stats.items()}
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+
+class AsyncBOAMPScraper:
+    """
+    scrape_page, scrape_search_results et le fallback HTML en coroutines.
+    Le parsing (décodage de 'donnees', EFORMS, FNSimple, HTML) est celui de BOAMPScraper ;
+    lui et les accès SQLite (cache, index) passent par asyncio.to_thread pour ne pas bloquer
+    la boucle (cache, index et métriques sont protégés par verrou).
+    concurrency: nb max d'appels à l'API en vol (self.semaphore).
+    flight: boamp_cache.SingleFlight (voir BOAMPScraper), appels identiques en vol fusionnés.
+    """
+
+    def __init__(self, api_base=API_BASE, cache=None, use_cache=True, session=None, metrics=None,
+                 json_projection=True, index=None, concurrency=DEFAULT_CONCURRENCY, flight=None):
+        self.session = session or AsyncBOAMPSession(max_connections=concurrency)
+        # Traduction des URL, parsing, cache, index et métriques du scraper synchrone ;
+        # il ne fait lui-même aucun appel réseau
+        self.parser = BOAMPScraper(api_base, cache, use_cache, self.session, metrics, json_projection, index,
+                                   flight=flight)
+        self.flight = self.parser.flight
+        self.metrics = self.parser.metrics
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.session.aclose()
+
+    async def fetch_notice_fields(self, boamp_id, dataset='boamp'):
+        """Voir BOAMPScraper.fetch_notice_fields (même cache, {} si absent, None si erreur HTTP)"""
+        return await self.flight.acall(('notice', dataset, boamp_id), lambda: self._fetch_notice_fields(boamp_id, dataset))
+
+    async def _fetch_notice_fields(self, boamp_id, dataset):
+        parser = self.parser
+        cache = parser.cache if parser.use_cache else None
+        if cache is not None:
+            fields = await asyncio.to_thread(cache.get, dataset, boamp_id)
+            if fields is not None:
+                self.metrics.incr('cache_hits')
+                return fields, _fields_size(fields)
+            self.metrics.incr('cache_misses')
+
+        api_url = f"{parser.api_search_url}?q=idweb:%22{boamp_id}%22&rows=1&dataset={dataset}&timezone=Europe%2FBerlin&lang=fr"
+        async with self.semaphore:
+            with self.metrics.timer('notice_api'):
+                resp = await self.session.get(api_url, timeout=10)
+        if resp.status_code != 200:
+            log.warning("Erreur API avis %s (%s): %s", boamp_id, dataset, resp.status_code)
+            return None, None
+
+        data = await asyncio.to_thread(boamp_json.loads, resp.content)
+        fields = data['records'][0]['fields'] if data.get('records') else {}
+        if cache is not None:
+            await asyncio.to_thread(cache.put, dataset, boamp_id, fields)
+        return fields, len(resp.content)
+
+    async def scrape_page(self, url, keywords):
+        """Voir BOAMPScraper.scrape_page : données structurées de l'avis, sinon fallback HTML"""
+        parser = self.parser
+        keywords = KeywordMatcher.of(keywords)
+        fields = None
+
+        boamp_id_match = re.search(r'(\d{2}-\d{3,})', url)
+        if boamp_id_match:
+            boamp_id = boamp_id_match.group(1)
+            try:
+                fields = await self.fetch_notice_fields(boamp_id, 'boamp')
+                if fields:
+                    decoded, awards = await asyncio.to_thread(parser._structured_awards, boamp_id, fields, url)
+                    if decoded and awards is not None:
+                        # Format structuré lu : sans lot retenu, la réponse est vide (pas de fallback HTML)
+                        results = merge_awards(awards, keywords)
+                        for r in results: r['avis_id'] = boamp_id
+                        return results
+            except Exception as e:
+                log.warning("Erreur API Structurée: %s", e)
+
+        log.info("Passage en mode scraping textuel (moins précis) : %s", url)
+        boamp_id = boamp_id_match.group(1) if boamp_id_match else None
+        awards = await self._html_fallback_awards(url, boamp_id)
+        await asyncio.to_thread(parser._index_notice, boamp_id, fields or {}, url, awards)
+        return merge_awards(awards, keywords)
+
+    async def scrape_html_fallback(self, url, boamp_id, keywords):
+        """Voir BOAMPScraper.scrape_html_fallback (avis HTML du dataset boamp-html)"""
+        return merge_awards(await self._html_fallback_awards(url, boamp_id), keywords)
+
+    async def _html_fallback_awards(self, url, boamp_id):
+        self.metrics.incr('strategy_fallback')
+        if not boamp_id:
+            self.metrics.incr('html_fallback_skipped')
+            return []
+        try:
+            html_content = (await self.fetch_notice_fields(boamp_id, 'boamp-html') or {}).get('html')
+        except Exception as e:
+            log.warning("Erreur API avis HTML %s: %s", boamp_id, e)
+            html_content = None
+
+        if not html_content or not HTML_LABEL_RE.search(html_content):
+            self.metrics.incr('html_fallback_skipped')
+            return []
+
+        with self.metrics.timer('html_fallback'):
+            return await asyncio.to_thread(self.parser._html_awards, html_content, url)
+
+    async def scrape_search_record(self, record, keywords):
+        """Voir BOAMPScraper.scrape_search_record ('donnees' de la recherche, sinon appel unitaire)"""
+        parser = self.parser
+        fields = record.get('fields', {})
+        idweb = fields.get('idweb')
+        notice_url = f"https://www.boamp.fr/pages/avis/?q=idweb:%22{idweb}%22"
+
+        decoded, awards = await asyncio.to_thread(parser._structured_awards, idweb, fields, notice_url)
+        if not decoded:
+            return await self.scrape_page(notice_url, keywords)
+
+        if parser.cache is not None and parser.use_cache:
+            await asyncio.to_thread(parser.cache.put, 'boamp', idweb, fields)
+
+        if awards is None:
+            log.info("Passage en mode scraping textuel (moins précis) : %s", idweb)
+            awards = await self._html_fallback_awards(notice_url, idweb)
+            await asyncio.to_thread(parser._index_notice, idweb, fields, notice_url, awards)
+
+        results = merge_awards(awards, keywords)
+        for r in results: r['avis_id'] = idweb
+        return results
+
+    async def _scrape_record_safe(self, record, keywords):
+        try:
+            return await self.scrape_search_record(record, keywords)
+        except Exception as e:
+            log.warning("Erreur sur l'avis %s: %s", record['fields'].get('idweb'), e)
+            self.metrics.incr('notice_errors')
+            return []
+
+    async def _search_api(self, params, bulk=False):
+        """Voir BOAMPScraper._search_api"""
+        return await self.flight.acall(('search', bulk, _params_key(params)), lambda: self._search_api_call(params, bulk))
+
+    async def _search_api_call(self, params, bulk):
+        parser = self.parser
+        url = parser.api_download_url if bulk else parser.api_search_url
+        async with self.semaphore:
+            with self.metrics.timer('search_download' if bulk else 'search_api'):
+                resp = await self.session.get(url, params=params, timeout=120 if bulk else 15)
+        if resp.status_code != 200:
+            log.error("Erreur API Recherche: %s", resp.status_code)
+            return None, None
+        return await asyncio.to_thread(boamp_json.loads, resp.content), len(resp.content)
+
+    async def count_hits(self, api_params):
+        data = await self._search_api({**api_params, 'rows': 0, 'start': 0})
+        return data.get('nhits', 0) if data else None
+
+    async def iter_search_records(self, api_params, limit=50, bulk=False, page_size=100, window_days=31,
+                                  since=None, until=None):
+        """Voir BOAMPScraper.iter_search_records (mêmes fenêtres adaptatives, mêmes appels)"""
+        walk = self.parser._search_windows(api_params, limit, bulk, page_size, window_days, since, until)
+        try:
+            step = next(walk)
+            while True:
+                if step[0] == 'records':
+                    yield step[1]
+                    step = walk.send(None)
+                else:
+                    step = walk.send(await self._search_api(step[1], bulk=step[2]))
+        except StopIteration:
+            pass
+
+    async def iter_search_notices(self, search_url, keywords, max_results=50, progress_callback=None,
+                                  bulk=False, since=None, skip_record=None):
+        """
+        Voir BOAMPScraper.iter_search_notices : rend (enregistrement, entreprises) dans l'ordre
+        de l'API. Les avis sont traités en tâches concurrentes, toutes pages confondues
+        (au plus 2 x concurrency avis en cours ; le sémaphore borne les appels réseau).
+        Une recherche interrompue (SearchIncomplete, erreur réseau) relève son erreur.
+        """
+        seen_notices = set()
+        keywords = KeywordMatcher.of(keywords)
+        api_params = self.parser.build_search_params(search_url)
+        processed_count = 0
+        window = self.concurrency * 2
+        pending = deque()
+
+        log.info("Recherche Target: %s avis", max_results)
+
+        async def finished():
+            nonlocal processed_count
+            record, task = pending.popleft()
+            page_results = await task
+            idweb = record['fields']['idweb']
+            processed_count += 1
+            self.metrics.incr('notices')
+            if progress_callback:
+                progress_callback(processed_count, max_results, f"Traitement de l'avis {idweb}...")
+            for r in page_results:
+                r['source_avis_id'] = idweb
+            return record, page_results
+
+        failure = None
+        try:
+            try:
+                async for records in self.iter_search_records(api_params, limit=max_results, bulk=bulk, since=since):
+                    for record in records:
+                        if processed_count + len(pending) >= max_results: break
+                        idweb = record['fields'].get('idweb')
+                        if not idweb or idweb in seen_notices: continue
+                        seen_notices.add(idweb)
+                        if skip_record and skip_record(record):
+                            processed_count += 1
+                            continue
+                        pending.append((record, asyncio.ensure_future(self._scrape_record_safe(record, keywords))))
+                        if len(pending) >= window:
+                            yield await finished()
+                    if processed_count + len(pending) >= max_results: break
+            except Exception as e:
+                # Les avis déjà listés sont rendus avant de relever l'erreur (comme en synchrone)
+                log.error("Erreur Globale Recherche: %s", e)
+                failure = e
+            while pending:
+                yield await finished()
+            if failure is not None:
+                raise failure
+        finally:
+            # Aussi exécuté si le consommateur abandonne le générateur (aclose)
+            for _, task in pending:
+                task.cancel()
+            await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+
+    async def iter_search_results(self, search_url, keywords, max_results=50, progress_callback=None,
+                                  skip_notices=None, bulk=False):
+        """Entreprises au fil de l'eau (voir BOAMPScraper.iter_search_results)"""
+        skip_notices = set(skip_notices or ())
+        notices = self.iter_search_notices(search_url, keywords, max_results, progress_callback, bulk=bulk,
+                                           skip_record=lambda record: record['fields']['idweb'] in skip_notices)
+        async for _, page_results in notices:
+            for r in page_results:
+                yield r
+
+    async def scrape_search_results(self, search_url, keywords, max_results=50, progress_callback=None, bulk=False):
+        """Voir BOAMPScraper.scrape_search_results (mêmes résultats, dans le même ordre)"""
+        return [r async for r in self.iter_search_results(search_url, keywords, max_results, progress_callback,
+                                                           bulk=bulk)]
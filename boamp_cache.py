@@ -0,0 +1,283 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+
+log = logging.getLogger("boamp_scraper.cache")
+
+DEFAULT_CACHE_PATH = os.path.join('.boamp_cache', 'notices.sqlite')
+
+# Résultat négatif ({} : avis absent de l'API ou sans 'donnees'), reconnu à son payload
+_NEGATIVE_PAYLOAD = zlib.compress(b'{}')
+
+
+class NoticeCache:
+    """
+    Cache disque (SQLite) des enregistrements opendatasoft, clé = (dataset, idweb).
+    Les avis publiés ne changent quasiment plus : on garde le JSON 'fields'
+    compressé, avec expiration (TTL) et éviction LRU par nombre d'entrées / taille.
+    Les résultats négatifs ({}) expirent après negative_ttl : un avis pas encore
+    indexé par l'API (ou sans 'donnees') est redemandé dans la journée.
+    Best-effort : le fichier est partagé avec les workers (boamp_jobs), une erreur SQLite
+    (base verrouillée...) est journalisée et traitée comme un défaut de cache.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=30 * 24 * 3600, max_entries=50000,
+                 max_bytes=500 * 1024 * 1024, negative_ttl=6 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS notices (
+                dataset TEXT NOT NULL,
+                idweb TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (dataset, idweb)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_notices_accessed ON notices (accessed_at)")
+        self._conn.commit()
+
+    def get(self, dataset, idweb):
+        """Retourne les 'fields' en cache ({} = avis absent de l'API) ou None si inconnu/expiré"""
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT payload, created_at FROM notices WHERE dataset = ? AND idweb = ?",
+                    (dataset, idweb)
+                ).fetchone()
+                ttl = self.negative_ttl if row is not None and row[0] == _NEGATIVE_PAYLOAD else self.ttl
+                if row is None or (ttl and now - row[1] > ttl):
+                    self.misses += 1
+                    return None
+                self._conn.execute(
+                    "UPDATE notices SET accessed_at = ? WHERE dataset = ? AND idweb = ?",
+                    (now, dataset, idweb)
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self._failed('lecture', dataset, idweb, e)
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, dataset, idweb, fields):
+        payload = _NEGATIVE_PAYLOAD if not fields else zlib.compress(json.dumps(fields).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO notices VALUES (?, ?, ?, ?, ?, ?)",
+                    (dataset, idweb, payload, len(payload), now, now)
+                )
+                self._conn.commit()
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    self._evict(now)
+            except sqlite3.Error as e:
+                self._failed('écriture', dataset, idweb, e)
+
+    def _failed(self, operation, dataset, idweb, error):
+        """Erreur SQLite (appelé sous verrou) : journalisée, transaction annulée, l'avis reste servi"""
+        log.warning("Cache avis indisponible (%s %s/%s): %s", operation, dataset, idweb, error)
+        try:
+            self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, now):
+        """Supprime les entrées expirées puis les moins récemment utilisées au-delà des bornes"""
+        if self.ttl:
+            self._conn.execute("DELETE FROM notices WHERE created_at < ?", (now - self.ttl,))
+        if self.negative_ttl:
+            self._conn.execute("DELETE FROM notices WHERE payload = ? AND created_at < ?",
+                               (_NEGATIVE_PAYLOAD, now - self.negative_ttl))
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM notices").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM notices WHERE rowid IN (SELECT rowid FROM notices ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM notices").fetchone()
+
+        if total > self.max_bytes:
+            # On retire les plus anciens accès jusqu'à repasser sous la taille max
+            excess = total - self.max_bytes
+            freed = 0
+            stale = []
+            for rowid, size in self._conn.execute("SELECT rowid, size FROM notices ORDER BY accessed_at"):
+                stale.append((rowid,))
+                freed += size
+                if freed >= excess:
+                    break
+            self._conn.executemany("DELETE FROM notices WHERE rowid = ?", stale)
+        self._conn.commit()
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM notices")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM notices").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': count, 'bytes': total}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _consume_exception(task):
+    """Pas d'avertissement "exception was never retrieved" si tous les appelants sont partis"""
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """
+    Appels identiques simultanés fusionnés (single-flight) et résultats récents gardés en mémoire.
+    Le premier appelant d'une clé exécute l'appel ; ceux qui arrivent pendant ce temps l'attendent
+    et reçoivent le même résultat (ou la même exception). Le résultat est ensuite servi depuis la
+    mémoire pendant ttl secondes, avec éviction LRU par nombre d'entrées / taille (ttl=0 : fusion
+    des appels simultanés seulement). Les résultats sont partagés : ne pas les modifier.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=32 * 1024 * 1024, ttl=60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes # Taille estimée (octets de la réponse HTTP)
+        self.ttl = ttl
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._entries = OrderedDict() # Clé -> (valeur, taille, expiration)
+        self._bytes = 0
+        self._inflight = {}           # Clé -> Future (threads)
+        self._async_inflight = {}     # Clé -> asyncio.Task (AsyncBOAMPScraper)
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        """(True, valeur) si la clé est en mémoire et pas expirée ; appelé sous self._lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[2] <= now:
+            self._drop(key)
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[0]
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _store(self, key, value, size):
+        """Mémorise un résultat ; une entrée trop grosse (export complet) n'évince pas tout le reste"""
+        if not self.ttl or size is None or size > self.max_bytes // 4:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def call(self, key, fn):
+        """
+        Résultat de fn() pour cette clé, partagé avec les appels simultanés et récents.
+        fn rend (valeur, taille en octets) ; taille None : valeur partagée avec les appels
+        en cours mais pas mémorisée (ex: erreur HTTP, à retenter au prochain appel).
+        """
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                return value
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        
+        try:
+            value, size = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            self._store(key, value, size)
+        future.set_result(value)
+        return value
+
+    async def acall(self, key, fn):
+        """call() pour une coroutine : fn est une fonction async rendant (valeur, taille)"""
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                return value
+            task = self._async_inflight.get(key)
+            if task is None:
+                task = self._async_inflight[key] = asyncio.ensure_future(self._arun(key, fn))
+                task.add_done_callback(_consume_exception)
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        # L'appel partagé est une tâche à part : annuler un appelant (client déconnecté)
+        # n'annule ni l'appel ni les autres appelants qui l'attendent
+        return await asyncio.shield(task)
+
+    async def _arun(self, key, fn):
+        try:
+            value, size = await fn()
+        except BaseException:
+            with self._lock:
+                del self._async_inflight[key]
+            raise
+        with self._lock:
+            del self._async_inflight[key]
+            self._store(key, value, size)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'coalesced': self.coalesced, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self._bytes}
@@ -0,0 +1,251 @@
+import csv
+import gzip
+import json
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Optionnel : seulement pour l'export Parquet
+    pa = None
+    pq = None
+
+# Schéma fixe de l'export (les clés absentes d'une ligne restent vides)
+EXPORT_FIELDS = [
+    'avis_id',
+    'nom',
+    'lot_title',
+    'email',
+    'telephone',
+    'ville',
+    'url_source',
+    'mots_cles_matches',
+]
+
+
+def export_row(entreprise, fields=EXPORT_FIELDS):
+    """Projette un résultat du scraper sur le schéma d'export"""
+    row = {f: str(entreprise.get(f) or '') for f in fields} # nb_avis (fusion) : colonnes texte
+    if 'avis_id' in row and not row['avis_id']:
+        row['avis_id'] = entreprise.get('source_avis_id') or ''
+    return row
+
+
+def _open_text(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _open_binary(path, mode='rb'):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+class ExportSink:
+    """
+    Destination d'export écrite au fil de l'extraction.
+    Avec resume=True, un fichier existant est complété : les avis déjà
+    présents (done_notices) peuvent être sautés par le scraper.
+    """
+
+    def __init__(self, path, fields=EXPORT_FIELDS, resume=False):
+        self.path = path
+        self.fields = list(fields)
+        self.count = 0
+        self.done_notices = set()
+        if resume and os.path.exists(path):
+            for row in self._read_existing():
+                self.done_notices.add(row.get('avis_id'))
+                self.count += 1
+        self._open(append=bool(resume and self.count))
+
+    def _read_existing(self):
+        raise NotImplementedError
+
+    def _open(self, append):
+        raise NotImplementedError
+
+    def write_rows(self, entreprises):
+        """Écrit les entreprises d'un avis (un avis complet par appel, pour la reprise)"""
+        rows = [export_row(e, self.fields) for e in entreprises]
+        if rows:
+            self._write(rows)
+            self.count += len(rows)
+            self.done_notices.update(r.get('avis_id') for r in rows)
+
+    def write(self, entreprise):
+        self.write_rows([entreprise])
+
+    def _write(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _TextSink(ExportSink):
+    """
+    Export texte (CSV, JSON Lines, éventuellement .gz) complété en mode ajout.
+    Un run interrompu peut laisser une dernière ligne incomplète (ou un .gz tronqué) : en
+    reprise, le fichier est ramené à la fin de l'avant-dernier avis, et le dernier avis,
+    peut-être incomplet, n'est pas compté dans done_notices (il sera retraité).
+    """
+
+    def _read_existing(self):
+        pending, pending_start, end = [], 0, 0 # Lignes du dernier avis lu, et où il commence
+        try:
+            with _open_binary(self.path) as f:
+                for row, row_end in self._parse(f):
+                    if row is None: # En-tête CSV
+                        pending_start = end = row_end
+                        continue
+                    if pending and row.get('avis_id') != pending[0].get('avis_id'):
+                        yield from pending
+                        pending, pending_start = [], end
+                    pending.append(row)
+                    end = row_end
+        except (EOFError, OSError, ValueError, csv.Error):
+            self._truncate(pending_start)
+            return
+        yield from pending
+
+    def _parse(self, f):
+        """(ligne ou None pour l'en-tête, position de fin) ; ValueError sur une ligne incomplète"""
+        raise NotImplementedError
+
+    def _truncate(self, size):
+        """Ramène le fichier à ses `size` premiers octets (décompressés pour un .gz)"""
+        if not self.path.endswith('.gz'):
+            with open(self.path, 'r+b') as f:
+                f.truncate(size)
+            return
+        # Un .gz ne se tronque pas : le début valide est recopié dans un nouveau fichier
+        with gzip.open(self.path, 'rb') as f:
+            head = f.read(size)
+        with gzip.open(self.path + '.tmp', 'wb') as f:
+            f.write(head)
+        os.replace(self.path + '.tmp', self.path)
+
+
+class CSVSink(_TextSink):
+    def _parse(self, f):
+        position = 0
+        complete = True
+        
+        def lines():
+            nonlocal position, complete
+            for raw in f:
+                position += len(raw)
+                complete = raw.endswith(b'\n')
+                yield raw.decode('utf-8')
+        
+        header = None
+        for values in csv.reader(lines(), strict=True):
+            if not complete:
+                raise ValueError("Dernière ligne incomplète")
+            if header is None:
+                header = values
+                yield None, position
+            else:
+                yield dict(zip(header, values)), position
+
+    def _open(self, append):
+        self._file = _open_text(self.path, 'a' if append else 'w')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fields, extrasaction='ignore')
+        if not append:
+            self._writer.writeheader()
+
+    def _write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JSONLSink(_TextSink):
+    def _parse(self, f):
+        position = 0
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                raise ValueError("Dernière ligne incomplète")
+            position += len(raw)
+            yield json.loads(raw), position
+
+    def _open(self, append):
+        self._file = _open_text(self.path, 'a' if append else 'w')
+
+    def _write(self, rows):
+        self._file.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in rows))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink(ExportSink):
+    """
+    Export colonnaire (pyarrow), compressé en zstd, écrit par groupes de lignes.
+    Un fichier Parquet ne se complète pas : en reprise, les groupes existants
+    sont recopiés dans un nouveau fichier avant de continuer.
+    """
+
+    def __init__(self, path, fields=EXPORT_FIELDS, resume=False, row_group_size=10000):
+        if pa is None:
+            raise ImportError("L'export Parquet nécessite pyarrow (pip install pyarrow)")
+        self.row_group_size = row_group_size
+        self._buffer = []
+        self._schema = pa.schema([(f, pa.string()) for f in fields])
+        super().__init__(path, fields, resume)
+
+    def _read_existing(self):
+        try:
+            table = pq.read_table(self.path, columns=['avis_id'])
+        except (pa.ArrowInvalid, OSError):
+            return # Fichier interrompu avant l'écriture du footer : on repart de zéro
+        for avis_id in table.column('avis_id').to_pylist():
+            yield {'avis_id': avis_id}
+
+    def _open(self, append):
+        previous = None
+        if append:
+            previous = self.path + '.prev'
+            os.replace(self.path, previous)
+        self._writer = pq.ParquetWriter(self.path, self._schema, compression='zstd')
+        if previous:
+            source = pq.ParquetFile(previous)
+            for i in range(source.num_row_groups):
+                self._writer.write_table(source.read_row_group(i, columns=self.fields))
+            os.remove(previous)
+
+    def _write(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._writer.write_table(pa.Table.from_pylist(self._buffer, schema=self._schema))
+            self._buffer = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_sink(path, resume=False, fields=EXPORT_FIELDS):
+    """Choisit le format d'après l'extension : .csv, .jsonl, .parquet (+ .gz pour csv/jsonl)"""
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return CSVSink(path, fields, resume)
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return JSONLSink(path, fields, resume)
+    if name.endswith('.parquet'):
+        return ParquetSink(path, fields, resume)
+    raise ValueError(f"Format d'export non supporté : {path}")
@@ -0,0 +1,147 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Codes pour lesquels on retente (throttling opendatasoft + erreurs serveur)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Limiteur de débit (seau à jetons) partagé entre threads : rate req/s, rafales de burst"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EndpointStats:
+    """Compteurs d'un endpoint (host + chemin)"""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.statuses = defaultdict(int)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'seconds': round(self.seconds, 3),
+            'statuses': dict(self.statuses),
+        }
+
+
+def parse_retry_after(value):
+    """Retry-After en secondes ou en date HTTP -> délai en secondes (None si illisible)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class BOAMPSession(requests.Session):
+    """
+    Session HTTP du scraper : limitation de débit, retries avec backoff exponentiel
+    + jitter (429/5xx/timeouts, Retry-After respecté), pool de connexions dimensionné
+    et métriques par endpoint.
+    """
+
+    def __init__(self, rate=10.0, burst=20, max_retries=4, backoff=0.5, max_backoff=30.0, pool_size=10):
+        super().__init__()
+        self.limiter = TokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = defaultdict(EndpointStats)
+        self._stats_lock = threading.Lock()
+        self.pool_size = 0
+        self.set_pool_size(pool_size)
+
+    def set_pool_size(self, pool_size):
+        """Dimensionne le pool de connexions (au moins un slot par worker)"""
+        if pool_size <= self.pool_size:
+            return
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.pool_size = pool_size
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        # Backoff exponentiel avec "full jitter"
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _record(self, endpoint, **counts):
+        with self._stats_lock:
+            stats = self.stats[endpoint]
+            for name, value in counts.items():
+                setattr(stats, name, getattr(stats, name) + value)
+
+    def request(self, method, url, *args, **kwargs):
+        parsed = urlparse(url)
+        endpoint = f"{parsed.netloc}{parsed.path}"
+
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                resp = super().request(method, url, *args, **kwargs)
+            except (requests.Timeout, requests.ConnectionError):
+                self._record(endpoint, requests=1, errors=1, seconds=time.perf_counter() - start)
+                if attempt == self.max_retries:
+                    raise
+                self._record(endpoint, retries=1)
+                time.sleep(self._delay(attempt))
+                continue
+
+            self._record(endpoint, requests=1, seconds=time.perf_counter() - start,
+                         bytes=len(resp.content))
+            with self._stats_lock:
+                self.stats[endpoint].statuses[resp.status_code] += 1
+
+            if resp.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._record(endpoint, retries=1)
+                time.sleep(self._delay(attempt, parse_retry_after(resp.headers.get('Retry-After'))))
+                continue
+            if resp.status_code >= 400:
+                self._record(endpoint, errors=1)
+            return resp
+
+    def metrics(self):
+        """Métriques par endpoint : {endpoint: {requests, retries, errors, bytes, seconds, statuses}}"""
+        with self._stats_lock:
+            return {endpoint: stats.to_dict() for endpoint, stats in self.stats.items()}
@@ -0,0 +1,182 @@
+"""
+Index local (SQLite FTS5) des lots attribués des avis déjà récoltés.
+
+Chaque avis parsé par un BOAMPScraper(index=LotIndex()) y est enregistré tous lots confondus
+(titre, texte, attributaires), sans filtre de mots-clés : un nouveau jeu de mots-clés est
+ensuite résolu hors-ligne, sans re-télécharger ni re-parser les avis.
+
+    index = LotIndex()
+    scraper = BOAMPScraper(index=index)
+    scraper.harvest_search_results(url, max_results=20000, workers=8)
+    index.search(["plomberie", "CVC"], departement="33")
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from itertools import groupby
+
+from boamp_keywords import KeywordMatcher, fold
+from boamp_results import Company, Lot, merge_awards
+
+DEFAULT_INDEX_PATH = os.path.join('.boamp_cache', 'lots.sqlite')
+
+# Le tokenizer trigram indexe toutes les sous-chaînes de 3 caractères : même sémantique
+# « sous-chaîne » que KeywordMatcher, mais seulement pour les mots-clés de 3 caractères et plus.
+FTS_MIN_KEYWORD = 3
+
+
+def _departements(value):
+    """code_departement opendatasoft (liste ou texte) -> ",33,24," (filtre par LIKE)"""
+    if not value:
+        return ''
+    if isinstance(value, str):
+        value = value.replace(';', ',').split(',')
+    codes = [str(v).strip() for v in value if str(v).strip()]
+    return f",{','.join(codes)}," if codes else ''
+
+
+class LotIndex:
+    """
+    Avis (date, départements), lots (titre, textes, attributaires) et index plein texte
+    des lots (textes repliés : minuscules, sans accents). Partageable entre threads et processus (WAL).
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS notices (
+                idweb TEXT PRIMARY KEY,
+                dateparution TEXT,
+                departements TEXT NOT NULL DEFAULT '',
+                url_source TEXT,
+                indexed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_notices_date ON notices (dateparution);
+            CREATE TABLE IF NOT EXISTS lots (
+                lot_id INTEGER PRIMARY KEY,
+                idweb TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                lot_title TEXT,
+                texts TEXT NOT NULL,
+                winners TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_lots_idweb ON lots (idweb, position);
+        """)
+        try:
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS lots_fts USING fts5(text, tokenize='trigram')")
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite sans FTS5 / trigram (< 3.34) : recherche par parcours des lots
+            self.fts = False
+
+    def add_notice(self, idweb, awards, url_source=None, dateparution=None, departements=None):
+        """
+        Enregistre (ou remplace) les attributions d'un avis.
+        awards: [boamp_results.Lot], voir BOAMPScraper._parse_awards.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(idweb)
+                self._conn.execute(
+                    "INSERT INTO notices VALUES (?, ?, ?, ?, ?)",
+                    (idweb, (dateparution or '')[:10] or None, _departements(departements), url_source, time.time())
+                )
+                for position, lot in enumerate(awards):
+                    lot_id = self._conn.execute(
+                        "INSERT INTO lots (idweb, position, lot_title, texts, winners) VALUES (?, ?, ?, ?, ?)",
+                        (idweb, position, lot.title, json.dumps(list(lot.texts), ensure_ascii=False),
+                         json.dumps([w.to_dict() for w in lot.winners], ensure_ascii=False))
+                    ).lastrowid
+                    if self.fts:
+                        self._conn.execute("INSERT INTO lots_fts (rowid, text) VALUES (?, ?)",
+                                           (lot_id, fold("\n".join(t for t in lot.texts if t))))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _delete(self, idweb):
+        if self.fts:
+            self._conn.execute("DELETE FROM lots_fts WHERE rowid IN (SELECT lot_id FROM lots WHERE idweb = ?)", (idweb,))
+        self._conn.execute("DELETE FROM lots WHERE idweb = ?", (idweb,))
+        self._conn.execute("DELETE FROM notices WHERE idweb = ?", (idweb,))
+
+    def has_notice(self, idweb):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM notices WHERE idweb = ?", (idweb,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notices").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            notices, first, last = self._conn.execute(
+                "SELECT COUNT(*), MIN(dateparution), MAX(dateparution) FROM notices"
+            ).fetchone()
+            lots = self._conn.execute("SELECT COUNT(*) FROM lots").fetchone()[0]
+        return {'notices': notices, 'lots': lots, 'first_dateparution': first, 'last_dateparution': last}
+
+    def _fts_query(self, matcher):
+        """'"plomberie" OR "cvc"' ; None si l'index plein texte ne peut pas présélectionner les lots"""
+        if not self.fts or not matcher:
+            return None
+        folded = [fold(k).strip() for k in matcher.keywords]
+        if any(len(f) < FTS_MIN_KEYWORD for f in folded):
+            return None
+        return " OR ".join('"' + f.replace('"', '""') + '"' for f in dict.fromkeys(folded))
+
+    def search(self, keywords, departement=None, since=None, max_notices=None):
+        """
+        Entreprises des avis indexés pour ces mots-clés, avis les plus récents d'abord :
+        mêmes lignes (et même filtre par lot) que le scraper en ligne.
+        L'index plein texte ne fait que présélectionner les lots ; KeywordMatcher confirme.
+        departement: code ("33") ; since: date ISO de parution minimale ;
+        max_notices: nb max d'avis avec au moins une entreprise.
+        """
+        matcher = KeywordMatcher.of(keywords)
+        sql = ("SELECT n.idweb, l.lot_title, l.texts, l.winners FROM lots l JOIN notices n ON n.idweb = l.idweb "
+               "WHERE 1 = 1")
+        params = []
+        fts_query = self._fts_query(matcher)
+        if fts_query:
+            sql += " AND l.lot_id IN (SELECT rowid FROM lots_fts WHERE lots_fts MATCH ?)"
+            params.append(fts_query)
+        if departement:
+            sql += " AND n.departements LIKE ?"
+            params.append(f"%,{departement},%")
+        if since:
+            sql += " AND n.dateparution >= ?"
+            params.append(str(since)[:10])
+        sql += " ORDER BY n.dateparution DESC, n.idweb DESC, l.position"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        results = []
+        n_notices = 0
+        for idweb, lots in groupby(rows, key=lambda row: row[0]):
+            awards = [Lot(title, json.loads(texts), [Company.from_dict(w) for w in json.loads(winners)])
+                      for _, title, texts, winners in lots]
+            notice_results = merge_awards(awards, matcher)
+            if not notice_results:
+                continue
+            for r in notice_results:
+                r['avis_id'] = r['source_avis_id'] = idweb
+            results.extend(notice_results)
+            n_notices += 1
+            if max_notices and n_notices >= max_notices:
+                break
+        return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
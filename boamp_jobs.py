@@ -0,0 +1,331 @@
+"""
+File de tâches d'extraction en arrière-plan (SQLite), indépendante de la session Streamlit.
+
+L'interface dépose une tâche (submit), des processus workers la traitent et enregistrent
+progression et résultats avis par avis ; l'interface n'a plus qu'à interroger status().
+Les workers peuvent tourner dans le serveur Streamlit (JobRunner) ou à part :
+
+    python boamp_jobs.py --processes 4
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from boamp_results import as_dicts
+
+DEFAULT_JOBS_PATH = os.path.join('.boamp_cache', 'jobs.sqlite')
+
+# Une tâche 'running' sans battement de cœur depuis STALE_AFTER s est considérée orpheline
+# (worker tué) et remise en file ; elle reprend après les avis déjà traités.
+HEARTBEAT_EVERY = 5.0
+STALE_AFTER = 60.0
+
+log = logging.getLogger("boamp_scraper.jobs")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Tâches et résultats partiels dans une base SQLite partagée entre processus (WAL).
+    Statuts : queued -> running -> done | failed | cancelled.
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                search_url TEXT NOT NULL,
+                keywords TEXT NOT NULL,
+                max_results INTEGER NOT NULL,
+                workers INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL,
+                worker_pid INTEGER,
+                progress_current INTEGER NOT NULL DEFAULT 0,
+                progress_total INTEGER NOT NULL DEFAULT 0,
+                progress_message TEXT,
+                n_results INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                plan_summary TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            CREATE TABLE IF NOT EXISTS job_notices (
+                job_id TEXT NOT NULL,
+                idweb TEXT NOT NULL,
+                results TEXT NOT NULL,
+                PRIMARY KEY (job_id, idweb)
+            );
+        """)
+        # Base créée avant l'estimation des recherches (plan_summary)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'plan_summary' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN plan_summary TEXT")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def _fetch(self, sql, params=()):
+        """(noms de colonnes, lignes)"""
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            return [c[0] for c in cursor.description], cursor.fetchall()
+
+    def submit(self, search_url, keywords, max_results=50, workers=4):
+        """Dépose une tâche (URL de recherche ou d'avis) ; retourne son identifiant"""
+        job_id = uuid.uuid4().hex[:12]
+        self._execute(
+            "INSERT INTO jobs (job_id, search_url, keywords, max_results, workers, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, search_url, json.dumps(list(keywords or []), ensure_ascii=False), max_results, workers, time.time())
+        )
+        return job_id
+
+    def claim(self, worker_pid=None):
+        """Prend la plus ancienne tâche en file (atomique entre processus) ; None si la file est vide"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Tâches dont le worker a disparu : retour en file
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat_at < ?",
+                    (now - STALE_AFTER,)
+                )
+                row = self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), "
+                        "heartbeat_at = ?, worker_pid = ? WHERE job_id = ?",
+                        (now, now, worker_pid, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.status(row[0]) if row else None
+
+    def progress(self, job_id, current, total, message=""):
+        """Met à jour la progression ; retourne True si l'annulation a été demandée"""
+        self._execute(
+            "UPDATE jobs SET progress_current = ?, progress_total = ?, progress_message = ?, heartbeat_at = ? "
+            "WHERE job_id = ?",
+            (current, total, message, time.time(), job_id)
+        )
+        _, rows = self._fetch("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,))
+        return bool(rows and rows[0][0])
+
+    def save_plan(self, job_id, summary):
+        """Volume et coût estimés de la recherche (SearchPlan.summary), affichés avec la progression"""
+        self._execute("UPDATE jobs SET plan_summary = ?, heartbeat_at = ? WHERE job_id = ?",
+                      (summary, time.time(), job_id))
+
+    def heartbeat(self, job_id):
+        self._execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def save_notice(self, job_id, idweb, results):
+        """Résultats d'un avis traité (sauvegarde partielle, reprise après crash)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO job_notices VALUES (?, ?, ?)",
+                    (job_id, idweb, json.dumps(as_dicts(results), ensure_ascii=False))
+                ).rowcount
+                self._conn.execute(
+                    "UPDATE jobs SET n_results = n_results + ?, heartbeat_at = ? WHERE job_id = ?",
+                    (len(results) if inserted else 0, time.time(), job_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def done_notices(self, job_id):
+        _, rows = self._fetch("SELECT idweb FROM job_notices WHERE job_id = ?", (job_id,))
+        return {idweb for (idweb,) in rows}
+
+    def finish(self, job_id, status, error=None):
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+            (status, error, time.time(), job_id)
+        )
+
+    def cancel(self, job_id):
+        """Annule une tâche en file, ou demande l'arrêt d'une tâche en cours"""
+        self._execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        )
+        self._execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,))
+
+    def status(self, job_id):
+        columns, rows = self._fetch("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(zip(columns, rows[0]))
+        job['keywords'] = json.loads(job['keywords'])
+        return job
+
+    def jobs(self, limit=50):
+        """Tâches les plus récentes d'abord"""
+        _, rows = self._fetch("SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [self.status(job_id) for (job_id,) in rows]
+
+    def results(self, job_id):
+        """Résultats (partiels tant que la tâche tourne), dans l'ordre de traitement des avis"""
+        _, rows = self._fetch("SELECT results FROM job_notices WHERE job_id = ? ORDER BY rowid", (job_id,))
+        return [r for (payload,) in rows for r in json.loads(payload)]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_job(queue, job, scraper):
+    """Exécute une tâche : avis unique (scrape_page) ou recherche, avis par avis"""
+    job_id = job['job_id']
+    url = job['search_url']
+    keywords = job['keywords']
+    if "pages/recherche" not in url:
+        queue.save_notice(job_id, url, scraper.scrape_page(url, keywords))
+        return
+
+    done = queue.done_notices(job_id) # Reprise : avis déjà traités par un worker précédent
+    last_update = 0.0
+    cancelled = False
+
+    def on_progress(current, total, message):
+        nonlocal last_update, cancelled
+        if time.monotonic() - last_update < 1.0 and current < total:
+            return
+        last_update = time.monotonic()
+        cancelled = queue.progress(job_id, current, total, message)
+
+    # Plan : volume et coût estimés affichés dès le départ, tranches récupérées en parallèle
+    plan = scraper.plan_search(url, job['max_results'])
+    if plan is not None:
+        queue.save_plan(job_id, plan.summary())
+    notices = scraper.iter_search_notices(
+        url, keywords, job['max_results'], on_progress, job['workers'],
+        skip_record=lambda record: record['fields']['idweb'] in done, plan=plan
+    )
+    for record, page_results in notices:
+        queue.save_notice(job_id, record['fields']['idweb'], page_results)
+        if cancelled:
+            notices.close() # Arrête les threads du scraper
+            raise JobCancelled()
+
+
+def worker_loop(path=DEFAULT_JOBS_PATH, poll_interval=1.0, stop_event=None, scraper_options=None):
+    """
+    Boucle d'un processus worker : prend les tâches en file et les exécute une à une.
+    scraper_options: arguments supplémentaires de BOAMPScraper (ex: api_base d'un stub).
+    """
+    from boamp_scraper import BOAMPScraper
+    from boamp_cache import NoticeCache
+    from boamp_index import LotIndex
+
+    queue = JobQueue(path)
+    # Les avis traités alimentent aussi l'index local des lots (requêtes hors-ligne de l'interface)
+    scraper_options = {'cache': NoticeCache(), 'index': LotIndex(), **(scraper_options or {})}
+    scraper = BOAMPScraper(**scraper_options)
+    pid = os.getpid()
+    while stop_event is None or not stop_event.is_set():
+        job = queue.claim(pid)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        job_id = job['job_id']
+        log.info("Tâche %s : %s", job_id, job['search_url'])
+
+        # Battement de cœur pendant les longues attentes réseau (sinon la tâche serait remise en file)
+        beating = threading.Event()
+        def heartbeat():
+            while not beating.wait(HEARTBEAT_EVERY):
+                queue.heartbeat(job_id)
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            run_job(queue, job, scraper)
+            queue.finish(job_id, 'done')
+        except JobCancelled:
+            queue.finish(job_id, 'cancelled')
+        except Exception as e:
+            log.exception("Tâche %s en échec", job_id)
+            queue.finish(job_id, 'failed', str(e))
+        finally:
+            beating.set()
+
+
+class JobRunner:
+    """Pool de processus workers (contexte 'spawn' : sûr depuis un serveur multi-threadé)"""
+
+    def __init__(self, path=DEFAULT_JOBS_PATH, processes=2, poll_interval=1.0, scraper_options=None):
+        self.path = path
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.scraper_options = scraper_options
+        self._context = multiprocessing.get_context('spawn')
+        self._stop = self._context.Event()
+        self._workers = []
+
+    def start(self):
+        JobQueue(self.path).close() # Crée le schéma avant que les workers ne démarrent
+        for _ in range(self.processes):
+            worker = self._context.Process(
+                target=worker_loop, args=(self.path, self.poll_interval, self._stop, self.scraper_options), daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def alive(self):
+        return sum(w.is_alive() for w in self._workers)
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workers de la file de tâches BOAMP")
+    parser.add_argument('--path', default=DEFAULT_JOBS_PATH)
+    parser.add_argument('--processes', type=int, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    runner = JobRunner(args.path, args.processes).start()
+    try:
+        while runner.alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+if __name__ == "__main__":
+    main()
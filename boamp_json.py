@@ -0,0 +1,119 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError: # Optionnel : décodage plus rapide si installé
+    orjson = None
+
+_decoder = json.JSONDecoder()
+
+# Sous-arbres EFORMS réellement lus par BOAMPScraper.parse_structured_data
+EFORMS_KEYS = ('cac:ProcurementProjectLot', 'efac:Organizations', 'efac:NoticeResult', 'efac:TenderingParty')
+
+_VALUE_START_RE = re.compile(r'\s*:\s*')
+_WS_RE = re.compile(r'\s*')
+_MEMBER_RE = re.compile(r',\s*"(?:[^"\\]|\\.)*"\s*:\s*')
+
+# Sans orjson, la projection ne bat json.loads qu'au-delà de cette taille (bench/bench_eforms.py) :
+# en dessous, parcourir le texte coûte plus que tout décoder. Avec orjson, le décodage complet
+# est aussi rapide ou plus (la projection repose sur raw_decode du module standard) : elle
+# n'est alors jamais utilisée.
+PROJECTION_MIN_BYTES = 64 * 1024
+
+
+def loads(raw):
+    """json.loads, via orjson quand il est disponible (mêmes résultats, ValueError si invalide)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _project_eforms(raw):
+    """
+    Extrait directement du texte les seuls sous-arbres EFORMS utiles, sans construire
+    le reste de l'avis (descriptions, conditions, parties...) : chaque sous-arbre est
+    décodé à sa position par raw_decode, le texte entre les deux n'est que parcouru.
+    Retourne None si la structure est ambiguë : l'appelant décode alors tout l'avis.
+    """
+    ubl = raw.find('"ext:UBLExtension"')
+    if ubl != -1:
+        m = _VALUE_START_RE.match(raw, ubl + len('"ext:UBLExtension"'))
+        if m and raw.startswith('[', m.end()):
+            return None # Plusieurs extensions : seule la première est lue par le parseur
+
+    hits = []
+    for key in EFORMS_KEYS:
+        needle = f'"{key}"'
+        pos = raw.find(needle)
+        while pos != -1:
+            hits.append((pos, key))
+            pos = raw.find(needle, pos + len(needle))
+    hits.sort()
+
+    found = {}
+    last_key, last_end = None, 0
+    for pos, key in hits:
+        if pos < last_end:
+            continue # Clé imbriquée dans un sous-arbre déjà extrait (ex: TenderingParty d'un LotTender)
+        m = _VALUE_START_RE.match(raw, pos + len(key) + 2)
+        if not m or raw[pos - 1] == '\\':
+            continue # Simple texte, pas une clé
+        if key in found:
+            return None
+        found[key], last_end = _decoder.raw_decode(raw, m.end())
+        last_key = key
+
+    # UBL place les extensions en tête : les lots sont le dernier sous-arbre utile.
+    # Ce qui suit doit refermer l'avis, sinon 'donnees' est tronqué (ou inattendu).
+    if last_key != 'cac:ProcurementProjectLot' or not _closes_notice(raw, last_end):
+        return None
+
+    extension = {k: found[k] for k in EFORMS_KEYS[1:] if k in found}
+    notice = {'ext:UBLExtensions': {'ext:UBLExtension': {'ext:ExtensionContent': {'efext:EformsExtension': extension}}}}
+    if 'cac:ProcurementProjectLot' in found:
+        notice['cac:ProcurementProjectLot'] = found['cac:ProcurementProjectLot']
+    return {'EFORMS': {'ContractAwardNotice': notice}}
+
+
+def _closes_notice(raw, pos):
+    """
+    Vérifie que raw[pos:] ne contient que des membres complets puis les trois
+    accolades fermantes (ContractAwardNotice, EFORMS, racine) et la fin du texte.
+    """
+    closed = 0
+    end = len(raw)
+    while closed < 3:
+        pos = _WS_RE.match(raw, pos).end()
+        if pos >= end:
+            return False
+        char = raw[pos]
+        if char == '}':
+            closed += 1
+            pos += 1
+        elif char == ',':
+            m = _MEMBER_RE.match(raw, pos)
+            if not m:
+                return False
+            _, pos = _decoder.raw_decode(raw, m.end())
+        else:
+            return False
+    return not raw[pos:].strip()
+
+
+def loads_donnees(raw, projection=True):
+    """
+    Décode le champ 'donnees' d'un avis.
+    projection: pour un gros avis d'attribution EFORMS (>= PROJECTION_MIN_BYTES) et sans orjson,
+    ne garde que les sous-arbres lus par le parseur (EFORMS_KEYS), sans décoder le reste ;
+    sinon décodage complet.
+    """
+    if (projection and orjson is None and len(raw) >= PROJECTION_MIN_BYTES
+            and '"ContractAwardNotice"' in raw and '"FNSimple"' not in raw):
+        try:
+            projected = _project_eforms(raw)
+        except ValueError:
+            projected = None # JSON tronqué : le décodage complet lèvera l'erreur
+        if projected is not None:
+            return projected
+    return loads(raw)
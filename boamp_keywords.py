@@ -0,0 +1,69 @@
+import re
+import unicodedata
+
+_COMBINING_MARKS = re.compile(r'[\u0300-\u036f]')
+
+
+def fold(text):
+    """Minuscules + suppression des accents ("Génie Climatique" -> "genie climatique")"""
+    return _COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text.casefold()))
+
+
+class KeywordMatcher:
+    """
+    Recherche de plusieurs mots-clés en une seule passe sur un texte.
+    Compilé une fois par extraction (une regex combinée sur les mots-clés repliés),
+    puis partagé entre tous les lots et tous les avis.
+    """
+
+    def __init__(self, keywords):
+        folded_keywords = ((k, fold(k).strip()) for k in (keywords or []) if k)
+        self._folded_keywords = [(k, f) for k, f in folded_keywords if f]
+        self.keywords = tuple(k for k, _ in self._folded_keywords)
+        # Mot-clé replié -> bits des mots-clés d'origine (plusieurs graphies peuvent se replier pareil)
+        self._bits = {}
+        for i, (_, f) in enumerate(self._folded_keywords):
+            self._bits[f] = self._bits.get(f, 0) | 1 << i
+        folded = sorted({f for _, f in self._folded_keywords}, key=len, reverse=True)
+
+        # A chaque position la regex ne retient que l'alternative la plus longue :
+        # les mots-clés contenus dans celle-ci sont donc implicitement trouvés aussi.
+        self._implied = {
+            f: [other for other in folded if other != f and other in f]
+            for f in folded
+        }
+        self._pattern = None
+        if folded:
+            self._pattern = re.compile('(?=(' + '|'.join(re.escape(f) for f in folded) + '))')
+
+    @classmethod
+    def of(cls, keywords):
+        """Réutilise un matcher déjà compilé, ou compile une liste de mots-clés"""
+        if isinstance(keywords, cls):
+            return keywords
+        return cls(keywords)
+
+    def __bool__(self):
+        return self._pattern is not None
+
+    def match(self, text):
+        """Mots-clés (graphie d'origine, ordre d'origine) présents dans le texte"""
+        return self.keywords_of(self.match_mask(text))
+
+    def match_mask(self, text):
+        """Mots-clés présents sous forme de masque de bits (bit i = self.keywords[i]) ; 0 si aucun"""
+        if self._pattern is None or not text:
+            return 0
+        found = set()
+        for m in self._pattern.finditer(fold(text)):
+            f = m.group(1)
+            if f not in found:
+                found.add(f)
+                found.update(self._implied[f])
+        if not found:
+            return 0
+        return sum(self._bits[f] for f in found)
+
+    def keywords_of(self, mask):
+        """Masque de bits -> mots-clés (ordre d'origine)"""
+        return [k for i, k in enumerate(self.keywords) if mask >> i & 1] if mask else []
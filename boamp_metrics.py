@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Temps cumulé d'une étape (nombre d'appels, total, max)"""
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 4),
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Metrics:
+    """
+    Instrumentation du scraper : chronos par étape (API recherche, API avis, décodage
+    de 'donnees', parsing EFORMS / FNSimple, fallback HTML) et compteurs (stratégies,
+    cache, avis traités). D'autres sources (session HTTP, cache disque) peuvent être
+    rattachées avec register() et apparaissent dans snapshot().
+    """
+
+    def __init__(self):
+        self.timers = defaultdict(StageTimer)
+        self.counters = defaultdict(int)
+        self.sources = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                t = self.timers[stage]
+                t.count += 1
+                t.total += elapsed
+                if elapsed > t.max:
+                    t.max = elapsed
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def register(self, name, source):
+        """source: callable renvoyant un dict (ex: session.metrics, cache.stats)"""
+        self.sources[name] = source
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'stages': {stage: t.to_dict() for stage, t in self.timers.items()},
+                'counters': dict(self.counters),
+            }
+        for name, source in self.sources.items():
+            data[name] = source()
+        return data
+
+    def to_prometheus(self, prefix='boamp'):
+        """Export texte au format d'exposition Prometheus"""
+        snap = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_stage_seconds_total counter",
+            *(f'{prefix}_stage_seconds_total{{stage="{s}"}} {t["total_s"]}' for s, t in snap['stages'].items()),
+            f"# TYPE {prefix}_stage_calls_total counter",
+            *(f'{prefix}_stage_calls_total{{stage="{s}"}} {t["count"]}' for s, t in snap['stages'].items()),
+            f"# TYPE {prefix}_events_total counter",
+            *(f'{prefix}_events_total{{name="{n}"}} {v}' for n, v in snap['counters'].items()),
+        ]
+        http = snap.get('http') or {}
+        if http:
+            for metric in ('requests', 'retries', 'errors', 'bytes'):
+                lines.append(f"# TYPE {prefix}_http_{metric}_total counter")
+                lines.extend(f'{prefix}_http_{metric}_total{{endpoint="{e}"}} {s[metric]}' for e, s in http.items())
+        cache = snap.get('cache') or {}
+        if cache:
+            lines.append(f"# TYPE {prefix}_cache_total counter")
+            lines.extend(f'{prefix}_cache_total{{result="{k}"}} {cache[k]}' for k in ('hits', 'misses') if k in cache)
+        return "\n".join(lines) + "\n"
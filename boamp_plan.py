@@ -0,0 +1,218 @@
+"""
+Plan d'une recherche avant extraction : volume (nhits), répartition (facettes opendatasoft
+dateparution / code_departement), découpage en tranches équilibrées et estimation du coût.
+
+    plan = scraper.plan_search(url, max_results=20000)
+    print(plan.summary())   # "18432 avis (sur 18432) en 37 tranche(s) (date) : ~230 requêtes, ~540 Mo, ~2 min"
+    scraper.scrape_search_results(url, keywords, max_results=20000, plan=plan)
+
+Les tranches par date se suivent du plus récent au plus ancien et couvrent toute la période :
+l'extraction rend les avis dans le même ordre qu'une extraction séquentielle.
+"""
+import math
+from datetime import date, timedelta
+
+DEFAULT_SHARD_SIZE = 500    # Avis visés par tranche
+DEFAULT_SHARD_WORKERS = 4   # Tranches récupérées en parallèle
+FACETS = ('dateparution', 'code_departement')
+
+
+class Shard:
+    """Tranche de la recherche : période de publication [start, end[, et/ou groupe de départements"""
+
+    __slots__ = ('start', 'end', 'departements', 'exclude', 'estimate', 'limit')
+
+    def __init__(self, start=None, end=None, departements=None, exclude=None, estimate=0, limit=None):
+        self.start = start
+        self.end = end
+        self.departements = departements # Codes retenus (None : tous)
+        self.exclude = exclude           # Codes exclus (tranche "autres départements")
+        self.estimate = estimate         # Nb d'avis d'après les facettes
+        self.limit = limit               # Nb max d'enregistrements à récupérer
+
+    def params(self, api_params):
+        """Paramètres de la recherche restreinte aux départements de la tranche (la période passe par since/until)"""
+        codes = self.departements or self.exclude
+        if not codes:
+            return api_params
+        clause = "code_departement:(" + " OR ".join(f'"{c}"' for c in codes) + ")"
+        if self.exclude:
+            clause = f"NOT {clause}"
+        base_q = api_params.get('q', '')
+        return {**api_params, 'q': f"({base_q}) AND {clause}" if base_q else clause}
+
+    def label(self):
+        if self.departements:
+            return "départements " + ", ".join(self.departements)
+        if self.exclude:
+            return "autres départements"
+        return f"{self.start} → {self.end}"
+
+    def to_dict(self):
+        return {
+            'start': self.start.isoformat() if self.start else None,
+            'end': self.end.isoformat() if self.end else None,
+            'departements': list(self.departements) if self.departements else None,
+            'exclude': list(self.exclude) if self.exclude else None,
+            'estimate': self.estimate,
+            'limit': self.limit,
+        }
+
+
+class SearchPlan:
+    """Résultat de BOAMPScraper.plan_search : volume, facettes, tranches et estimation du coût"""
+
+    def __init__(self, api_params, nhits, max_results, facets, shards, by, bulk=False,
+                 shard_workers=DEFAULT_SHARD_WORKERS, requests=0, bytes=0, seconds=0.0):
+        self.api_params = api_params
+        self.nhits = nhits
+        self.notices = min(nhits, max_results)
+        self.max_results = max_results
+        self.facets = facets # {'code_departement': {code: nb}, 'dateparution': {(début, fin): nb}}
+        self.shards = shards
+        self.by = by         # 'date' ou 'departement'
+        self.bulk = bulk
+        self.shard_workers = shard_workers
+        self.requests = requests
+        self.bytes = bytes
+        self.seconds = seconds
+
+    def summary(self):
+        return (f"{self.notices} avis (sur {self.nhits}) en {len(self.shards)} tranche(s) ({self.by}) : "
+                f"~{self.requests} requêtes, ~{_format_bytes(self.bytes)}, ~{_format_duration(self.seconds)}")
+
+    def to_dict(self):
+        return {
+            'nhits': self.nhits,
+            'notices': self.notices,
+            'by': self.by,
+            'bulk': self.bulk,
+            'shard_workers': self.shard_workers,
+            'shards': [s.to_dict() for s in self.shards],
+            'estimated_requests': self.requests,
+            'estimated_bytes': self.bytes,
+            'estimated_seconds': round(self.seconds, 1),
+        }
+
+
+def _format_bytes(n):
+    for unit in ('o', 'Ko', 'Mo'):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} Go"
+
+
+def _format_duration(seconds):
+    if seconds < 90:
+        return f"{seconds:.0f} s"
+    if seconds < 5400:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def _bucket_range(path):
+    """Chemin de facette date opendatasoft ("2024", "2024/09", "2024/09/12") -> [début, fin[ ; None si illisible"""
+    try:
+        parts = [int(p) for p in str(path).split('/')]
+    except ValueError:
+        return None
+    if len(parts) == 1:
+        return date(parts[0], 1, 1), date(parts[0] + 1, 1, 1)
+    if len(parts) == 2:
+        year, month = parts
+        return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+    start = date(*parts[:3])
+    return start, start + timedelta(days=1)
+
+
+def _leaves(facets):
+    """Facettes hiérarchiques (année > mois > jour) -> feuilles les plus fines"""
+    for facet in facets:
+        if facet.get('facets'):
+            yield from _leaves(facet['facets'])
+        else:
+            yield facet
+
+
+def parse_facets(data):
+    """
+    facet_groups d'une réponse search -> {'dateparution': {(début, fin): nb}, 'code_departement': {code: nb}}
+    Les périodes sont triées de la plus récente à la plus ancienne.
+    """
+    facets = {'dateparution': {}, 'code_departement': {}}
+    for group in (data or {}).get('facet_groups') or []:
+        name = group.get('name')
+        if name == 'dateparution':
+            buckets = []
+            for leaf in _leaves(group.get('facets') or []):
+                bounds = _bucket_range(leaf.get('path') or leaf.get('name'))
+                if bounds and leaf.get('count'):
+                    buckets.append((bounds, leaf['count']))
+            facets['dateparution'] = dict(sorted(buckets, reverse=True))
+        elif name == 'code_departement':
+            facets['code_departement'] = {
+                str(f['name']): f['count'] for f in group.get('facets') or [] if f.get('count')
+            }
+    return facets
+
+
+def date_shards(buckets, notices, floor, ceiling, shard_size):
+    """
+    Tranches de dates contiguës (de la plus récente à la plus ancienne) d'environ shard_size avis,
+    jusqu'à couvrir `notices` avis. La dernière tranche descend jusqu'à floor : rien n'échappe
+    au découpage si les facettes sont approximatives.
+    """
+    shards = []
+    end = bucket_start = ceiling
+    current = 0
+    planned = 0
+    for (start, _), count in buckets.items():
+        if current and current + count > shard_size:
+            shards.append(Shard(bucket_start, end, estimate=current))
+            end = bucket_start
+            current = 0
+        bucket_start = max(start, floor)
+        current += count
+        planned += count
+        if planned >= notices:
+            break
+    # Avis absents des facettes : comptés dans la dernière tranche
+    shards.append(Shard(floor, end, estimate=current + max(0, notices - planned)))
+    return shards
+
+
+def departement_shards(counts, n_shards):
+    """
+    Départements répartis en n_shards groupes de volumes proches (le plus gros d'abord dans le
+    groupe le moins rempli), plus une tranche pour les avis sans département connu des facettes.
+    Un avis multi-départements peut tomber dans plusieurs tranches (dédoublonné à l'extraction).
+    """
+    groups = [[0, []] for _ in range(max(1, min(n_shards, len(counts))))]
+    for code, count in sorted(counts.items(), key=lambda item: -item[1]):
+        group = min(groups, key=lambda g: g[0])
+        group[0] += count
+        group[1].append(code)
+    shards = [Shard(departements=tuple(codes), estimate=total) for total, codes in groups if codes]
+    shards.append(Shard(exclude=tuple(counts), estimate=0))
+    return shards
+
+
+def estimate_cost(shards, bulk, page_size, window_cap, record_bytes, latency, rate, shard_workers):
+    """
+    (requêtes, octets, secondes) pour récupérer les tranches : recherche (pages ou exports) seule,
+    hors avis à re-télécharger (donnees absent, fallback HTML) et hors parsing.
+    """
+    requests = 1 # Le plan lui-même
+    for shard in shards:
+        fetched = min(shard.estimate, shard.limit or shard.estimate)
+        if bulk:
+            requests += 1 + 2 * max(1, math.ceil(fetched / window_cap))
+        else:
+            requests += 1 + max(1, math.ceil(fetched / page_size))
+    notices = sum(min(s.estimate, s.limit or s.estimate) for s in shards)
+    parallel = max(1, min(shard_workers, len(shards)))
+    seconds = requests * latency / parallel
+    if rate:
+        seconds = max(seconds, requests / rate)
+    return requests, notices * record_bytes, seconds
@@ -0,0 +1,312 @@
+import itertools
+import logging
+import re
+import sys
+from collections.abc import MutableMapping
+
+from boamp_export import EXPORT_FIELDS
+from boamp_keywords import KeywordMatcher, fold
+
+log = logging.getLogger("boamp_scraper.results")
+
+# Schéma d'export des entreprises fusionnées (avis_id = liste des avis, séparés par virgules)
+MERGED_FIELDS = EXPORT_FIELDS + ['siret', 'nb_avis']
+
+_LEGAL_FORMS = re.compile(r'\b(?:sarl|sas|sasu|eurl|sa|snc|sci|scop|sca|selarl|ets|etablissements?|societe|ste)\b')
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_POSTCODE = re.compile(r'\b\d{5}\b')
+_DIGITS = re.compile(r'\D')
+_DELETED = object() # Champ calculé ou de l'attributaire retiré d'un seul résultat (del r['email'])
+
+
+def normalize_siret(value):
+    """CompanyID EFORMS -> SIRET/SIREN (chiffres seuls), '' si ce n'est pas un identifiant français"""
+    digits = _DIGITS.sub('', value or '')
+    return digits if len(digits) in (9, 14) else ''
+
+
+def normalize_name(name):
+    """"SARL Dordogne-Climatisation" et "DORDOGNE CLIMATISATION SARL" -> "dordogne climatisation\""""
+    words = _NON_ALNUM.sub(' ', _LEGAL_FORMS.sub(' ', fold(name or ''))).split()
+    return ' '.join(words)
+
+
+def normalize_city(ville):
+    """"33220 Pineuilh" -> "pineuilh\""""
+    return ' '.join(_NON_ALNUM.sub(' ', fold(_POSTCODE.sub(' ', ville or ''))).split())
+
+
+class Company:
+    """Attributaire tel que lu dans l'avis : un seul objet, partagé par tous les lots qu'il remporte"""
+
+    __slots__ = ('nom', 'siret', 'email', 'telephone', 'ville', 'url_source')
+
+    def __init__(self, nom, email='', telephone='', ville='', url_source=None, siret=None):
+        self.nom = nom
+        self.siret = siret # None : format sans identifiant légal (FNSimple, HTML)
+        self.email = email
+        self.telephone = telephone
+        self.ville = ville
+        # Même URL pour toutes les entreprises d'un avis : une seule chaîne en mémoire
+        self.url_source = sys.intern(url_source) if url_source else url_source
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in self.__slots__ if getattr(self, f) is not None}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{f: data[f] for f in cls.__slots__ if f in data})
+
+
+class Lot:
+    """Lot attribué : titre, textes où chercher les mots-clés (essayés dans l'ordre), attributaires"""
+
+    __slots__ = ('title', 'texts', 'winners')
+
+    def __init__(self, title, texts, winners):
+        self.title = title
+        self.texts = texts
+        self.winners = winners
+
+
+class CompanyResult(MutableMapping):
+    """
+    Entreprise retenue sur un avis : l'attributaire (Company, partagé), les titres de ses lots
+    et ses mots-clés trouvés (masque de bits sur les mots-clés de la recherche).
+    S'utilise comme un dict (r['nom'], r.get('lot_title'), r['note'] = ...) : 'lot_title' et
+    'mots_cles_matches' ne sont assemblés en texte qu'à la lecture (export, affichage).
+    Les clés ajoutées, et les champs modifiés (sans toucher l'attributaire partagé), vont dans
+    un dict propre au résultat, créé à la première écriture. json.dumps exige un vrai dict :
+    r.to_dict() (ou as_dicts).
+    """
+
+    __slots__ = ('company', 'lot_titles', 'keyword_mask', 'keywords', 'avis_id', 'source_avis_id', '_extra')
+    FIELDS = Company.__slots__ + ('lot_title', 'mots_cles_matches', 'avis_id', 'source_avis_id')
+    WRITABLE = ('avis_id', 'source_avis_id')
+
+    def __init__(self, company, lot_title, keyword_mask=0, keywords=()):
+        self.company = company
+        self.lot_titles = lot_title # Un seul lot (cas courant) : le titre, sans tuple
+        self.keyword_mask = keyword_mask
+        self.keywords = keywords # Tuple partagé par toute l'extraction (KeywordMatcher.keywords)
+        self.avis_id = None
+        self.source_avis_id = None
+        self._extra = None
+
+    def add_lot(self, lot_title, keyword_mask):
+        titles = self.titles()
+        if lot_title not in titles:
+            self.lot_titles = titles + (lot_title,)
+        self.keyword_mask |= keyword_mask
+
+    def titles(self):
+        return self.lot_titles if isinstance(self.lot_titles, tuple) else (self.lot_titles,)
+
+    def matched_keywords(self):
+        return [k for i, k in enumerate(self.keywords) if self.keyword_mask >> i & 1]
+
+    def _value(self, key):
+        if key == 'lot_title':
+            return " | ".join(self.titles())
+        if key == 'mots_cles_matches':
+            return ", ".join(self.matched_keywords())
+        if key in self.WRITABLE:
+            return getattr(self, key)
+        if key in Company.__slots__:
+            return getattr(self.company, key)
+        return None
+
+    def __getitem__(self, key):
+        if self._extra is not None and key in self._extra:
+            value = self._extra[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        value = self._value(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.WRITABLE:
+            setattr(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self.WRITABLE:
+            setattr(self, key, None)
+        elif key in self.FIELDS:
+            self[key] = _DELETED
+        else:
+            del self._extra[key]
+
+    def __iter__(self):
+        extra = self._extra
+        if extra is None:
+            return (f for f in self.FIELDS if self._value(f) is not None)
+        return itertools.chain(
+            (f for f in self.FIELDS if (extra[f] is not _DELETED if f in extra else self._value(f) is not None)),
+            (k for k, v in extra.items() if k not in self.FIELDS and v is not _DELETED),
+        )
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """Copie en dict (JSON, modifications sans effet sur le résultat)"""
+        return dict(self)
+
+    copy = to_dict # Comme dict.copy() au temps où les résultats étaient des dicts
+
+    def __repr__(self):
+        return f"CompanyResult({dict(self)!r})"
+
+
+def as_dicts(entreprises):
+    """Résultats -> dicts (frontière JSON : sauvegardes SQLite, API)"""
+    return [dict(e) for e in entreprises]
+
+
+def merge_awards(lots, keywords):
+    """
+    Filtre par mots-clés les lots attribués d'un avis ([Lot]) et dédoublonne les entreprises par nom.
+    Un lot est retenu par le premier de ses textes qui contient un mot-clé (ex: titre, puis contenu).
+    Une entreprise attributaire de plusieurs lots n'est qu'une ligne (titres et mots-clés cumulés).
+    """
+    matcher = KeywordMatcher.of(keywords)
+    results = {} # Nom -> CompanyResult
+    for lot in lots:
+        mask = 0
+        if matcher:
+            for text in lot.texts:
+                mask = matcher.match_mask(text)
+                if mask:
+                    break
+            if not mask:
+                continue
+        
+        for company in lot.winners:
+            existing_entry = results.get(company.nom)
+            if existing_entry is None:
+                results[company.nom] = CompanyResult(company, lot.title, mask, matcher.keywords)
+                log.debug("Trouvé (%s) : %s", lot.title, company.nom)
+            else:
+                existing_entry.add_lot(lot.title, mask)
+    return list(results.values())
+
+
+def company_key(entreprise):
+    """Clé de fusion : SIRET quand l'avis le fournit (EFORMS), sinon nom + ville normalisés"""
+    siret = normalize_siret(entreprise.get('siret'))
+    if siret:
+        return 'siret:' + siret
+    return f"nom:{normalize_name(entreprise.get('nom'))}|{normalize_city(entreprise.get('ville'))}"
+
+
+def _fill_contact(merged, contact):
+    """Les coordonnées manquantes sont complétées par les avis suivants"""
+    for field in ('siret', 'email', 'telephone', 'ville'):
+        if not merged[field] and contact[field]:
+            merged[field] = contact[field]
+
+
+class CompanyStore:
+    """
+    Résultats agrégés d'une ou plusieurs recherches (même jeu de mots-clés) :
+    chaque avis n'est retenu qu'une fois (idweb), et une entreprise retenue sur plusieurs
+    avis ne fait qu'une ligne, avec ses lots, mots-clés et avis cumulés.
+    Le résultat ne dépend pas de l'ordre d'arrivée des avis (avec ou sans SIRET d'abord).
+    """
+
+    def __init__(self):
+        self.notices = set()
+        self._companies = {}
+        self._aliases = {} # nom + ville -> clé SIRET (l'entreprise vue avec et sans SIRET)
+        self._seq = 0      # Ordre de première apparition (conservé quand une entrée change de clé)
+
+    def has_notice(self, idweb):
+        return idweb in self.notices
+
+    def add_notice(self, idweb, entreprises):
+        """Ajoute les entreprises d'un avis ; False si l'avis était déjà là"""
+        if idweb in self.notices:
+            return False
+        self.notices.add(idweb)
+        for entreprise in entreprises:
+            self.add(entreprise, idweb)
+        return True
+
+    def add(self, entreprise, idweb=None):
+        if isinstance(entreprise, CompanyResult) and entreprise._extra is None:
+            # Champs lus directement sur l'attributaire et les ensembles (sans passer par le texte) ;
+            # un résultat modifié (r['nom'] = ...) passe par la lecture comme un dict
+            contact = {f: getattr(entreprise.company, f) or '' for f in Company.__slots__}
+            lots, keywords = entreprise.titles(), entreprise.matched_keywords()
+            idweb = idweb or entreprise.avis_id or entreprise.source_avis_id or ''
+        else: # Lignes relues d'un export / de SQLite : champs texte
+            contact = {f: entreprise.get(f) or '' for f in Company.__slots__}
+            lots = (entreprise.get('lot_title') or '').split(' | ')
+            keywords = (entreprise.get('mots_cles_matches') or '').split(', ')
+            idweb = idweb or entreprise.get('avis_id') or entreprise.get('source_avis_id') or ''
+        contact['siret'] = normalize_siret(contact['siret'])
+
+        name_key = f"nom:{normalize_name(contact['nom'])}|{normalize_city(contact['ville'])}"
+        if contact['siret']:
+            key = 'siret:' + contact['siret']
+            # Une ligne sans SIRET (FNSimple, HTML) rejoint cette entreprise, qu'elle arrive après
+            # ou qu'elle soit déjà là (l'entrée nom + ville passe alors sous la clé SIRET)
+            if self._aliases.setdefault(name_key, key) == key and name_key in self._companies:
+                self._rekey(name_key, key)
+        else:
+            key = self._aliases.get(name_key, name_key)
+
+        merged = self._companies.get(key)
+        if merged is None:
+            merged = self._companies[key] = dict(contact, _lots={}, _keywords={}, _notices={}, _first=self._seq)
+            self._seq += 1
+        else:
+            _fill_contact(merged, contact)
+        merged['_lots'].update(dict.fromkeys(lot for lot in lots if lot))
+        merged['_keywords'].update(dict.fromkeys(k for k in keywords if k))
+        if idweb:
+            merged['_notices'][idweb] = None
+
+    def _rekey(self, old_key, new_key):
+        """Range l'entrée old_key sous new_key (fusionnée si new_key existe déjà)"""
+        entry = self._companies.pop(old_key)
+        target = self._companies.get(new_key)
+        if target is None:
+            self._companies[new_key] = entry
+            return
+        _fill_contact(target, entry)
+        for field in ('_lots', '_keywords', '_notices'):
+            target[field].update(entry[field])
+        target['_first'] = min(target['_first'], entry['_first'])
+
+    def add_results(self, entreprises):
+        """Résultats déjà aplatis (avis_id / source_avis_id sur chaque ligne)"""
+        for entreprise in entreprises:
+            idweb = entreprise.get('avis_id') or entreprise.get('source_avis_id')
+            if idweb:
+                self.notices.add(idweb)
+            self.add(entreprise, idweb)
+
+    def __len__(self):
+        return len(self._companies)
+
+    def companies(self):
+        """Entreprises fusionnées, dans l'ordre de première apparition"""
+        rows = []
+        for merged in sorted(self._companies.values(), key=lambda m: m['_first']):
+            row = {k: v for k, v in merged.items() if not k.startswith('_')}
+            row['lot_title'] = " | ".join(merged['_lots'])
+            row['mots_cles_matches'] = ", ".join(merged['_keywords'])
+            row['avis_id'] = ", ".join(merged['_notices'])
+            row['nb_avis'] = len(merged['_notices'])
+            rows.append(row)
+        return rows
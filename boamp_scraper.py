@@ -1,17 +1,125 @@
 
-import requests
-from bs4 import BeautifulSoup
-import csv
-import re
+import argparse
 import json
+import logging
+import math
+import multiprocessing
+import queue
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from itertools import chain
+from urllib.parse import urlparse, parse_qs
+import requests
+from lxml import etree, html as lxml_html
+from boamp_http import BOAMPSession
+from boamp_keywords import KeywordMatcher, fold
+from boamp_export import CSVSink, EXPORT_FIELDS, open_sink
+from boamp_cache import NoticeCache, SingleFlight
+from boamp_metrics import Metrics
+from boamp_plan import (DEFAULT_SHARD_SIZE, DEFAULT_SHARD_WORKERS, FACETS, SearchPlan, date_shards,
+                        departement_shards, estimate_cost, parse_facets)
+from boamp_results import Company, CompanyStore, Lot, MERGED_FIELDS, merge_awards, normalize_siret
+import boamp_json
+
+# Logger du scraper : silencieux tant que l'application ne configure pas logging
+log = logging.getLogger("boamp_scraper")
+
+API_BASE = "https://boamp-datadila.opendatasoft.com"
+PAGED_WINDOW_SIZE = 2000  # Nb max d'avis par fenêtre paginée (start= reste peu profond, API v1 plafonnée à 10 000)
+BULK_WINDOW_SIZE = 5000   # Nb max d'avis par appel à l'endpoint download
+MIN_DATE = date(2000, 1, 1)
+SHARD_BUFFER_PAGES = 4    # Pages d'avance par tranche en cours (SearchPlan) : mémoire bornée
+_SHARD_DONE = object()    # Fin de la file de pages d'une tranche
+
+# FNSimple : 'attributionMarche' enchaîne des en-têtes "Lot N° X - titre" et, pour chaque
+# marché attribué, "Marché n° : réf" suivi de la ligne "Nom, adresse, CP Ville"
+FNSIMPLE_TOKEN_RE = re.compile(r'(?P<lot>Lot\s*N°\s*\d+\s*-\s*[^\n]+)|(?P<marche>(?i:Marché\s*n°\s*:\s*)[^\n]+)')
+FNSIMPLE_CP_RE = re.compile(r'\b\d{5}\b\s*(.+)')
+
+# Fallback HTML (dataset boamp-html) : blocs "Attributaire : ..." / "Titulaire : ..."
+HTML_LABEL_RE = re.compile(r'(?:attributaire|titulaire)s?\s*(?:du marché\s*)?:\s*', re.IGNORECASE)
+HTML_LABEL_XPATH = (
+    "//*[not(self::script or self::style)]"
+    "[text()[re:test(., '(attributaire|titulaire)s?\\s*(du march.\\s*)?:', 'i')]]"
+)
+HTML_BLOCKS = ('p', 'li', 'td', 'dd', 'dt', 'th', 'div', 'section', 'tr')
+HTML_HEADINGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+PHONE_RE = re.compile(r'(?:\+33\s?|0)[1-9](?:[\s.-]?\d{2}){4}')
+
+
+class SearchIncomplete(Exception):
+    """
+    Une page ou une fenêtre de la recherche n'a pas pu être lue (erreur HTTP après retries) :
+    les avis déjà rendus sont bons, mais la recherche n'a pas été parcourue en entier.
+    """
+    pass
+
 
 class BOAMPScraper:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, api_base=API_BASE, cache=None, use_cache=True, session=None, metrics=None,
+                 json_projection=True, index=None, flight=None):
+        # Session avec limitation de débit, retries/backoff et métriques (boamp_http)
+        self.session = session or BOAMPSession()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        # Endpoint opendatasoft (surchargeable pour les benchmarks / un stub local)
+        self.api_search_url = f"{api_base}/api/records/1.0/search/"
+        self.api_download_url = f"{api_base}/api/records/1.0/download/"
+        # Cache disque des avis (NoticeCache) ; use_cache=False pour le contourner
+        self.cache = cache
+        self.use_cache = use_cache
+        # Chronos par étape et compteurs ; la session et le cache y sont rattachés
+        self.metrics = metrics or Metrics()
+        if hasattr(self.session, 'metrics'):
+            self.metrics.register('http', self.session.metrics)
+        if cache is not None:
+            self.metrics.register('cache', cache.stats)
+        # Avis EFORMS : ne décoder que les sous-arbres utiles de 'donnees' (boamp_json)
+        self.json_projection = json_projection
+        # Index local des lots (boamp_index.LotIndex) : chaque avis parsé y est enregistré,
+        # tous lots confondus, pour réinterroger d'autres mots-clés sans l'API
+        self.index = index
+        # Appels identiques simultanés (même avis, même page de recherche) fusionnés en un seul,
+        # résultats récents gardés en mémoire (boamp_cache.SingleFlight ; ttl=0 : fusion seule).
+        # Un scraper partagé (application, jobs) ne sollicite l'API qu'une fois par avis.
+        self.flight = flight if flight is not None else SingleFlight()
+        self.metrics.register('flight', self.flight.stats)
+        # Pools de processus de parsing (parse_workers -> pool), créés au premier usage et gardés
+        # jusqu'à close() : démarrer les interpréteurs ('spawn') coûte ~1 s, pas à chaque recherche
+        self._parse_pools = {}
+        self._parse_pools_lock = threading.Lock()
     
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Arrête les processus de parsing (parse_workers) ; ils seront relancés si besoin"""
+        with self._parse_pools_lock:
+            pools, self._parse_pools = list(self._parse_pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _parse_pool(self, parse_workers):
+        """Pool de parse_workers processus, partagé par les extractions de ce scraper"""
+        with self._parse_pools_lock:
+            pool = self._parse_pools.get(parse_workers)
+            if pool is None:
+                # 'spawn' : un fork hériterait des verrous (logging, sqlite, urllib3) tenus par les threads I/O
+                pool = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'))
+                self._parse_pools[parse_workers] = pool
+            return pool
+
     def normalize_list(self, item):
         """Helper to handle XML-to-JSON single item as dict vs list"""
         if isinstance(item, list):
@@ -23,454 +131,683 @@ class BOAMPScraper:
     def scrape_page(self, url, keywords):
         """
         Scrape une page BOAMP et extrait les entreprises correspondant aux mots-clés
-        en utilisant les données structurées si disponibles.
+        en utilisant les données structurées si disponibles (l'avis HTML n'est lu que si
+        aucun format structuré n'a pu être décodé).
+        keywords: liste de mots-clés ou KeywordMatcher déjà compilé.
         """
-        print(f"🔍 Scraping: {url}")
+        log.debug("Scraping: %s", url)
+        keywords = KeywordMatcher.of(keywords)
+        fields = None
         
         # 1. Extraction ID BOAMP et tentative via API Structurée (JSON)
         boamp_id_match = re.search(r'(\d{2}-\d{3,})', url)
         if boamp_id_match:
             boamp_id = boamp_id_match.group(1)
-            print(f"ℹ️  ID BOAMP détecté: {boamp_id}")
+            log.debug("ID BOAMP détecté: %s", boamp_id)
             
             try:
                 # On demande le dataset 'boamp' qui contient le champ 'donnees' (JSON structuré)
-                api_url = f"https://boamp-datadila.opendatasoft.com/api/records/1.0/search/?q=idweb:%22{boamp_id}%22&rows=1&dataset=boamp&timezone=Europe%2FBerlin&lang=fr"
-                api_response = self.session.get(api_url, timeout=10)
+                fields = self.fetch_notice_fields(boamp_id, 'boamp')
                 
-                if api_response.status_code == 200:
-                    data = api_response.json()
-                    if data.get('records'):
-                        fields = data['records'][0]['fields']
-                        
-                        # Parsing JSON 'donnees'
-                        if 'donnees' in fields:
-                           donnees_str = fields['donnees']
-                           if isinstance(donnees_str, str):
-                               donnees_json = json.loads(donnees_str)
-                           else:
-                               donnees_json = donnees_str
-
-                           # Strategy 1: EFORMS (Standard Européen)
-                           if 'EFORMS' in donnees_json:
-                               print("✅ Données EFORMS trouvées via API.")
-                               results = self.parse_structured_data(donnees_json, keywords, url)
-                               if results:
-                                   for r in results: r['avis_id'] = boamp_id
-                                   return results
-                           
-                           # Strategy 2: FNSimple (Format Texte Structuré)
-                           elif 'FNSimple' in donnees_json:
-                               print("✅ Données FNSimple trouvées via API.")
-                               results = self.parse_fnsimple_data(donnees_json, keywords, url)
-                               if results:
-                                   for r in results: r['avis_id'] = boamp_id
-                                   return results
-                        
-                        # Fallback
-                        if 'titulaire' in fields:
-                            print("ℹ️  Champ 'titulaire' trouvé (mais pas de détails JSON complets).")
+                if fields:
+                    # Parsing JSON 'donnees'
+                    decoded, awards = self._structured_awards(boamp_id, fields, url)
+                    if decoded and awards is not None:
+                        # Format structuré lu : sans lot retenu, la réponse est vide (pas de fallback HTML)
+                        results = merge_awards(awards, keywords)
+                        for r in results: r['avis_id'] = boamp_id
+                        return results
+                    
+                    # Fallback
+                    if 'titulaire' in fields:
+                        log.debug("Champ 'titulaire' trouvé (mais pas de détails JSON complets).")
 
             except Exception as e:
-                print(f"⚠️ Erreur API Structurée: {e}")
+                log.warning("Erreur API Structurée: %s", e)
 
         # 2. Fallback: Extraction HTML
 
         # (C'est le code existant nettoyé)
-        print("⚠️ Passage en mode scraping textuel (moins précis)")
-        return self.scrape_html_fallback(url, boamp_id_match.group(1) if boamp_id_match else None, keywords)
+        log.info("Passage en mode scraping textuel (moins précis) : %s", url)
+        boamp_id = boamp_id_match.group(1) if boamp_id_match else None
+        awards = self._html_fallback_awards(url, boamp_id)
+        self._index_notice(boamp_id, fields or {}, url, awards)
+        return merge_awards(awards, keywords)
 
-    def parse_structured_data(self, donnees_raw, keywords, original_url):
-        """Analyse le JSON complexe EFORMS pour lier Lots -> Mots-clés -> Vainqueurs"""
+    def fetch_notice_fields(self, boamp_id, dataset='boamp'):
+        """
+        Récupère les 'fields' d'un avis (dataset 'boamp' ou 'boamp-html') via l'API,
+        en passant par le cache disque s'il est actif.
+        Retourne {} si l'avis est absent du dataset, None en cas d'erreur HTTP.
+        Les demandes simultanées du même avis partagent un seul appel (self.flight).
+        """
+        return self.flight.call(('notice', dataset, boamp_id), lambda: self._fetch_notice_fields(boamp_id, dataset))
+
+    def _fetch_notice_fields(self, boamp_id, dataset):
+        """fetch_notice_fields sans fusion des appels : ('fields', taille pour self.flight)"""
+        cache = self.cache if self.use_cache else None
+        if cache is not None:
+            fields = cache.get(dataset, boamp_id)
+            if fields is not None:
+                self.metrics.incr('cache_hits')
+                return fields, _fields_size(fields)
+            self.metrics.incr('cache_misses')
+        
+        api_url = f"{self.api_search_url}?q=idweb:%22{boamp_id}%22&rows=1&dataset={dataset}&timezone=Europe%2FBerlin&lang=fr"
+        with self.metrics.timer('notice_api'):
+            resp = self.session.get(api_url, timeout=10)
+        if resp.status_code != 200:
+            log.warning("Erreur API avis %s (%s): %s", boamp_id, dataset, resp.status_code)
+            return None, None
+        
+        data = boamp_json.loads(resp.content)
+        fields = data['records'][0]['fields'] if data.get('records') else {}
+        if cache is not None:
+            cache.put(dataset, boamp_id, fields)
+        return fields, len(resp.content)
+
+    def decode_donnees(self, donnees_raw):
+        """
+        Décode le champ 'donnees' (chaîne JSON ou dict déjà décodé).
+        Retourne None si le champ est absent ou tronqué (JSON invalide).
+        """
+        if not donnees_raw:
+            return None
+        if not isinstance(donnees_raw, str):
+            return donnees_raw if isinstance(donnees_raw, dict) else None
         try:
-            if isinstance(donnees_raw, str):
-                donnees = json.loads(donnees_raw)
-            else:
-                donnees = donnees_raw
-            
-            root = donnees.get('EFORMS', {}).get('ContractAwardNotice', {})
-            if not root:
-                return []
+            with self.metrics.timer('decode_donnees'):
+                donnees_json = boamp_json.loads_donnees(donnees_raw, self.json_projection)
+        except ValueError:
+            log.warning("Champ 'donnees' tronqué ou invalide.")
+            self.metrics.incr('donnees_truncated')
+            return None
+        return donnees_json if isinstance(donnees_json, dict) else None
 
-            entreprises = []
-            
-            # --- 1. Indexation des Lots (ID -> Description/Titre) ---
-            lots_map = {} # ID -> {title, description}
-            lots_block = self.normalize_list(root.get('cac:ProcurementProjectLot', []))
-            
-            for lot in lots_block:
-                lot_id = lot.get('cbc:ID', {}).get('#text')
-                # Titre du lot
-                proc_proj = lot.get('cac:ProcurementProject', {})
-                title = ""
-                # Le titre peut être dans cbc:Name ou cbc:Description ou via des réf
-                if 'cbc:Name' in proc_proj:
-                    node = proc_proj['cbc:Name']
-                    title = node.get('#text') if isinstance(node, dict) else node
-                
-                # Parfois c'est dans cbc:Description
-                desc = ""
-                if 'cbc:Description' in proc_proj:
-                    node = proc_proj['cbc:Description']
-                    desc = node.get('#text') if isinstance(node, dict) else node
-
-                lots_map[lot_id] = {
-                    'full_text': f"{title} {desc}",
-                    'title': title
-                }
-            
+    def parse_donnees(self, donnees_json, keywords, url):
+        """
+        Applique la stratégie adaptée (EFORMS puis FNSimple) au JSON 'donnees' décodé.
+        Retourne None si aucun format structuré connu n'est présent.
+        """
+        awards = self._parse_awards(donnees_json, url)
+        return merge_awards(awards, keywords) if awards is not None else None
 
+    def _parse_awards(self, donnees_json, url):
+        """Attributions (tous lots, sans filtre) selon la stratégie adaptée ; None si format inconnu"""
+        # Strategy 1: EFORMS (Standard Européen)
+        if 'EFORMS' in donnees_json:
+            log.debug("Données EFORMS trouvées via API.")
+            self.metrics.incr('strategy_eforms')
+            with self.metrics.timer('parse_eforms'):
+                return self._eforms_awards(donnees_json, url)
+        
+        # Strategy 2: FNSimple (Format Texte Structuré)
+        if 'FNSimple' in donnees_json:
+            log.debug("Données FNSimple trouvées via API.")
+            self.metrics.incr('strategy_fnsimple')
+            with self.metrics.timer('parse_fnsimple'):
+                return self._fnsimple_awards(donnees_json, url)
+        
+        self.metrics.incr('strategy_unknown')
+        return None
 
+    def _structured_awards(self, idweb, fields, url):
+        """
+        Décodage + parsing du 'donnees' d'un avis, partagé entre appels simultanés ou récents
+        (self.flight) et enregistré une seule fois dans l'index local.
+        Retourne (False, None) si 'donnees' est absent ou tronqué, (True, None) si le format
+        est inconnu, sinon (True, attributions).
+        """
+        donnees_raw = fields.get('donnees')
+        
+        def parse():
+            donnees_json = self.decode_donnees(donnees_raw)
+            if donnees_json is None:
+                # Pas mémorisé : l'avis complet (fetch_notice_fields) sera parsé sous la même clé
+                return (False, None), None
+            awards = self._parse_awards(donnees_json, url)
+            if awards is not None:
+                self._index_notice(idweb, fields, url, awards)
+            return (True, awards), len(donnees_raw) if isinstance(donnees_raw, str) else 0
+        
+        # L'URL fait partie de la clé : elle est recopiée dans chaque attributaire (url_source)
+        return self.flight.call(('awards', idweb, url), parse)
 
-            # --- Helper to access EformsExtension ---
-            # structure: ext:UBLExtensions -> ext:UBLExtension -> ext:ExtensionContent -> efext:EformsExtension
-            extension_root = root
-            try:
-                ubl_ext = root.get('ext:UBLExtensions', {}).get('ext:UBLExtension', {})
-                if isinstance(ubl_ext, list):
-                    ubl_ext = ubl_ext[0] # Take first extension if list
-                
-                content = ubl_ext.get('ext:ExtensionContent', {})
-                if 'efext:EformsExtension' in content:
-                    extension_root = content['efext:EformsExtension']
-            except Exception as e:
-                # print(f"DEBUG: Error accessing UBLExtensions: {e}")
-                pass
+    def _index_notice(self, idweb, fields, url, awards):
+        """Enregistre les attributions d'un avis dans l'index local (s'il est actif)"""
+        if self.index is None or not idweb:
+            return
+        try:
+            self.index.add_notice(idweb, awards, url, fields.get('dateparution'), fields.get('code_departement'))
+        except Exception as e:
+            log.warning("Erreur index local (avis %s): %s", idweb, e)
 
-            # --- 2. Indexation des Organisations (ID -> Nom) ---
-            orgs_map = {} # ORG-XXXX -> Nom, Email, Tel, Ville
+    def scrape_search_record(self, record, keywords):
+        """
+        Traite un enregistrement renvoyé par l'API de recherche.
+        Le champ 'donnees' du lot de résultats est parsé directement ; l'appel
+        unitaire (scrape_page) n'est fait que si ce champ est absent ou tronqué.
+        """
+        fields = record.get('fields', {})
+        idweb = fields.get('idweb')
+        notice_url = f"https://www.boamp.fr/pages/avis/?q=idweb:%22{idweb}%22"
+        
+        decoded, awards = self._structured_awards(idweb, fields, notice_url)
+        if not decoded:
+            return self.scrape_page(notice_url, keywords)
+        
+        # L'avis complet est déjà là : on l'enregistre pour les recherches suivantes
+        if self.cache is not None and self.use_cache:
+            self.cache.put('boamp', idweb, fields)
+        
+        if awards is None:
+            # Format inconnu : inutile de re-demander le même JSON, on passe au textuel
+            log.info("Passage en mode scraping textuel (moins précis) : %s", idweb)
+            awards = self._html_fallback_awards(notice_url, idweb)
+            self._index_notice(idweb, fields, notice_url, awards)
+        
+        results = merge_awards(awards, keywords)
+        for r in results: r['avis_id'] = idweb
+        return results
+
+    def _scrape_record_safe(self, record, keywords):
+        """Version protégée de scrape_search_record (une erreur ne doit pas arrêter le lot)"""
+        try:
+            return self.scrape_search_record(record, keywords)
+        except Exception as e:
+            log.warning("Erreur sur l'avis %s: %s", record['fields'].get('idweb'), e)
+            self.metrics.incr('notice_errors')
+            return []
+
+    def _map_records(self, executor, records, keywords, parse_pool=None, workers=1):
+        """
+        Traite un lot d'enregistrements, en séquentiel ou via le pool de threads
+        (workers: taille du pool, qui borne les tâches en vol à workers * 4).
+        Les résultats sont toujours rendus dans l'ordre des enregistrements.
+        """
+        if parse_pool is not None:
+            fn = lambda r: self._scrape_record_pipelined(r, keywords, parse_pool)
+        else:
+            fn = lambda r: self._scrape_record_safe(r, keywords)
+        if executor is None:
+            return (fn(r) for r in records)
+        return self._ordered_map(executor, fn, records, window=workers * 4)
+
+    def _ordered_map(self, executor, fn, items, window):
+        """
+        executor.map borné : au plus `window` tâches en vol (back-pressure),
+        résultats rendus dans l'ordre d'entrée.
+        """
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _scrape_record_pipelined(self, record, keywords, parse_pool):
+        """
+        Étape I/O (thread) : récupère le 'donnees' brut (enregistrement, cache ou API),
+        puis délègue décodage + parsing à l'étape CPU (pool de processus).
+        Le fallback HTML reste dans le thread (réseau).
+        """
+        fields = record.get('fields', {})
+        idweb = fields.get('idweb')
+        notice_url = f"https://www.boamp.fr/pages/avis/?q=idweb:%22{idweb}%22"
+        try:
+            strategy, results, awards = self._parse_in_pool(parse_pool, fields.get('donnees'), keywords, notice_url)
+            if strategy in ('missing', 'invalid'):
+                # Absent ou tronqué dans la recherche : on redemande l'avis complet (cache / API)
+                fields = self.fetch_notice_fields(idweb, 'boamp') or fields
+                strategy, results, awards = self._parse_in_pool(parse_pool, fields.get('donnees'), keywords, notice_url)
+            elif self.cache is not None and self.use_cache:
+                self.cache.put('boamp', idweb, fields)
+            self.metrics.incr(f'strategy_{strategy}')
+            if results is None:
+                log.info("Passage en mode scraping textuel (moins précis) : %s", idweb)
+                awards = self._html_fallback_awards(notice_url, idweb)
+                results = merge_awards(awards, keywords)
+            self._index_notice(idweb, fields, notice_url, awards)
+            for r in results: r['avis_id'] = idweb
+            return results
+        except Exception as e:
+            log.warning("Erreur sur l'avis %s: %s", idweb, e)
+            self.metrics.incr('notice_errors')
+            return []
+
+    def _parse_in_pool(self, parse_pool, donnees_raw, keywords, url):
+        """
+        Décodage + parsing de 'donnees' dans un processus ; (stratégie, entreprises ou None,
+        attributions si l'index local est actif)
+        """
+        if not donnees_raw:
+            return 'missing', None, None
+        try:
+            with self.metrics.timer('parse_process'):
+                return parse_pool.submit(parse_donnees_worker, donnees_raw, keywords.keywords, url,
+                                         self.json_projection, self.index is not None).result()
+        except BrokenProcessPool:
+            # Processus mort (mémoire...) : la recherche suivante repartira d'un pool neuf
+            with self._parse_pools_lock:
+                for size, pool in list(self._parse_pools.items()):
+                    if pool is parse_pool:
+                        del self._parse_pools[size]
+            raise
+
+    def text_of(self, node, default=None):
+        """Helper: valeur d'un noeud XML-to-JSON ({'#text': ...} ou valeur brute)"""
+        if isinstance(node, dict):
+            return node.get('#text', default)
+        return node if node is not None else default
+
+    def _eforms_extension(self, root):
+        """
+        Accès à l'EformsExtension.
+        structure: ext:UBLExtensions -> ext:UBLExtension -> ext:ExtensionContent -> efext:EformsExtension
+        """
+        try:
+            ubl_ext = root.get('ext:UBLExtensions', {}).get('ext:UBLExtension', {})
+            if isinstance(ubl_ext, list):
+                ubl_ext = ubl_ext[0] # Take first extension if list
             
-            # Orgs can be at root or in extension
-            organizations = extension_root.get('efac:Organizations', {}).get('efac:Organization', [])
-            if not organizations:
-                 organizations = root.get('efac:Organizations', {}).get('efac:Organization', [])
+            content = ubl_ext.get('ext:ExtensionContent', {})
+            if 'efext:EformsExtension' in content:
+                return content['efext:EformsExtension']
+        except Exception:
+            pass
+        return root
 
-            orgs_list = self.normalize_list(organizations)
+    def _index_eforms_lots(self, root):
+        """Index Lot ID -> {full_text, title}"""
+        lots_map = {}
+        for lot in self.normalize_list(root.get('cac:ProcurementProjectLot', [])):
+            lot_id = lot.get('cbc:ID', {}).get('#text')
+            proc_proj = lot.get('cac:ProcurementProject', {})
+            # Le titre peut être dans cbc:Name, parfois complété par cbc:Description
+            title = self.text_of(proc_proj.get('cbc:Name'), "")
+            desc = self.text_of(proc_proj.get('cbc:Description'), "")
+            lots_map[lot_id] = {
+                'full_text': f"{title} {desc}",
+                'title': title
+            }
+        return lots_map
 
+    def _index_eforms_orgs(self, root, extension_root, original_url):
+        """Index ORG-XXXX -> Nom, SIRET, Email, Tel, Ville"""
+        orgs_map = {}
+        
+        # Orgs can be at root or in extension
+        organizations = extension_root.get('efac:Organizations', {}).get('efac:Organization', [])
+        if not organizations:
+            organizations = root.get('efac:Organizations', {}).get('efac:Organization', [])
+        
+        for org in self.normalize_list(organizations):
+            company = org.get('efac:Company', {})
+            try:
+                # L'ID est souvent dans cac:PartyIdentification -> cbc:ID
+                org_id = company.get('cac:PartyIdentification', {}).get('cbc:ID', {}).get('#text')
+            except AttributeError:
+                continue
+            if not org_id: continue
             
-            for org in orgs_list:
-                company = org.get('efac:Company', {})
-                # ID
-                try:
-                   # L'ID est souvent dans cac:PartyIdentification -> cbc:ID
-                   party_id_node = company.get('cac:PartyIdentification', {}).get('cbc:ID', {})
-                   org_id = party_id_node.get('#text')
-                except: continue
-                
-                if not org_id: continue
+            contact = company.get('cac:Contact', {})
+            addr = company.get('cac:PostalAddress', {})
+            nom = self.text_of(company.get('cac:PartyName', {}).get('cbc:Name', {}))
+            orgs_map[org_id] = Company(
+                nom=nom.replace('\n', ' ').strip() if nom else nom, # Nettoyage nom
+                email=self.text_of(contact.get('cbc:ElectronicMail'), ""),
+                telephone=self.text_of(contact.get('cbc:Telephone'), ""),
+                ville=self.text_of(addr.get('cbc:CityName'), ""),
+                url_source=original_url,
+                # Identifiant légal (SIRET/SIREN pour les entreprises françaises) : clé de fusion entre avis
+                siret=self._eforms_company_id(company),
+            )
+        return orgs_map
 
-                # Nom
-                party_name = company.get('cac:PartyName', {}).get('cbc:Name', {})
-                org_name = party_name.get('#text') if isinstance(party_name, dict) else party_name
-                
-                # Contact
-                contact = company.get('cac:Contact', {})
-                email = contact.get('cbc:ElectronicMail', {}).get('#text', "") if isinstance(contact.get('cbc:ElectronicMail'), dict) else contact.get('cbc:ElectronicMail', "")
-                phone = contact.get('cbc:Telephone', {}).get('#text', "") if isinstance(contact.get('cbc:Telephone'), dict) else contact.get('cbc:Telephone', "")
-                
-                # Adresse
-                addr = company.get('cac:PostalAddress', {})
-                city = addr.get('cbc:CityName', {}).get('#text', "") if isinstance(addr.get('cbc:CityName'), dict) else addr.get('cbc:CityName', "")
-                
-                orgs_map[org_id] = {
-                    'nom': org_name, 
-                    'email': email, 
-                    'telephone': phone, 
-                    'ville': city,
-                    'url_source': original_url,
-                    'mots_cles_matches': '' # Sera rempli plus tard
-                }
-
-            # --- 3. Indexation des TenderingParties (TPA-XXXX -> Liste d'ORG-XXXX) ---
+    def _eforms_company_id(self, company):
+        """SIRET/SIREN de cac:PartyLegalEntity/cbc:CompanyID ('' si absent ou non français)"""
+        for entity in self.normalize_list(company.get('cac:PartyLegalEntity', [])):
+            if isinstance(entity, dict):
+                siret = normalize_siret(self.text_of(entity.get('cbc:CompanyID'), ""))
+                if siret:
+                    return siret
+        return ''
+
+    def _index_eforms_tendering_parties(self, extension_root, notice_result):
+        """Index TPA-XXXX -> [ORG-XXXX, ...] (EformsExtension, sinon NoticeResult)"""
+        tpa_source = extension_root.get('efac:TenderingParty', [])
+        if not tpa_source:
+            tpa_source = notice_result.get('efac:TenderingParty', [])
+        
+        tpa_map = {}
+        for tpa in self.normalize_list(tpa_source):
+            tpa_id = tpa.get('cbc:ID', {}).get('#text')
+            org_ids = []
+            for t in self.normalize_list(tpa.get('efac:Tenderer', [])):
+                oid = t.get('cbc:ID', {}).get('#text')
+                if oid: org_ids.append(oid)
+            tpa_map[tpa_id] = org_ids
+        return tpa_map
+
+    def _index_eforms_tenders(self, notice_result):
+        """Index TEN-XXXX -> TPA-XXXX (LotTender de NoticeResult)"""
+        tender_map = {}
+        for tender in self.normalize_list(notice_result.get('efac:LotTender', [])):
+            tid = self.text_of(tender.get('cbc:ID', {}))
+            if tid is None or tid in tender_map:
+                continue # Première occurrence gagnante, comme l'ancien parcours linéaire
+            tender_map[tid] = self.text_of(tender.get('efac:TenderingParty', {}).get('cbc:ID', {}))
+        return tender_map
+
+    def parse_structured_data(self, donnees_raw, keywords, original_url):
+        """
+        Analyse le JSON complexe EFORMS pour lier Lots -> Mots-clés -> Vainqueurs.
+        Chaque bloc (lots, organisations, TPA, offres) est indexé une seule fois,
+        puis les LotResult sont joints par dictionnaire : coût linéaire en taille d'avis.
+        """
+        return merge_awards(self._eforms_awards(donnees_raw, original_url), keywords)
+
+    def _eforms_awards(self, donnees_raw, original_url):
+        """Lots attribués d'un avis EFORMS, sans filtre : [Lot(titre, (texte du lot,), [Company])]"""
+        awards = []
+        try:
+            if isinstance(donnees_raw, str):
+                donnees = boamp_json.loads(donnees_raw)
+            else:
+                donnees = donnees_raw
+            
+            root = donnees.get('EFORMS', {}).get('ContractAwardNotice', {})
+            if not root:
+                return []
+
+            extension_root = self._eforms_extension(root)
             # TenderingParty est souvent dans EformsExtension, parfois dans NoticeResult
             notice_result = extension_root.get('efac:NoticeResult', {})
-            tpa_map = {} # TPA-ID -> [ORG-ID, ...]
-            
-            # Chercher dans ExtensionRoot PUIS NoticeResult
-            tpa_source = extension_root.get('efac:TenderingParty', [])
-            if not tpa_source:
-                tpa_source = notice_result.get('efac:TenderingParty', [])
-            
-            tpa_list = self.normalize_list(tpa_source)
-            for tpa in tpa_list:
-                tpa_id = tpa.get('cbc:ID', {}).get('#text')
-                
-                tenderers = self.normalize_list(tpa.get('efac:Tenderer', []))
-                org_ids = []
-                for t in tenderers:
-                     oid = t.get('cbc:ID', {}).get('#text')
-                     if oid: org_ids.append(oid)
-                
-                tpa_map[tpa_id] = org_ids
 
-            # --- 4. Indexation des Tenders (Offres) (TEN-XXXX -> TPA-XXXX) ---
-             # On parcourt les LotResult pour lier Lot -> (Tender) -> TPA -> Org
-            lot_results = self.normalize_list(notice_result.get('efac:LotResult', []))
-            
-            # On charge la liste de TOUS les Tenders (LotTender dans NoticeResult)
-            # C'est là qu'on a le lien Tender -> TenderingParty
-            all_tenders_list = self.normalize_list(notice_result.get('efac:LotTender', []))
-            
-            found_companies = {} # Key: Nom -> Data (pour dédoublonnage)
+            # --- 1. Indexation ---
+            lots_map = self._index_eforms_lots(root)                                      # LOT -> texte
+            orgs_map = self._index_eforms_orgs(root, extension_root, original_url)        # ORG -> contact
+            tpa_map = self._index_eforms_tendering_parties(extension_root, notice_result) # TPA -> [ORG]
+            tender_map = self._index_eforms_tenders(notice_result)                        # TEN -> TPA
 
-            for lr in lot_results:
+            # --- 2. Jointure LotResult -> Lot -> (Tender) -> TPA -> Org ---
+            for lr in self.normalize_list(notice_result.get('efac:LotResult', [])):
                 # Check status
                 status = lr.get('cbc:TenderResultCode', {}).get('#text')
                 if status != 'selec-w': # On ne veut que les gagnants
                     continue
                 
                 # Get Lot ID
-                tender_lot = lr.get('efac:TenderLot', {})
-                lot_id = tender_lot.get('cbc:ID', {}).get('#text')
-                
-                # Check keywords in Lot
+                lot_id = lr.get('efac:TenderLot', {}).get('cbc:ID', {}).get('#text')
                 lot_info = lots_map.get(lot_id, {})
-                if isinstance(lot_info, dict):
-                    lot_text = lot_info.get('full_text', "")
-                    lot_title = lot_info.get('title', "Lot inconnu")
-                else:
-                    lot_text = str(lot_info)
-                    lot_title = "Lot inconnu"
-
-                matched_keywords = []
-                if keywords:
-                    matched_keywords = [k for k in keywords if k.lower() in lot_text.lower()]
-                    
-                    if not matched_keywords:
-                        continue 
 
-                # Get Tender ID from LotResult
-                # Dans LotResult, c'est juste une référence à l'ID
+                # Get Tender ID from LotResult (juste une référence à l'ID)
                 lot_tender_ref = lr.get('efac:LotTender', {})
                 # Parfois c'est une liste si plusieurs tenders (bizarre pour un LotResult unique mais sait-on jamais)
                 if isinstance(lot_tender_ref, list) and lot_tender_ref:
                     lot_tender_ref = lot_tender_ref[0]
                 
                 tender_id = lot_tender_ref.get('cbc:ID', {}).get('#text') if isinstance(lot_tender_ref, dict) else None
-                
                 if not tender_id: continue
 
-                # Find Tendering Party for this Tender ID using the all_tenders_list
-                target_tpa_id = None
-                for tender in all_tenders_list:
-                    tid_node = tender.get('cbc:ID', {})
-                    tid = tid_node.get('#text') if isinstance(tid_node, dict) else tid_node
-                    
-                    if tid == tender_id:
-                        # Ici efac:TenderingParty est un dict avec cbc:ID
-                        tpa_node = tender.get('efac:TenderingParty', {}).get('cbc:ID', {})
-                        target_tpa_id = tpa_node.get('#text') if isinstance(tpa_node, dict) else tpa_node
-                        break
-                
-                if target_tpa_id and target_tpa_id in tpa_map:
-                    winning_orgs = tpa_map[target_tpa_id]
-                    for oid in winning_orgs:
-                        if oid in orgs_map:
-                            comp_data = orgs_map[oid].copy()
-                            # On ajoute les mots clés et le titre du lot
-                            comp_data['mots_cles_matches'] = ", ".join(matched_keywords)
-                            comp_data['lot_title'] = lot_title
-                            
-                            # Nettoyage nom
-                            if comp_data['nom']:
-                                comp_data['nom'] = comp_data['nom'].replace('\n', ' ').strip()
-
-                            # Clé unique pour éviter doublons (si gagne plusieurs lots)
-                            # On peut merger les mots clés si doublon
-                            if comp_data['nom'] in found_companies:
-                                existing = found_companies[comp_data['nom']]
-                                # Merge keywords
-                                old_k = set(existing['mots_cles_matches'].split(', '))
-                                new_k = set(matched_keywords)
-                                merged = old_k.union(new_k)
-                                existing['mots_cles_matches'] = ", ".join(list(merged))
-                                
-                                # Merge lot titles
-                                if lot_title not in existing.get('lot_title', ''):
-                                    existing['lot_title'] = existing.get('lot_title', '') + f" | {lot_title}"
-                            else:
-                                found_companies[comp_data['nom']] = comp_data
-                                print(f"✅ Trouvé (Lot {lot_id}) : {comp_data['nom']}")
-
-            return list(found_companies.values())
+                target_tpa_id = tender_map.get(tender_id)
+                # Les attributaires sont partagés entre lots (pas de copie)
+                winners = [orgs_map[oid] for oid in tpa_map.get(target_tpa_id, []) if oid in orgs_map] if target_tpa_id else []
+                if winners:
+                    awards.append(Lot(lot_info.get('title', "Lot inconnu"), (lot_info.get('full_text', ""),), winners))
 
         except Exception as e:
-            print(f"⚠️ Erreur parsing JSON: {e}")
-            import traceback
-            traceback.print_exc()
+            log.warning("Erreur parsing JSON: %s", e, exc_info=log.isEnabledFor(logging.DEBUG))
             return []
+        return awards
 
-            return list(found_companies.values())
+    def _fnsimple_lots(self, text_block):
+        """
+        Découpe 'attributionMarche' en un seul passage du tokenizer.
+        Rend (titre du lot, texte du lot, texte avant le 1er marché, [texte de chaque marché]) ;
+        le texte qui précède le premier en-tête forme un lot sans titre.
+        """
+        lot_title, lot_start, intro_end, marches = "", 0, None, []
+        marche_start = None
+        for token in FNSIMPLE_TOKEN_RE.finditer(text_block):
+            if marche_start is not None:
+                marches.append(text_block[marche_start:token.start()])
+                marche_start = None
+            if token.lastgroup == 'lot':
+                # intro_end vaut 0 si le texte commence par "Marché n°" (lot sans en-tête)
+                intro = text_block[lot_start:intro_end if intro_end is not None else token.start()]
+                yield lot_title, text_block[lot_start:token.start()], intro, marches
+                lot_title, lot_start, intro_end, marches = token.group().strip(), token.end(), None, []
+            else:
+                if intro_end is None:
+                    intro_end = token.start()
+                marche_start = token.end()
+        if marche_start is not None:
+            marches.append(text_block[marche_start:])
+        intro = text_block[lot_start:intro_end if intro_end is not None else len(text_block)]
+        yield lot_title, text_block[lot_start:], intro, marches
 
-        except Exception as e:
-            print(f"⚠️ Erreur parsing JSON: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+    def _split_company_line(self, company_line):
+        """Ligne attributaire "Nom, adresse, CP Ville" -> (nom, ville)"""
+        tokens = company_line.split(',')
+        nom = tokens[0].strip()
+        # Ville/CP (souvent le dernier token avec un code postal 5 chiffres)
+        cp_match = FNSIMPLE_CP_RE.search(company_line)
+        if cp_match:
+            return nom, cp_match.group(0)
+        return nom, tokens[-1].strip() if len(tokens) > 1 else ""
 
     def parse_fnsimple_data(self, donnees, keywords, original_url):
         """
         Parser pour le format 'FNSimple' (Ancien format BOAMP encore très utilisé).
         Les données sont dans un bloc de texte semi-structuré dans:
         root['FNSimple']['attribution']['attributionMarche']
+        Chaque "Marché n°" d'un lot donne un attributaire (lots multi-attributaires) ;
+        les marchés infructueux sont ignorés.
         """
-        results = []
+        return merge_awards(self._fnsimple_awards(donnees, original_url), keywords)
+
+    def _fnsimple_awards(self, donnees, original_url):
+        """
+        Lots attribués d'un avis FNSimple, sans filtre : [Lot(titre, (titre, texte du lot), [Company])].
+        Les mots-clés sont cherchés dans le titre du lot, sinon dans son contenu.
+        """
+        awards = []
         try:
             attribution = donnees.get('FNSimple', {}).get('attribution', {})
             text_block = attribution.get('attributionMarche', "")
             
             if not text_block: return []
             
-            # Découpage par Lots (Pattern: "Lot N° XX")
-            # On utilise re.split en gardant le délimiteur pour savoir quel lot c'est
-            import re
-            parts = re.split(r'(Lot\s*N°\s*\d+\s*-\s*[^\n]+)', text_block)
-            
-            # parts[0] is usually empty or prelude header
-            # parts[1] is header Lot 1, parts[2] is content Lot 1, etc.
-            
-            current_lot_title = ""
-            
-            for part in parts:
-                part = part.strip()
-                if not part: continue
-                
-                # Check header (Lot title)
-                if part.lower().startswith("lot n°"):
-                    current_lot_title = part
+            for lot_title, content, intro, marches in self._fnsimple_lots(text_block):
+                if not marches:
                     continue
+                if "infructueux" in intro.lower():
+                    continue # Lot entier déclaré infructueux
                 
-                # Content block
-                content = part
-                
-                # Keyword matching on Lot Title
-                matched_keywords = []
-                if keywords:
-                    matched_keywords = [k for k in keywords if k.lower() in current_lot_title.lower()]
-                    if not matched_keywords: 
-                        # Try content too just in case
-                        matched_keywords = [k for k in keywords if k.lower() in content.lower()]
-                    
-                    if not matched_keywords:
-                        continue # Not relevant
-                    
-                # Extraction Entreprise
-                # Pattern attendu: 
-                # Marché n° : XXXXX
-                # [Nom Entreprise], [Adresse], [CodePostal] [Ville]
-                # Montant ...
-                
-                # On cherche la ligne après "Marché n° :"
-                market_ref_match = re.search(r'Marché\s*n°\s*:\s*[^\n]+', content, re.IGNORECASE)
-                if market_ref_match:
-                    start_idx = market_ref_match.end()
-                    # On prend le texte suivant jusqu'au prochain saut de ligne ou "Montant"
-                    # Souvent: \nNom, Adr, CP Ville\n
-                    remainder = content[start_idx:].strip()
-                    lines = remainder.split('\n')
+                winners = []
+                for marche in marches:
+                    # La ligne attributaire suit la référence du marché : Nom, Adr, CP Ville
+                    company_line = marche.strip().partition('\n')[0].strip()
+                    # Nettoyage si "Montant" est sur la même ligne
+                    if "Montant" in company_line:
+                        company_line = company_line.split("Montant")[0].strip()
+                    if not company_line or "infructueux" in marche.lower():
+                        continue
                     
-                    if lines:
-                        company_line = lines[0].strip()
-                        
-                        # Nettoyage si on a chopé "Montant" par erreur (si pas de saut de ligne)
-                        if "Montant" in company_line:
-                            company_line = company_line.split("Montant")[0].strip()
-                            
-                        # Si vide ou infructueux
-                        if not company_line or "infructueux" in content.lower():
-                            continue
-
-                        # Parsing Adresse (CSV like: Nom, Adr, CP Ville)
-                        # Souvent séparé par des virgules
-                        tokens = company_line.split(',')
-                        nom = tokens[0].strip()
-                        
-                        # Ville/CP (souvent le dernier token avec un code postal 5 chiffres)
-                        ville = ""
-                        cp_match = re.search(r'\b\d{5}\b\s*(.+)', company_line)
-                        if cp_match:
-                            ville = f"{cp_match.group(0)}"
-                        else:
-                             # Try last token
-                             if len(tokens) > 1: ville = tokens[-1].strip()
-
-                        # Check deduplication
-                        existing_entry = None
-                        for r in results:
-                            if r['nom'] == nom:
-                                existing_entry = r
-                                break
-                        
-                        if existing_entry:
-                            # Merge keywords
-                            current_k = set(existing_entry['mots_cles_matches'].split(', ')) if existing_entry['mots_cles_matches'] else set()
-                            new_k = set(matched_keywords)
-                            if '' in current_k: current_k.remove('')
-                            existing_entry['mots_cles_matches'] = ", ".join(list(current_k.union(new_k)))
-                            
-                            # Merge lot titles
-                            if current_lot_title not in existing_entry.get('lot_title', ''):
-                                existing_entry['lot_title'] = existing_entry.get('lot_title', '') + f" | {current_lot_title}"
-                        else:
-                            results.append({
-                                'nom': nom,
-                                'lot_title': current_lot_title,
-                                'email': '', # Souvent absent de ce format texte
-                                'telephone': '',
-                                'ville': ville,
-                                'url_source': original_url,
-                                'mots_cles_matches': ", ".join(matched_keywords)
-                            })
-                            print(f"✅ Trouvé (FNSimple) : {nom}")
+                    nom, ville = self._split_company_line(company_line)
+                    # Email et téléphone souvent absents de ce format texte
+                    winners.append(Company(nom, ville=ville, url_source=original_url))
+                if winners:
+                    awards.append(Lot(lot_title, (lot_title, content), winners))
 
         except Exception as e:
-            print(f"⚠️ Erreur parsing FNSimple: {e}")
+            log.warning("Erreur parsing FNSimple: %s", e)
             
-        return results
+        return awards
 
     def scrape_html_fallback(self, url, boamp_id, keywords):
-        """Fallback sur l'ancienne méthode (HTML Textuel)"""
-        html_content = None
-        # ... reprise du code d'avant pour le fetch HTML via API ou Direct ...
+        """
+        Fallback textuel : avis HTML du dataset boamp-html (la page boamp.fr elle-même est
+        rendue en JavaScript, inutile de la télécharger). Sans avis HTML, ou sans bloc
+        attributaire/titulaire, on ne construit aucun DOM : pas de résultat possible.
+        """
+        return merge_awards(self._html_fallback_awards(url, boamp_id), keywords)
+
+    def _html_fallback_awards(self, url, boamp_id):
+        """Attributions lues dans l'avis HTML (voir scrape_html_fallback)"""
+        self.metrics.incr('strategy_fallback')
+        if not boamp_id:
+            self.metrics.incr('html_fallback_skipped')
+            return []
         try:
-            if boamp_id:
-                api_url = f"https://boamp-datadila.opendatasoft.com/api/records/1.0/search/?q=idweb:%22{boamp_id}%22&rows=1&dataset=boamp-html&timezone=Europe%2FBerlin&lang=fr"
-                resp = self.session.get(api_url, timeout=10)
-                if resp.status_code == 200:
-                    d = resp.json()
-                    if d.get('records'):
-                        html_content = d['records'][0]['fields'].get('html')
-        except: pass
-
-        if not html_content:
-             try:
-                 html_content = self.session.get(url).content
-             except: return []
-
-        soup = BeautifulSoup(html_content, 'html.parser')
-        text_content = soup.get_text()
-        
-        # ... logic de regex ...
-        # Copier coller simplifé de l'ancienne logique
-        # Pour faire court, je vais juste renvoyer [] si structuré échoue pour forcer l'usage structuré
-        # ou remettre le parsing regex si vraiment nécessaire.
-        # Vu la demande "Trop d'entreprises", le textuel est la cause.
-        # Je vais remettre un scraping regex BEAUCOUP plus strict.
-        
-        entreprises = []
-        # Pattern strict: Keyword Voisin de "Attributaire" ou "Titulaire"
-        # C'est trop complexe à faire en regex pure, assumons que le JSON marche à 99% pour les avis récents.
-        # Si JSON échoue, on renvoie rien pour éviter le bruit, ou on prévient.
+            html_content = (self.fetch_notice_fields(boamp_id, 'boamp-html') or {}).get('html')
+        except Exception as e:
+            log.warning("Erreur API avis HTML %s: %s", boamp_id, e)
+            html_content = None
         
-        return []
+        if not html_content or not HTML_LABEL_RE.search(html_content):
+            self.metrics.incr('html_fallback_skipped')
+            return []
+        
+        with self.metrics.timer('html_fallback'):
+            return self._html_awards(html_content, url)
+
+    def _html_text(self, element):
+        return " ".join(element.text_content().split())
+
+    def _html_block(self, element):
+        """Bloc (paragraphe, cellule, item...) qui porte le libellé attributaire : l'élément lui-même ou un ancêtre"""
+        for block in chain([element], element.iterancestors()):
+            if block.tag in HTML_BLOCKS:
+                return block
+        return element
 
-    def scrape_search_results(self, search_url, keywords, max_results=50, progress_callback=None):
+    def _html_lot_title(self, block):
+        """Titre de lot le plus proche au-dessus du bloc (h1-h6 contenant 'Lot')"""
+        for heading in block.itersiblings(preceding=True):
+            if heading.tag in HTML_HEADINGS:
+                return self._html_text(heading)
+        for heading in block.xpath("preceding::*[self::h1 or self::h2 or self::h3 or self::h4 or self::h5 or self::h6]"
+                                   "[contains(translate(., 'LOT', 'lot'), 'lot')][1]"):
+            return self._html_text(heading)
+        return ""
+
+    def _html_section_text(self, block):
+        """Texte du bloc et des blocs suivants, jusqu'au prochain titre ou attributaire"""
+        parts = [self._html_text(block)]
+        for sibling in block.itersiblings():
+            if not isinstance(sibling.tag, str) or sibling.tag in HTML_HEADINGS:
+                break
+            text = self._html_text(sibling)
+            if HTML_LABEL_RE.search(text):
+                break
+            parts.append(text)
+        return "\n".join(parts)
+
+    def parse_html_notice(self, html_content, keywords, original_url):
         """
-        Scrape récursivement tous les avis d'une page de recherche BOAMP avec pagination.
+        Extraction ciblée (lxml + XPath) des attributaires / titulaires d'un avis HTML :
+        le nom et la ville viennent de la ligne qui suit le libellé, le lot du titre
+        qui précède, email et téléphone du reste de la section.
         """
-        all_results = []
+        return merge_awards(self._html_awards(html_content, original_url), keywords)
+
+    def _html_awards(self, html_content, original_url):
+        """Lots attribués d'un avis HTML, sans filtre : [Lot(titre, (titre, texte de la section), [Company])]"""
+        awards = []
+        try:
+            root = lxml_html.fromstring(html_content)
+        except (ValueError, etree.ParserError) as e:
+            log.warning("Avis HTML illisible: %s", e)
+            return []
+        
+        for label in root.xpath(HTML_LABEL_XPATH, namespaces={'re': 'http://exslt.org/regular-expressions'}):
+            block = self._html_block(label)
+            block_text = self._html_text(block)
+            label_match = HTML_LABEL_RE.search(block_text)
+            if not label_match:
+                continue
+            company_line = block_text[label_match.end():]
+            if not company_line:
+                # Libellé seul dans sa cellule (<th>/<dt>) : la valeur est dans la suivante
+                following = block.getnext()
+                company_line = self._html_text(following) if following is not None else ""
+            company_line = company_line.split("Montant")[0].strip()
+            if not company_line or "infructueux" in company_line.lower():
+                continue
+            
+            lot_title = self._html_lot_title(block)
+            section_text = self._html_section_text(block)
+            nom, ville = self._split_company_line(company_line)
+            email = EMAIL_RE.search(section_text)
+            phone = PHONE_RE.search(section_text)
+            awards.append(Lot(lot_title, (lot_title, section_text), [Company(
+                nom,
+                email=email.group(0) if email else '',
+                telephone=phone.group(0) if phone else '',
+                ville=ville,
+                url_source=original_url,
+            )]))
         
-        from urllib.parse import urlparse, parse_qs
+        return awards
+
+    def scrape_search_results(self, search_url, keywords, max_results=50, progress_callback=None, workers=1,
+                              bulk=False, parse_workers=0, plan=None):
+        """
+        Scrape récursivement tous les avis d'une page de recherche BOAMP avec pagination.
+        Version liste de iter_search_results (mêmes paramètres, mêmes résultats).
+        """
+        return list(self.iter_search_results(search_url, keywords, max_results, progress_callback, workers,
+                                             bulk=bulk, parse_workers=parse_workers, plan=plan))
+
+    def export_search_results(self, search_url, keywords, sink, max_results=50, progress_callback=None, workers=1,
+                              bulk=False, parse_workers=0, plan=None):
+        """
+        Écrit les résultats dans un sink (voir boamp_export.open_sink) pendant l'extraction.
+        Les avis déjà présents dans un export repris (sink.done_notices) ne sont pas retraités.
+        Retourne le nombre total de lignes du fichier.
+        """
+        notices = self.iter_search_notices(search_url, keywords, max_results, progress_callback, workers,
+                                           bulk=bulk, skip_record=self._skip_ids(sink.done_notices),
+                                           parse_workers=parse_workers, plan=plan)
+        for _, page_results in notices:
+            sink.write_rows(page_results)
+        return sink.count
+
+    def merge_search_results(self, search_url, keywords, store=None, max_results=50, progress_callback=None,
+                             workers=1, bulk=False, parse_workers=0, plan=None):
+        """
+        Ajoute les résultats d'une recherche à un boamp_results.CompanyStore (créé si absent)
+        et le retourne. Plusieurs recherches peuvent alimenter le même store : un avis déjà
+        vu n'est ni re-téléchargé ni re-parsé, et une entreprise retenue sur plusieurs avis
+        est fusionnée (SIRET, sinon nom + ville). Le store suppose un même jeu de mots-clés.
+        """
+        store = store if store is not None else CompanyStore()
+        notices = self.iter_search_notices(search_url, keywords, max_results, progress_callback, workers,
+                                           bulk=bulk, parse_workers=parse_workers, plan=plan,
+                                           skip_record=lambda record: store.has_notice(record['fields']['idweb']))
+        for record, page_results in notices:
+            store.add_notice(record['fields']['idweb'], page_results)
+        return store
+
+    def harvest_search_results(self, search_url, max_results=1000, progress_callback=None, workers=1,
+                               bulk=False, parse_workers=0, refresh=False, plan=None):
+        """
+        Remplit l'index local (self.index, boamp_index.LotIndex) avec tous les lots attribués
+        des avis d'une recherche, sans filtre de mots-clés. Les avis déjà indexés sont sautés
+        (refresh=True pour les reparser). Retourne le nombre d'avis indexés par cet appel.
+        """
+        if self.index is None:
+            raise ValueError("harvest_search_results nécessite BOAMPScraper(index=LotIndex())")
+        skip = None if refresh else (lambda record: self.index.has_notice(record['fields']['idweb']))
+        notices = self.iter_search_notices(search_url, [], max_results, progress_callback, workers,
+                                           bulk=bulk, skip_record=skip, parse_workers=parse_workers, plan=plan)
+        return sum(1 for _ in notices)
+
+    def build_search_params(self, search_url):
+        """Traduit une URL de recherche boamp.fr en paramètres de l'API opendatasoft (q / refine.*)"""
         parsed = urlparse(search_url)
         params = parse_qs(parsed.query)
         
@@ -521,102 +858,657 @@ class BOAMPScraper:
         
         # Force descending sort no matter what user/URL says
         api_params['sort'] = '-dateparution'
+        return api_params
+
+    def _window_params(self, api_params, start, end):
+        """Restreint la requête à la fenêtre de publication [start, end["""
+        params = dict(api_params)
+        date_filter = f'dateparution>="{start.isoformat()}" AND dateparution<"{end.isoformat()}"'
+        base_q = api_params.get('q', '')
+        params['q'] = f"({base_q}) AND {date_filter}" if base_q else date_filter
+        return params
+
+    def _search_api(self, params, bulk=False):
+        """
+        Un appel à l'API : search (JSON {nhits, records}) ou download en mode bulk
+        (liste complète des enregistrements). Retourne None en cas d'erreur HTTP.
+        Les recherches simultanées aux mêmes paramètres partagent un seul appel (self.flight) :
+        la réponse décodée est commune, à ne pas modifier.
+        """
+        return self.flight.call(('search', bulk, _params_key(params)), lambda: self._search_api_call(params, bulk))
+
+    def _search_api_call(self, params, bulk):
+        """_search_api sans fusion des appels : (réponse, taille pour self.flight)"""
+        url = self.api_download_url if bulk else self.api_search_url
+        with self.metrics.timer('search_download' if bulk else 'search_api'):
+            resp = self.session.get(url, params=params, timeout=120 if bulk else 15)
+            if resp.status_code != 200:
+                # Les erreurs transitoires (429/5xx) ont déjà été retentées par la session
+                log.error("Erreur API Recherche: %s", resp.status_code)
+                return None, None
+            return boamp_json.loads(resp.content), len(resp.content)
+
+    def count_hits(self, api_params):
+        """Nombre d'avis correspondant à la requête (nhits, sans télécharger d'enregistrement)"""
+        return _nhits(self._search_api({**api_params, 'rows': 0, 'start': 0}))
+
+    def plan_search(self, search_url, max_results=50, bulk=False, since=None, shard_size=DEFAULT_SHARD_SIZE,
+                    shard_workers=DEFAULT_SHARD_WORKERS, by='auto', page_size=100):
+        """
+        Planifie une recherche avant de la lancer (boamp_plan.SearchPlan) : un seul appel à l'API
+        lit nhits, les facettes dateparution / code_departement et un enregistrement témoin.
+        Les avis sont découpés en tranches d'environ shard_size avis, récupérées en parallèle
+        (shard_workers) : par période de publication, ou par groupes de départements
+        (by='departement' ; by='auto' s'y résout quand un seul jour dépasse une fenêtre et que
+        tous les avis sont demandés : sous nhits, les tranches par département ne rendraient
+        pas les mêmes avis qu'un parcours séquentiel).
+        Le coût (requêtes, octets, durée) est estimé d'après la latence de cet appel et le
+        débit de la session. Retourne None en cas d'erreur de l'API (HTTP ou réseau).
+        """
+        api_params = self.build_search_params(search_url)
+        floor = since or MIN_DATE
+        ceiling = date.today() + timedelta(days=1)
+        params = self._window_params(api_params, floor, ceiling) if since else api_params
+        started = time.perf_counter()
+        try:
+            data = self._search_api({**params, 'rows': 1, 'start': 0, 'facet': list(FACETS)})
+        except requests.RequestException as e:
+            log.error("Plan impossible, API injoignable : %s", e)
+            return None
+        latency = time.perf_counter() - started
+        if data is None:
+            return None
         
-        api_search_url = "https://boamp-datadila.opendatasoft.com/api/records/1.0/search/"
+        nhits = data.get('nhits', 0)
+        notices = min(nhits, max_results)
+        facets = parse_facets(data)
+        window_cap = BULK_WINDOW_SIZE if bulk else PAGED_WINDOW_SIZE
         
-        processed_count = 0
-        current_start = 0
+        if by == 'auto':
+            # Un jour plus gros qu'une fenêtre ne se découpe plus par date
+            crowded_day = any(end - start <= timedelta(days=1) and count > window_cap
+                              for (start, end), count in facets['dateparution'].items())
+            refined = 'refine.code_departement' in api_params or 'code_departement' in api_params.get('q', '')
+            by = ('departement' if crowded_day and facets['code_departement'] and not refined and max_results >= nhits
+                  else 'date')
         
-        print(f"🌍 Recherche Target: {max_results} avis")
-        print(f"DEBUG API Params: {api_params}")
+        if not notices:
+            shards = []
+        elif by == 'departement':
+            shards = departement_shards(facets['code_departement'], math.ceil(notices / shard_size))
+            for shard in shards:
+                # Ordre des tranches sans rapport avec les dates : chacune peut fournir max_results avis
+                shard.start, shard.limit = since, max_results
+        else:
+            shards = date_shards(facets['dateparution'], notices, floor, ceiling, shard_size)
+            planned = 0
+            for shard in shards:
+                # Les tranches précédentes fournissent déjà ~planned avis (ordre de l'extraction)
+                shard.limit = max(1, max_results - planned)
+                planned += shard.estimate
         
-        # Stratégie : On force la recherche année par année (2026, 2025...)
-        # car le tri par date de l'API est souvent défaillant.
-        # Les IDs BOAMP commencent par l'année (ex: 26-12345)
-        target_years = ['26', '25', '24'] 
-        base_q = api_params.get('q', '')
+        records = data.get('records') or []
+        record_bytes = len(json.dumps(records[0], ensure_ascii=False).encode('utf-8')) if records else 0
+        limiter = getattr(self.session, 'limiter', None)
+        requests_count, size, seconds = estimate_cost(
+            shards, bulk, page_size, window_cap, record_bytes, latency, limiter.rate if limiter else None, shard_workers
+        )
+        plan = SearchPlan(api_params, nhits, max_results, facets, shards, by, bulk, shard_workers,
+                          requests_count, size, seconds)
+        log.info("Plan : %s", plan.summary())
+        return plan
+
+    def _iter_plan_records(self, plan, limit, page_size=100, buffered_pages=SHARD_BUFFER_PAGES):
+        """
+        Lots d'enregistrements d'un SearchPlan, rendus dans l'ordre du plan : jusqu'à
+        plan.shard_workers tranches récupérées en parallèle, chacune page par page à travers
+        une file bornée (buffered_pages) ; la mémoire ne dépend pas de la taille des tranches.
+        Une erreur dans une tranche est relevée quand son tour arrive.
+        """
+        stop = threading.Event()
         
-        for year in target_years:
-            if processed_count >= max_results: break
-            
-            print(f"📅 Analyse de l'année 20{year} (Prefix ID {year}-)...")
-            
-            # Reset pagination pour cette année
-            current_start = 0
-            year_finished = False
-            
-            while not year_finished and processed_count < max_results:
-                # Batch size
-                batch_size = min(100, max_results - processed_count)
-                api_params['rows'] = batch_size
-                api_params['start'] = current_start
-                
-                # Injection du filtre ID Année
-                year_filter = f"idweb:{year}*"
-                if base_q:
-                    # On combine avec les filtres existants (ex: Département + Année)
-                    api_params['q'] = f"({base_q}) AND {year_filter}"
-                else:
-                    api_params['q'] = year_filter
-                
+        def put(pages, item):
+            # Ne bloque pas indéfiniment si le consommateur abandonne l'extraction
+            while not stop.is_set():
                 try:
-                    # print(f"📡 Fetching batch {year}: start={current_start}")
-                    resp = self.session.get(api_search_url, params=api_params, timeout=15)
-                    if resp.status_code != 200:
-                        print(f"❌ Erreur API Recherche: {resp.status_code}")
-                        year_finished = True
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def fetch(shard, pages):
+            log.info("Tranche %s (~%s avis)...", shard.label(), shard.estimate)
+            try:
+                for records in self.iter_search_records(
+                    shard.params(plan.api_params), limit=min(limit, shard.limit or limit), bulk=plan.bulk,
+                    page_size=page_size, since=shard.start, until=shard.end
+                ):
+                    if not put(pages, records):
+                        return
+            except Exception as e:
+                put(pages, e)
+                return
+            put(pages, _SHARD_DONE)
+        
+        workers = max(1, plan.shard_workers)
+        shard_pool = ThreadPoolExecutor(max_workers=workers)
+        shards = iter(plan.shards)
+        in_flight = deque()
+        
+        def submit():
+            shard = next(shards, None)
+            if shard is not None:
+                pages = queue.Queue(maxsize=max(1, buffered_pages))
+                shard_pool.submit(fetch, shard, pages)
+                in_flight.append(pages)
+        
+        try:
+            for _ in range(workers):
+                submit()
+            while in_flight:
+                pages = in_flight.popleft()
+                while True:
+                    item = pages.get()
+                    if item is _SHARD_DONE:
                         break
-                    
-                    data = resp.json()
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+                submit() # Tranche suivante dès qu'une tranche est rendue en entier
+        finally:
+            stop.set()
+            shard_pool.shutdown(wait=True, cancel_futures=True)
+
+    def iter_search_records(self, api_params, limit=50, bulk=False, page_size=100, window_days=31, since=None,
+                            until=None):
+        """
+        Générateur de lots d'enregistrements couvrant toute la recherche, par fenêtres
+        de dates de publication (de la plus récente à la plus ancienne).
+        - Les fenêtres s'adaptent : coupées en deux si elles dépassent la profondeur
+          de pagination de l'API, élargies quand elles sont peu remplies.
+        - En mode bulk, chaque fenêtre est récupérée en un seul appel à l'endpoint
+          download (au lieu de pages de 100 via start=).
+        On s'arrête quand tous les nhits de la requête ont été vus ou que limit est atteint.
+        since: date de publication minimale (synchronisation incrémentale).
+        until: date de publication maximale, exclue (tranche d'un SearchPlan).
+        """
+        walk = self._search_windows(api_params, limit, bulk, page_size, window_days, since, until)
+        try:
+            step = next(walk)
+            while True:
+                if step[0] == 'records':
+                    yield step[1]
+                    step = walk.send(None)
+                else:
+                    step = walk.send(self._search_api(step[1], bulk=step[2]))
+        except StopIteration:
+            pass
+
+    def _search_windows(self, api_params, limit, bulk, page_size, window_days, since, until):
+        """
+        Parcours par fenêtres de iter_search_records, sans E/S (partagé avec AsyncBOAMPScraper) :
+        rend ('search', params, bulk) et reçoit la réponse de _search_api par send(),
+        ou rend ('records', enregistrements).
+        Lève SearchIncomplete dès qu'une réponse manque : la fenêtre n'est jamais sautée en silence.
+        """
+        floor = since or MIN_DATE
+        end = until or date.today() + timedelta(days=1)
+        count_params = self._window_params(api_params, floor, end) if since or until else api_params
+        total = _nhits((yield 'search', {**count_params, 'rows': 0, 'start': 0}, False))
+        if total is None:
+            raise SearchIncomplete("Erreur API : nombre d'avis de la recherche illisible")
+        if not total:
+            return
+        log.info("%s avis correspondent à la recherche", total)
+        
+        window_cap = BULK_WINDOW_SIZE if bulk else PAGED_WINDOW_SIZE
+        seen = 0
+        yielded = 0
+        span = window_days
+        
+        while seen < total and yielded < limit and end > floor:
+            start = max(floor, end - timedelta(days=span))
+            params = self._window_params(api_params, start, end)
+            log.info("Fenêtre %s → %s...", start, end)
+            
+            if bulk:
+                nhits = _nhits((yield 'search', {**params, 'rows': 0, 'start': 0}, False))
+                if nhits is None:
+                    raise SearchIncomplete(f"Erreur API sur la fenêtre {start} → {end}")
+                if nhits > window_cap and span > 1:
+                    span = max(1, span // 2) # Trop d'avis pour un seul export : on découpe
+                    continue
+                if nhits:
+                    data = yield 'search', {**params, 'rows': min(nhits, limit - yielded), 'format': 'json'}, True
+                    if data is None:
+                        raise SearchIncomplete(f"Erreur API sur l'export de la fenêtre {start} → {end}")
+                    records = data if isinstance(data, list) else []
+                    if records:
+                        yielded += len(records)
+                        yield 'records', records
+            else:
+                current_start = 0
+                nhits = None
+                while yielded < limit:
+                    data = yield 'search', {**params, 'rows': min(page_size, limit - yielded), 'start': current_start}, False
+                    if data is None:
+                        raise SearchIncomplete(f"Erreur API sur la fenêtre {start} → {end} (avis {current_start}+)")
+                    nhits = data.get('nhits', 0)
+                    if nhits > window_cap and span > 1:
+                        break # Fenêtre trop profonde pour start= : on la redécoupe
                     records = data.get('records', [])
                     if not records:
-                        print(f"🏁 Fin des résultats pour 20{year}.")
-                        year_finished = True
                         break
-                    
-                    # Scrape each result
-                    for i, record in enumerate(records):
-                        if processed_count >= max_results: break
-                        
-                        idweb = record['fields'].get('idweb')
-                        if not idweb: continue
-                        
+                    yielded += len(records)
+                    yield 'records', records
+                    current_start += len(records)
+                    if current_start >= nhits:
+                        break
+                if nhits is not None and nhits > window_cap and span > 1:
+                    span = max(1, span // 2)
+                    continue
+            
+            seen += nhits or 0
+            end = start
+            if nhits is not None and nhits < window_cap // 4:
+                span *= 2 # Fenêtre peu remplie : on élargit la suivante
+        
+        log.info("Fin des résultats.")
+
+    def iter_search_results(self, search_url, keywords, max_results=50, progress_callback=None, workers=1,
+                            skip_notices=None, bulk=False, parse_workers=0, plan=None):
+        """
+        Générateur : rend les entreprises au fur et à mesure que chaque avis est parsé,
+        sans garder l'ensemble des résultats en mémoire.
+        Avec workers > 1, les avis d'un même lot sont traités en parallèle (pool de threads
+        partageant la session) ; l'ordre des résultats reste celui de l'API.
+        skip_notices: idweb à ne pas retraiter (comptés dans max_results, ex: reprise d'export).
+        bulk: récupération par l'endpoint download, fenêtre de dates par fenêtre.
+        parse_workers: processus dédiés au décodage/parsing (voir iter_search_notices).
+        plan: SearchPlan de plan_search, tranches récupérées en parallèle (voir iter_search_notices).
+        """
+        notices = self.iter_search_notices(search_url, keywords, max_results, progress_callback, workers,
+                                           bulk=bulk, skip_record=self._skip_ids(skip_notices),
+                                           parse_workers=parse_workers, plan=plan)
+        for _, page_results in notices:
+            yield from page_results
+
+    def _skip_ids(self, skip_notices):
+        skip_notices = set(skip_notices or ())
+        return lambda record: record['fields']['idweb'] in skip_notices
+
+    def iter_search_notices(self, search_url, keywords, max_results=50, progress_callback=None, workers=1,
+                            bulk=False, since=None, skip_record=None, parse_workers=0, plan=None):
+        """
+        Cœur de l'extraction : rend (enregistrement, entreprises) pour chaque avis traité,
+        dans l'ordre de l'API (y compris les avis sans entreprise retenue).
+        skip_record(record) -> True pour ne pas retraiter un avis (compté dans max_results).
+        since: ne parcourt que les avis publiés depuis cette date.
+        parse_workers > 0: pipeline en deux étapes, les threads (I/O) alimentent un pool de
+        processus qui décode et parse 'donnees' (CPU, hors GIL) ; le pool est gardé pour les
+        recherches suivantes, jusqu'à close().
+        plan: SearchPlan (plan_search) de cette recherche : ses tranches sont récupérées en
+        parallèle (son mode bulk et son since remplacent ceux de l'appel).
+        Une page ou une fenêtre illisible (SearchIncomplete) ou une erreur réseau est relevée
+        après les avis déjà rendus : une recherche interrompue ne passe jamais pour terminée.
+        """
+        seen_notices = set()
+        # Compilé une seule fois, partagé par tous les avis et tous les lots
+        keywords = KeywordMatcher.of(keywords)
+        
+        api_params = self.build_search_params(search_url)
+        processed_count = 0
+        
+        log.info("Recherche Target: %s avis", max_results)
+        log.debug("API Params: %s", api_params)
+        
+        executor = None
+        parse_pool = None
+        if parse_workers > 0:
+            parse_pool = self._parse_pool(parse_workers)
+            # Assez de threads I/O pour garder tous les processus occupés
+            workers = max(workers, parse_workers * 2)
+        if workers > 1:
+            # Le pool de connexions doit suivre le nombre de workers
+            if hasattr(self.session, 'set_pool_size'):
+                self.session.set_pool_size(workers)
+            executor = ThreadPoolExecutor(max_workers=workers)
+        if plan is not None:
+            log.info("Plan : %s", plan.summary())
+            if hasattr(self.session, 'set_pool_size'):
+                self.session.set_pool_size(max(workers, 1) + plan.shard_workers)
+            batches = self._iter_plan_records(plan, max_results)
+        else:
+            batches = self.iter_search_records(api_params, limit=max_results, bulk=bulk, since=since)
+        
+        try:
+            for records in batches:
+                if processed_count >= max_results: break
+                
+                # Sélection des avis à traiter dans ce lot
+                batch = []
+                for record in records:
+                    if processed_count + len(batch) >= max_results: break
+                    idweb = record['fields'].get('idweb')
+                    if not idweb or idweb in seen_notices: continue
+                    seen_notices.add(idweb)
+                    if skip_record and skip_record(record):
                         processed_count += 1
-                        notice_url = f"https://www.boamp.fr/pages/avis/?q=idweb:%22{idweb}%22"
-                        
-                        if progress_callback:
-                            progress_callback(processed_count, max_results, f"Traitement de l'avis {idweb} (20{year})...")
-                        
-                        try:
-                            page_results = self.scrape_page(notice_url, keywords)
-                            if page_results:
-                                for r in page_results:
-                                    r['source_avis_id'] = idweb
-                                all_results.extend(page_results)
-                        except Exception as e:
-                            print(f"⚠️ Erreur sur l'avis {idweb}: {e}")
+                        continue
+                    batch.append(record)
+                
+                # Scrape each result (ordre déterministe, progression dans le thread principal)
+                for record, page_results in zip(batch, self._map_records(executor, batch, keywords, parse_pool, workers)):
+                    idweb = record['fields']['idweb']
+                    processed_count += 1
+                    self.metrics.incr('notices')
                     
-                    current_start += len(records)
+                    if progress_callback:
+                        progress_callback(processed_count, max_results, f"Traitement de l'avis {idweb}...")
                     
-                except Exception as e:
-                    print(f"⚠️ Erreur Globale Recherche: {e}")
-                    year_finished = True
-                    break
-            
-        return all_results
+                    for r in page_results:
+                        r['source_avis_id'] = idweb
+                    yield record, page_results
+        except Exception as e:
+            log.error("Erreur Globale Recherche: %s", e)
+            raise
+        finally:
+            # Aussi exécuté si le consommateur abandonne le générateur en cours de route
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def sync_search_results(self, search_url, keywords, state, max_results=100000, progress_callback=None,
+                            workers=1, overlap_days=1, parse_workers=0):
+        """
+        Synchronisation incrémentale d'une recherche (state: boamp_sync.SyncState).
+        Seuls les avis publiés depuis le dernier passage (moins overlap_days) sont listés,
+        et seuls les nouveaux ou modifiés (record_timestamp différent) sont parsés.
+        Retourne (nouveaux résultats, ensemble fusionné des résultats de la recherche).
+        Le high-water mark n'avance que si toute la période a été parcourue : une page illisible
+        (SearchIncomplete, relevée) ou max_results atteint le laissent en place, et le passage
+        suivant reprend les avis manquants (ceux déjà traités sont sautés).
+        """
+        key = state.search_key(search_url, keywords)
+        high_water_mark = state.high_water_mark(key)
+        since = high_water_mark - timedelta(days=overlap_days) if high_water_mark else None
+        known = state.seen(key)
+        listed = 0 # Avis comptés dans max_results (traités ou sautés)
+        latest = high_water_mark.isoformat() if high_water_mark else None
+        
+        def see(fields):
+            nonlocal listed, latest
+            listed += 1
+            published = fields.get('dateparution')
+            if published and (latest is None or published[:10] > latest):
+                latest = published[:10]
+        
+        def unchanged(record):
+            idweb = record['fields']['idweb']
+            if idweb in known and known[idweb] == record.get('record_timestamp'):
+                see(record['fields'])
+                return True
+            return False
+        
+        new_results = []
+        notices = self.iter_search_notices(search_url, keywords, max_results, progress_callback, workers,
+                                           since=since, skip_record=unchanged, parse_workers=parse_workers)
+        for record, page_results in notices:
+            fields = record['fields']
+            see(fields)
+            state.save_notice(key, fields['idweb'], fields.get('dateparution'),
+                              record.get('record_timestamp'), page_results)
+            new_results.extend(page_results)
+        
+        if listed >= max_results:
+            # Avis plus anciens peut-être pas encore vus : ne pas les masquer au prochain passage
+            log.warning("Synchronisation limitée à %s avis : high-water mark inchangé.", max_results)
+        else:
+            state.update_search(key, search_url, KeywordMatcher.of(keywords).keywords, latest)
+        log.info("Synchronisation : %s nouvelles entreprises.", len(new_results))
+        return new_results, state.results(key)
 
     def export_to_csv(self, entreprises, filename='entreprises_boamp.csv'):
         if not entreprises: return
-        keys = entreprises[0].keys()
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(entreprises)
+        with CSVSink(filename) as sink:
+            sink.write_rows(entreprises)
 
 
-def main():
-    pass # Utilisé par l'app désormais
+# --- Étape CPU du pipeline (exécutée dans les processus du ProcessPoolExecutor) ---
+_worker_scraper = None
+_worker_matchers = {}
+
+def _nhits(data):
+    """nhits d'une réponse search ; None en cas d'erreur HTTP"""
+    return data.get('nhits', 0) if data else None
+
+
+def _params_key(params):
+    """Paramètres de recherche -> clé hashable (les listes, ex: facet, deviennent des tuples)"""
+    return tuple(sorted((k, tuple(v) if isinstance(v, (list, tuple)) else v) for k, v in params.items()))
+
+
+def _fields_size(fields):
+    """Taille approchée des 'fields' d'un avis relus du cache disque (textes, dont 'donnees')"""
+    return sum(len(v) for v in fields.values() if isinstance(v, str))
+
+
+def parse_donnees_worker(donnees_raw, keywords, url, json_projection=True, with_awards=False):
+    """
+    Décode et parse un 'donnees' brut dans un processus de parsing.
+    Retourne (stratégie, entreprises, attributions) ; entreprises vaut None si l'avis doit passer
+    par le fallback ('invalid' = JSON tronqué, 'unknown' = format non structuré).
+    with_awards: renvoie aussi toutes les attributions de l'avis (index local), sinon None.
+    """
+    global _worker_scraper
+    if _worker_scraper is None:
+        _worker_scraper = BOAMPScraper()
+    _worker_scraper.json_projection = json_projection
+    matcher = _worker_matchers.get(tuple(keywords))
+    if matcher is None:
+        matcher = _worker_matchers[tuple(keywords)] = KeywordMatcher(keywords)
+    
+    donnees_json = _worker_scraper.decode_donnees(donnees_raw)
+    if donnees_json is None:
+        return 'invalid', None, None
+    if 'EFORMS' in donnees_json:
+        strategy, awards = 'eforms', _worker_scraper._eforms_awards(donnees_json, url)
+    elif 'FNSimple' in donnees_json:
+        strategy, awards = 'fnsimple', _worker_scraper._fnsimple_awards(donnees_json, url)
+    else:
+        return 'unknown', None, None
+    return strategy, merge_awards(awards, matcher), awards if with_awards else None
+
+
+# --- Ligne de commande (traitement par lots) ---
+EXIT_OK = 0
+EXIT_ERRORS = 1   # Terminé, mais des erreurs ont été journalisées (export partiel possible)
+EXIT_USAGE = 2    # Arguments ou fichier de lot invalides
+EXIT_INTERRUPTED = 130
+
+
+def read_batch_file(path, default_keywords=(), default_max_results=100):
+    """
+    Fichier de lot : une entrée par ligne, "URL | mots-clés séparés par virgules | nb max d'avis".
+    Les deux derniers champs sont optionnels ; lignes vides et commentaires (#) ignorés.
+    Retourne [(url, [mots-clés], max_results)].
+    """
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            url, _, rest = line.partition('|')
+            keywords_part, _, max_part = rest.partition('|')
+            keywords = [k.strip() for k in keywords_part.split(',') if k.strip()] or list(default_keywords)
+            try:
+                max_results = int(max_part) if max_part.strip() else default_max_results
+            except ValueError:
+                raise ValueError(f"{path}:{line_no}: nb max d'avis invalide : {max_part.strip()!r}")
+            if not url.strip().startswith('http'):
+                raise ValueError(f"{path}:{line_no}: URL invalide : {url.strip()!r}")
+            entries.append((url.strip(), keywords, max_results))
+    return entries
+
+
+class _ErrorCounter(logging.Handler):
+    """Compte les erreurs journalisées par le scraper (code de sortie)"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def run_batch(scraper, entries, sink, workers=4, bulk=False, progress_every=25, store=None,
+              shard_workers=DEFAULT_SHARD_WORKERS):
+    """
+    Traite les entrées d'un lot avec un seul scraper (pool de connexions et cache partagés).
+    Un avis n'est traité qu'une fois par jeu de mots-clés, même si plusieurs recherches
+    se recouvrent ; les avis à récupérer passent par le cache (un seul appel par avis).
+    store: boamp_results.CompanyStore ; les entreprises y sont fusionnées au fil du lot
+    et le sink ne reçoit que les entreprises fusionnées, à la fin.
+    shard_workers > 0: chaque recherche est d'abord planifiée (volume et coût estimé
+    journalisés), puis ses tranches sont récupérées en parallèle.
+    Retourne le nombre d'entreprises écrites.
+    """
+    processed = set(('*', idweb) for idweb in sink.done_notices) # Reprise d'export
+    written = sink.count
+
+    def save(idweb, page_results):
+        if store is not None:
+            # Pas de store.add_notice : un même avis peut revenir avec d'autres mots-clés
+            for entreprise in page_results:
+                store.add(entreprise, idweb)
+        else:
+            sink.write_rows(page_results)
+        processed.add((keyword_set, idweb))
+
+    def found():
+        return len(store) if store is not None else sink.count - written
+    for n, (url, keywords, max_results) in enumerate(entries, 1):
+        keyword_set = frozenset(fold(k) for k in keywords)
+        prefix = f"[{n}/{len(entries)}]"
+        log.info("%s %s (mots-clés: %s, max %s avis)", prefix, url, ", ".join(keywords) or "-", max_results)
+        
+        def already_done(idweb):
+            return ('*', idweb) in processed or (keyword_set, idweb) in processed
+        
+        if "pages/recherche" not in url:
+            id_match = re.search(r'(\d{2}-\d{3,})', url)
+            idweb = id_match.group(1) if id_match else url
+            if not already_done(idweb):
+                save(idweb, scraper.scrape_page(url, keywords))
+        else:
+            def report(current, total, message):
+                if current % progress_every == 0 or current == total:
+                    log.info("%s %s/%s avis, %s entreprises", prefix, current, total, found())
+            
+            skip = lambda record: already_done(record['fields']['idweb'])
+            plan = scraper.plan_search(url, max_results, bulk, shard_workers=shard_workers) if shard_workers else None
+            if shard_workers and plan is None:
+                # Erreur déjà journalisée (comptée) : on passe à l'entrée suivante
+                log.warning("%s recherche ignorée : plan impossible", prefix)
+                continue
+            if plan is not None:
+                log.info("%s %s", prefix, plan.summary())
+            notices = scraper.iter_search_notices(url, keywords, max_results, report, workers,
+                                                  bulk=bulk, skip_record=skip, plan=plan)
+            try:
+                for record, page_results in notices:
+                    save(record['fields']['idweb'], page_results)
+            except Exception as e:
+                # Erreur comptée (code de sortie), les entrées suivantes sont traitées ; --resume complète
+                log.error("%s recherche incomplète : %s", prefix, e)
+        log.info("%s terminé : %s entreprises au total", prefix, found())
+    if store is not None:
+        sink.write_rows(store.companies())
+    return sink.count - written
+
+
+def print_plans(entries, args):
+    """--plan : une ligne par recherche sur stdout (volume, tranches, coût estimé), sans extraction"""
+    scraper = BOAMPScraper(api_base=args.api_base, session=BOAMPSession(rate=args.rate))
+    failed = 0
+    for url, _, max_results in entries:
+        if "pages/recherche" not in url:
+            print(f"{url}\t1 avis")
+            continue
+        plan = scraper.plan_search(url, max_results, args.bulk, shard_workers=max(1, args.shards))
+        failed += plan is None
+        print(f"{url}\t{plan.summary() if plan else 'erreur API'}")
+    return EXIT_ERRORS if failed else EXIT_OK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="boamp_scraper",
+        description="Extraction des entreprises attributaires d'avis BOAMP (recherches ou avis unitaires)."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('batch', nargs='?', help="Fichier de lot : une ligne \"URL | mots-clés | nb max d'avis\"")
+    source.add_argument('--url', help="Une seule URL (recherche ou avis)")
+    parser.add_argument('-k', '--keywords', default="", help="Mots-clés séparés par virgules (défaut des entrées)")
+    parser.add_argument('-o', '--output', default="entreprises_boamp.csv",
+                        help="Fichier de sortie : .csv, .jsonl, .parquet (+ .gz)")
+    parser.add_argument('--resume', action='store_true', help="Complète un export existant sans retraiter ses avis")
+    parser.add_argument('--merge', action='store_true',
+                        help="Une ligne par entreprise sur tout le lot (SIRET, sinon nom + ville), avis et lots cumulés")
+    parser.add_argument('--max-results', type=int, default=100, help="Nb max d'avis par recherche (défaut des entrées)")
+    parser.add_argument('--workers', type=int, default=4, help="Avis traités en parallèle")
+    parser.add_argument('--bulk', action='store_true', help="Récupération par l'endpoint d'export (gros historiques)")
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARD_WORKERS,
+                        help="Tranches d'une recherche récupérées en parallèle (0 = fenêtres successives, sans plan)")
+    parser.add_argument('--plan', action='store_true',
+                        help="Affiche le volume, le découpage et le coût estimé de chaque recherche, sans extraire")
+    parser.add_argument('--rate', type=float, default=10.0, help="Requêtes par seconde max vers l'API (0 = sans limite)")
+    parser.add_argument('--no-cache', action='store_true', help="Cache des avis en mémoire seulement (pas de disque)")
+    parser.add_argument('--api-base', default=API_BASE, help="Endpoint opendatasoft (ex: stub local)")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    level = logging.DEBUG if args.verbose else logging.WARNING if args.quiet else logging.INFO
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(message)s", stream=sys.stderr)
+    errors = _ErrorCounter()
+    log.addHandler(errors)
+
+    default_keywords = [k.strip() for k in args.keywords.split(',') if k.strip()]
+    if args.merge and args.resume:
+        log.critical("--merge et --resume sont incompatibles (l'export fusionné est écrit en fin de lot)")
+        return EXIT_USAGE
+    try:
+        if args.url:
+            entries = [(args.url, default_keywords, args.max_results)]
+        else:
+            entries = read_batch_file(args.batch, default_keywords, args.max_results)
+        if args.plan:
+            return print_plans(entries, args)
+        sink = open_sink(args.output, resume=args.resume, fields=MERGED_FIELDS if args.merge else EXPORT_FIELDS)
+    except (OSError, ValueError, ImportError) as e:
+        log.critical("%s", e)
+        return EXIT_USAGE
+    
+    # Cache mémoire même sans disque : chaque avis n'est récupéré qu'une fois dans le lot
+    cache = NoticeCache(':memory:') if args.no_cache else NoticeCache()
+    scraper = BOAMPScraper(api_base=args.api_base, cache=cache, session=BOAMPSession(rate=args.rate))
+    try:
+        with sink:
+            written = run_batch(scraper, entries, sink, workers=args.workers, bulk=args.bulk,
+                                store=CompanyStore() if args.merge else None, shard_workers=args.shards)
+        log.info("%s entreprises écrites dans %s (%s avis traités, %s erreurs)",
+                 written, args.output, scraper.metrics.counters.get('notices', 0), errors.count)
+    except KeyboardInterrupt:
+        log.warning("Interrompu : %s entreprises écrites dans %s (reprise avec --resume)", sink.count, args.output)
+        return EXIT_INTERRUPTED
+    finally:
+        scraper.close()
+        cache.close()
+    return EXIT_ERRORS if errors.count else EXIT_OK
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
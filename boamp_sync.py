@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from boamp_results import as_dicts
+
+DEFAULT_STATE_PATH = os.path.join('.boamp_cache', 'sync.sqlite')
+
+
+class SyncState:
+    """
+    État local des synchronisations incrémentales (SQLite).
+    Par recherche : date de publication la plus récente vue (high-water mark),
+    et pour chaque avis déjà traité son horodatage opendatasoft et ses résultats.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS searches (
+                search_key TEXT PRIMARY KEY,
+                search_url TEXT NOT NULL,
+                keywords TEXT NOT NULL,
+                last_dateparution TEXT,
+                last_run REAL
+            );
+            CREATE TABLE IF NOT EXISTS notices (
+                search_key TEXT NOT NULL,
+                idweb TEXT NOT NULL,
+                dateparution TEXT,
+                record_timestamp TEXT,
+                results TEXT NOT NULL,
+                PRIMARY KEY (search_key, idweb)
+            );
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def search_key(search_url, keywords):
+        """Une recherche = une URL + un jeu de mots-clés (l'ordre des mots-clés ne compte pas)"""
+        raw = json.dumps([search_url, sorted(keywords or [])], ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def high_water_mark(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_dateparution FROM searches WHERE search_key = ?", (key,)
+            ).fetchone()
+        return date.fromisoformat(row[0]) if row and row[0] else None
+
+    def seen(self, key):
+        """idweb -> record_timestamp des avis déjà traités pour cette recherche"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idweb, record_timestamp FROM notices WHERE search_key = ?", (key,)
+            ).fetchall()
+        return dict(rows)
+
+    def save_notice(self, key, idweb, dateparution, record_timestamp, results):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO notices VALUES (?, ?, ?, ?, ?)",
+                (key, idweb, dateparution, record_timestamp, json.dumps(as_dicts(results), ensure_ascii=False))
+            )
+            self._conn.commit()
+
+    def update_search(self, key, search_url, keywords, last_dateparution):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?)",
+                (key, search_url, json.dumps(list(keywords or []), ensure_ascii=False),
+                 last_dateparution, time.time())
+            )
+            self._conn.commit()
+
+    def results(self, key):
+        """Ensemble des résultats connus pour la recherche (avis les plus récents d'abord)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT results FROM notices WHERE search_key = ? ORDER BY dateparution DESC, idweb DESC",
+                (key,)
+            ).fetchall()
+        return [r for (payload,) in rows for r in json.loads(payload)]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'bench')]
+
+from stub_server import StubAPI
+
+SEARCH_URL = "https://www.boamp.fr/pages/recherche/?refine.type_avis=6"
+
+
+@pytest.fixture
+def stub():
+    """Stub local de l'API opendatasoft (300 avis sur 60 jours, sans latence)"""
+    api = StubAPI(n_records=300, latency=0)
+    api.base = api.start()
+    yield api
+    api.stop()
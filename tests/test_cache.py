@@ -0,0 +1,32 @@
+import time
+
+from boamp_cache import NoticeCache
+from boamp_scraper import BOAMPScraper
+from conftest import SEARCH_URL
+
+
+def test_negative_entries_expire_before_notices(monkeypatch):
+    cache = NoticeCache(':memory:', ttl=3600, negative_ttl=60)
+    cache.put('boamp', 'absent', {})
+    cache.put('boamp', 'avis', {'idweb': 'avis'})
+    assert cache.get('boamp', 'absent') == {}
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+    assert cache.get('boamp', 'absent') is None # Redemandé à l'API
+    assert cache.get('boamp', 'avis') == {'idweb': 'avis'}
+
+    cache.evict()
+    assert cache.stats()['entries'] == 1
+
+
+def test_cache_errors_do_not_drop_notices(stub):
+    expected = BOAMPScraper(api_base=stub.base, cache=NoticeCache(':memory:')).scrape_search_results(
+        SEARCH_URL, [], max_results=50)
+    broken = NoticeCache(':memory:')
+    broken._conn.close() # Toute requête lève sqlite3.ProgrammingError, comme une base verrouillée
+    scraper = BOAMPScraper(api_base=stub.base, cache=broken)
+    assert scraper.scrape_search_results(SEARCH_URL, [], max_results=50) == expected
+    notice_url = f"https://www.boamp.fr/pages/avis/?q=idweb:%22{stub.notices[0][0]}%22"
+    assert [r['nom'] for r in scraper.scrape_page(notice_url, [])] == \
+        [r['nom'] for r in expected if r['avis_id'] == stub.notices[0][0]]
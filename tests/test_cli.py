@@ -0,0 +1,80 @@
+import csv
+
+import pytest
+
+from boamp_scraper import EXIT_ERRORS, EXIT_OK, EXIT_USAGE, main, read_batch_file
+from conftest import SEARCH_URL
+
+FAILING_URL = SEARCH_URL + "&refine.famille=MAPA"
+
+
+def write_batch(tmp_path, text):
+    path = tmp_path / "lot.txt"
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_read_batch_file_skips_comments_and_blank_lines(tmp_path):
+    path = write_batch(tmp_path, f"""
+# Recherches du mois
+{SEARCH_URL}
+
+   {SEARCH_URL} | plomberie, CVC ,  | 250
+  # commentaire indenté
+{SEARCH_URL} || 10
+{SEARCH_URL} | électricité
+""")
+    assert read_batch_file(path, ["défaut"], 100) == [
+        (SEARCH_URL, ["défaut"], 100),
+        (SEARCH_URL, ["plomberie", "CVC"], 250),
+        (SEARCH_URL, ["défaut"], 10),
+        (SEARCH_URL, ["électricité"], 100),
+    ]
+
+
+@pytest.mark.parametrize('line, error', [
+    (f"{SEARCH_URL} | plomberie | beaucoup", "lot.txt:3: nb max d'avis invalide : 'beaucoup'"),
+    ("www.boamp.fr/pages/recherche/ | plomberie", "lot.txt:3: URL invalide"),
+    ("| plomberie | 10", "lot.txt:3: URL invalide"),
+])
+def test_read_batch_file_rejects_bad_lines(tmp_path, line, error):
+    path = write_batch(tmp_path, f"# lot\n{SEARCH_URL}\n{line}\n")
+    with pytest.raises(ValueError, match=error):
+        read_batch_file(path)
+
+
+def run_cli(stub, tmp_path, batch, *options):
+    output = str(tmp_path / "sortie.csv")
+    code = main([write_batch(tmp_path, batch), '-o', output, '--api-base', stub.base, '--no-cache',
+                 '--rate', '0', '-q', *options])
+    with open(output, encoding='utf-8') as f:
+        return code, list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize('shards', ['0', '2'])
+def test_exit_ok(stub, tmp_path, shards):
+    code, rows = run_cli(stub, tmp_path, f"{SEARCH_URL} | | 20\n", '--shards', shards)
+    assert code == EXIT_OK
+    assert len({r['avis_id'] for r in rows}) == 20
+
+
+@pytest.mark.parametrize('shards', ['0', '2'])
+def test_failed_search_gives_exit_errors_and_keeps_other_entries(stub, tmp_path, shards):
+    stub.fail = lambda path, params: 'refine.famille' in params
+    code, rows = run_cli(stub, tmp_path, f"{FAILING_URL} | | 20\n{SEARCH_URL} | | 20\n", '--shards', shards)
+    assert code == EXIT_ERRORS
+    assert len({r['avis_id'] for r in rows}) == 20
+
+
+def test_unreachable_api_gives_exit_errors(tmp_path):
+    output = str(tmp_path / "sortie.csv")
+    code = main([write_batch(tmp_path, f"{SEARCH_URL} | | 5\n"), '-o', output, '--api-base', "http://127.0.0.1:9",
+                 '--no-cache', '--rate', '0', '-q'])
+    assert code == EXIT_ERRORS
+
+
+def test_bad_batch_file_gives_exit_usage(tmp_path):
+    code = main([write_batch(tmp_path, "pas une url\n"), '-o', str(tmp_path / "sortie.csv"), '--no-cache', '-q'])
+    assert code == EXIT_USAGE
+    assert not (tmp_path / "sortie.csv").exists()
+    assert main([str(tmp_path / "absent.txt"), '-o', str(tmp_path / "sortie.csv"), '-q']) == EXIT_USAGE
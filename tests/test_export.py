@@ -0,0 +1,61 @@
+import gzip
+
+import pytest
+
+from boamp_export import open_sink
+
+NOTICES = {
+    '26-1': [{'nom': 'Alpha', 'lot_title': 'Lot 1'}],
+    '26-2': [{'nom': 'Beta', 'lot_title': 'Lot 1\nsuite'}, {'nom': 'Gamma', 'lot_title': 'Lot 2'}],
+    '26-3': [{'nom': 'Delta', 'lot_title': 'Lot 1'}, {'nom': 'Epsilon', 'lot_title': 'Lot 2'}],
+}
+
+
+def write_notices(sink, ids):
+    for idweb in ids:
+        if idweb not in sink.done_notices:
+            sink.write_rows([dict(row, avis_id=idweb) for row in NOTICES[idweb]])
+
+
+def read_back(path):
+    with open_sink(path, resume=True) as sink:
+        return sink.count, sink.done_notices
+
+
+def cut(path, drop):
+    """Simule un arrêt brutal : les `drop` derniers octets (décompressés) n'ont pas été écrits"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        data = f.read()
+    with opener(path, 'wb') as f:
+        f.write(data[:-drop])
+
+
+@pytest.mark.parametrize('name', ['export.csv', 'export.jsonl', 'export.csv.gz', 'export.jsonl.gz'])
+def test_resume_after_cut_mid_line(tmp_path, name):
+    path = str(tmp_path / name)
+    with open_sink(path) as sink:
+        write_notices(sink, NOTICES)
+    cut(path, 5) # Au milieu de la dernière ligne (26-3, Epsilon)
+
+    with open_sink(path, resume=True) as sink:
+        assert '26-1' in sink.done_notices and '26-3' not in sink.done_notices
+        write_notices(sink, NOTICES)
+
+    count, done = read_back(path)
+    assert count == 5 and done == set(NOTICES)
+    with open_sink(path.replace('export', 'reference')) as sink:
+        write_notices(sink, NOTICES)
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as resumed, opener(path.replace('export', 'reference'), 'rb') as reference:
+        assert resumed.read() == reference.read()
+
+
+def test_resume_intact_file_keeps_every_notice(tmp_path):
+    path = str(tmp_path / 'export.csv')
+    with open_sink(path) as sink:
+        write_notices(sink, ['26-1', '26-2'])
+    with open_sink(path, resume=True) as sink:
+        assert sink.done_notices == {'26-1', '26-2'}
+        write_notices(sink, NOTICES)
+    assert read_back(path) == (5, set(NOTICES))
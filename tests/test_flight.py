@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from boamp_cache import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    gate = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        gate.wait(1)
+        return 'ok', 2
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.call, 'k', fetch) for _ in range(4)]
+        time.sleep(0.05)
+        gate.set()
+        assert [f.result() for f in futures] == ['ok'] * 4
+    assert len(calls) == 1
+    assert flight.call('k', fetch) == 'ok' # Servi depuis la mémoire
+    assert len(calls) == 1
+
+
+def test_errors_are_shared_but_not_cached():
+    flight = SingleFlight()
+
+    def broken():
+        raise RuntimeError("panne")
+
+    with pytest.raises(RuntimeError):
+        flight.call('k', broken)
+    assert flight.call('k', lambda: ('ok', 2)) == 'ok'
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+    calls = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return 'ok', 2
+
+        leader = asyncio.ensure_future(flight.acall('k', fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.acall('k', fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await follower == 'ok'
+        assert leader.cancelled()
+
+    asyncio.run(main())
+    assert len(calls) == 1
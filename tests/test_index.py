@@ -0,0 +1,56 @@
+import pytest
+
+from boamp_http import BOAMPSession
+from boamp_index import LotIndex
+from boamp_keywords import KeywordMatcher
+from boamp_scraper import BOAMPScraper
+from conftest import SEARCH_URL
+from stub_server import StubAPI, load_fixture
+from synthetic import make_eforms_notice
+
+KEYWORD_SETS = [
+    ["plomberie"],
+    ["CVC"],
+    ["genie climatique"],
+    ["Électricité", "menuiseries"],
+    ["oeuvre", "sol"],
+    ["absent"],
+    # Moins de 3 caractères : le tokenizer trigram ne peut pas présélectionner les lots
+    ["cv"],
+    ["é"],
+    ["plomberie", "cv"],
+]
+
+
+@pytest.fixture(scope='module')
+def harvested():
+    """Stub avec des avis EFORMS de 3 et 6 lots et des avis FNSimple, récolté une fois dans l'index"""
+    payloads = [make_eforms_notice(n_lots=3), make_eforms_notice(n_lots=6),
+                load_fixture('fnsimple_award')['fields']['donnees']]
+    api = StubAPI(n_records=120, latency=0, payloads=payloads)
+    base = api.start()
+    index = LotIndex(':memory:')
+    scraper = BOAMPScraper(api_base=base, session=BOAMPSession(rate=None))
+    BOAMPScraper(api_base=base, session=BOAMPSession(rate=None), index=index).harvest_search_results(
+        SEARCH_URL, max_results=1000)
+    yield scraper, index
+    api.stop()
+
+
+def rows(results):
+    return sorted(sorted(dict(r).items()) for r in results)
+
+
+@pytest.mark.parametrize('keywords', KEYWORD_SETS, ids=['+'.join(k) for k in KEYWORD_SETS])
+def test_index_search_matches_live_scrape(harvested, keywords):
+    scraper, index = harvested
+    assert index.fts
+    live = scraper.scrape_search_results(SEARCH_URL, keywords, max_results=1000)
+    assert bool(live) == (keywords != ["absent"])
+    assert rows(index.search(keywords)) == rows(live)
+
+
+def test_short_keywords_bypass_fts(harvested):
+    _, index = harvested
+    assert index._fts_query(KeywordMatcher(["CVC", "Génie"])) == '"cvc" OR "genie"'
+    assert index._fts_query(KeywordMatcher(["CVC", "cv"])) is None
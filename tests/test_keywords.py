@@ -0,0 +1,65 @@
+import itertools
+
+import pytest
+
+from boamp_keywords import KeywordMatcher, fold
+
+TEXTS = [
+    "Lot 2 - Plomberie - Chauffage - Ventilation",
+    "Travaux de génie climatique (pompe à chaleur) et plomberie sanitaire",
+    "ELECTRICITE COURANTS FORTS ET FAIBLES",
+    "Menuiseries extérieures aluminium",
+    "Maintenance des installations de chauffage, ventilation et climatisation (CVC)",
+    "",
+]
+KEYWORDS = ["plomberie", "Plomb", "chauffage", "age", "CVC", "ventilation et", "menuiserie", "électricité",
+            "génie climatique", "climatisation", "absent"]
+
+
+def old_match(keywords, text):
+    """Recherche d'avant KeywordMatcher : sous-chaîne, insensible à la casse seulement"""
+    return [k for k in keywords if k.lower() in text.lower()]
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_same_matches_as_substring_search(text):
+    # Sur des mots-clés et textes sans accent, même résultat que l'ancienne recherche (repliée)
+    keywords = [fold(k) for k in KEYWORDS]
+    assert KeywordMatcher(keywords).match(fold(text)) == old_match(keywords, fold(text))
+
+
+def test_accents_and_case_are_folded():
+    matcher = KeywordMatcher(["Génie Climatique", "electricite", "ÉLECTRICITÉ", "menuiserie"])
+    assert matcher.match("travaux de GENIE climatique") == ["Génie Climatique"]
+    assert matcher.match("Électricité courants forts") == ["electricite", "ÉLECTRICITÉ"]
+    assert matcher.match("MENUISERIES") == ["menuiserie"]
+    # L'ancienne recherche ne trouvait pas 'electricite' dans 'Électricité'
+    assert old_match(["electricite"], "Électricité courants forts") == []
+
+
+def test_no_word_boundaries_like_before():
+    matcher = KeywordMatcher(["plomb", "menuiserie", "clim"])
+    assert matcher.match("plomberie, menuiseries, climatisation") == ["plomb", "menuiserie", "clim"]
+    assert matcher.match("aplomb") == old_match(["plomb"], "aplomb") == ["plomb"]
+
+
+def test_implied_and_overlapping_keywords():
+    # 'plomb' et 'berie' sont contenus dans l'alternative la plus longue trouvée ('plomberie')
+    assert KeywordMatcher(["plomb", "plomberie", "berie"]).match("Plomberie") == ["plomb", "plomberie", "berie"]
+    # Chevauchement sans inclusion : les deux sont trouvés
+    assert KeywordMatcher(["genie clim", "climatique"]).match("génie climatique") == ["genie clim", "climatique"]
+
+
+def test_all_keyword_orders_match_old_search():
+    text = fold(TEXTS[1])
+    keywords = ["plomberie", "plomb", "pompe a chaleur", "chaleur", "genie", "climatique", "sanitaire"]
+    for order in itertools.permutations(keywords, 4):
+        assert KeywordMatcher(order).match(text) == old_match(order, text)
+
+
+def test_empty_keywords():
+    matcher = KeywordMatcher(["", "  ", None])
+    assert not matcher
+    assert matcher.match("plomberie") == []
+    assert matcher.match_mask("plomberie") == 0
+    assert KeywordMatcher.of(matcher) is matcher
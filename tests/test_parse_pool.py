@@ -0,0 +1,17 @@
+from boamp_http import BOAMPSession
+from boamp_scraper import BOAMPScraper
+from conftest import SEARCH_URL
+
+
+def test_parse_pool_is_reused_until_close(stub):
+    scraper = BOAMPScraper(api_base=stub.base, session=BOAMPSession(rate=None))
+    expected = scraper.scrape_search_results(SEARCH_URL, [], max_results=30)
+    with scraper:
+        assert scraper.scrape_search_results(SEARCH_URL, [], max_results=30, parse_workers=2) == expected
+        pool = scraper._parse_pool(2)
+        assert scraper.scrape_search_results(SEARCH_URL, [], max_results=30, parse_workers=2) == expected
+        assert scraper._parse_pool(2) is pool
+    assert not scraper._parse_pools
+    # Relancé à la demande après close()
+    assert scraper.scrape_search_results(SEARCH_URL, [], max_results=30, parse_workers=2) == expected
+    scraper.close()
@@ -0,0 +1,39 @@
+import json
+import os
+
+import pytest
+
+from boamp_scraper import BOAMPScraper
+from stub_server import FIXTURES_DIR
+
+with open(os.path.join(FIXTURES_DIR, 'fnsimple_corpus.json'), encoding='utf-8') as f:
+    FNSIMPLE_CORPUS = json.load(f)
+
+HTML_LAYOUTS = {
+    'paragraphes': """<html><body><div>
+        <h3>Lot 1 - Plomberie</h3><p>Attributaire : ACME, 75001 Paris</p><p>contact@acme.fr</p>
+        <h3>Lot 2 - Electricité</h3><p>Attributaire : BETA, 69001 Lyon</p><p>info@beta.fr</p>
+    </div></body></html>""",
+    'cellules': """<html><body><div>
+        <h3>Lot 1 - Plomberie</h3>
+        <table><tr><td>Attributaire : ACME, 75001 Paris</td><td>contact@acme.fr</td></tr></table>
+        <h3>Lot 2 - Electricité</h3>
+        <table><tr><td>Attributaire : BETA, 69001 Lyon</td><td>info@beta.fr</td></tr></table>
+    </div></body></html>""",
+}
+
+
+@pytest.mark.parametrize('layout', sorted(HTML_LAYOUTS))
+def test_html_label_directly_in_block(layout):
+    results = BOAMPScraper().parse_html_notice(HTML_LAYOUTS[layout], [], 'u')
+    assert [(r['nom'], r['ville'], r['email'], r['lot_title']) for r in results] == [
+        ('ACME', '75001 Paris', 'contact@acme.fr', 'Lot 1 - Plomberie'),
+        ('BETA', '69001 Lyon', 'info@beta.fr', 'Lot 2 - Electricité'),
+    ]
+
+
+@pytest.mark.parametrize('case', FNSIMPLE_CORPUS, ids=[case['name'] for case in FNSIMPLE_CORPUS])
+def test_fnsimple_corpus(case):
+    donnees = {'FNSimple': {'attribution': {'attributionMarche': case['attributionMarche']}}}
+    results = BOAMPScraper().parse_fnsimple_data(donnees, case['keywords'], 'corpus')
+    assert [dict(r) for r in results] == case['expected']
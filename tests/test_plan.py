@@ -0,0 +1,114 @@
+from datetime import date
+
+import pytest
+
+from boamp_http import BOAMPSession
+from boamp_plan import Shard, date_shards, departement_shards
+from boamp_scraper import BOAMPScraper, SearchIncomplete
+from conftest import SEARCH_URL
+
+FLOOR, CEILING = date(2024, 1, 1), date(2024, 1, 11)
+
+
+def daily_buckets(*counts):
+    """Facette dateparution par jour, du 10 janvier en remontant"""
+    return {(date(2024, 1, 10 - i), date(2024, 1, 11 - i)): count for i, count in enumerate(counts)}
+
+
+def test_date_shards_are_contiguous_and_cover_the_period():
+    shards = date_shards(daily_buckets(*[40] * 10), 400, FLOOR, CEILING, 100)
+    assert [s.estimate for s in shards] == [80] * 5
+    assert shards[0].end == CEILING and shards[-1].start == FLOOR
+    assert all(newer.start == older.end for newer, older in zip(shards, shards[1:]))
+
+
+def test_date_shards_first_bucket_larger_than_shard():
+    shards = date_shards(daily_buckets(250, 40), 290, FLOOR, CEILING, 100)
+    assert [(s.start, s.end, s.estimate) for s in shards] == [
+        (date(2024, 1, 10), CEILING, 250),
+        (FLOOR, date(2024, 1, 10), 40),
+    ]
+
+
+def test_date_shards_stop_at_requested_notices():
+    shards = date_shards(daily_buckets(*[40] * 10), 100, FLOOR, CEILING, 1000)
+    assert [(s.start, s.end, s.estimate) for s in shards] == [(FLOOR, CEILING, 120)]
+    # Avis absents des facettes : comptés dans la dernière tranche
+    assert date_shards(daily_buckets(40), 100, FLOOR, CEILING, 1000)[-1].estimate == 100
+
+
+def test_departement_shards_balance_groups():
+    shards = departement_shards({'33': 50, '75': 40, '24': 30, '13': 20}, 2)
+    assert [(s.departements, s.estimate) for s in shards[:-1]] == [(('33', '13'), 70), (('75', '24'), 70)]
+    assert shards[-1].exclude == ('33', '75', '24', '13')
+
+
+def make_scraper(stub):
+    return BOAMPScraper(api_base=stub.base, session=BOAMPSession(rate=None, max_retries=0))
+
+
+def notice_ids(scraper, max_results, plan=None):
+    return [record['fields']['idweb'] for record, _ in
+            scraper.iter_search_notices(SEARCH_URL, [], max_results=max_results, plan=plan)]
+
+
+@pytest.mark.parametrize('max_results', [150, 1000])
+def test_date_plan_matches_sequential_extraction(stub, max_results):
+    scraper = make_scraper(stub)
+    plan = scraper.plan_search(SEARCH_URL, max_results=max_results, shard_size=50, by='date')
+    assert plan.by == 'date' and len(plan.shards) > 2
+    expected = notice_ids(scraper, max_results)
+    assert len(expected) == min(max_results, len(stub.notices))
+    assert notice_ids(scraper, max_results, plan) == expected
+
+
+def test_date_plan_shard_boundaries(stub):
+    scraper = make_scraper(stub)
+    plan = scraper.plan_search(SEARCH_URL, max_results=1000, shard_size=50, by='date')
+    covered = []
+    for shard in plan.shards:
+        for records in scraper.iter_search_records(shard.params(plan.api_params), limit=1000,
+                                                   since=shard.start, until=shard.end):
+            for record in records:
+                published = date.fromisoformat(record['fields']['dateparution'][:10])
+                assert shard.start <= published < shard.end
+                covered.append(record['fields']['idweb'])
+    assert sorted(covered) == sorted(stub.dates)
+
+
+def test_departement_plan_dedups_across_shards(stub):
+    scraper = make_scraper(stub)
+    plan = scraper.plan_search(SEARCH_URL, max_results=1000, shard_size=60, by='departement')
+    assert plan.by == 'departement' and len(plan.shards) > 2
+    # Tranche en double : ses avis sont déjà rendus par la première
+    plan.shards.append(Shard(departements=plan.shards[0].departements, limit=1000))
+    ids = notice_ids(scraper, 1000, plan)
+    assert len(ids) == len(set(ids)) == len(stub.notices)
+
+
+def test_departement_plan_respects_max_results(stub):
+    scraper = make_scraper(stub)
+    plan = scraper.plan_search(SEARCH_URL, max_results=150, shard_size=60, by='departement')
+    ids = notice_ids(scraper, 150, plan)
+    assert len(ids) == len(set(ids)) == 150
+    assert set(ids) <= set(stub.dates)
+
+
+def test_plan_unreachable_api_returns_none():
+    scraper = BOAMPScraper(api_base="http://127.0.0.1:9", session=BOAMPSession(rate=None, max_retries=0))
+    assert scraper.plan_search(SEARCH_URL, max_results=10) is None
+
+
+def test_plan_shard_failure_is_raised(stub):
+    scraper = make_scraper(stub)
+    plan = scraper.plan_search(SEARCH_URL, max_results=1000, shard_size=50, by='date')
+    failing = f'dateparution<"{plan.shards[2].end.isoformat()}'
+    stub.fail = lambda path, params: params.get('rows') != ['0'] and failing in params.get('q', [''])[0]
+    ids = []
+    with pytest.raises(SearchIncomplete):
+        for record, _ in scraper.iter_search_notices(SEARCH_URL, [], max_results=1000, plan=plan):
+            ids.append(record['fields']['idweb'])
+    stub.fail = None
+    # Les tranches précédant la tranche en panne sont rendues en entier, dans l'ordre
+    assert 0 < len(ids) < len(stub.notices)
+    assert ids == notice_ids(scraper, len(ids))
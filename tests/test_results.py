@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from boamp_results import Company, CompanyResult, CompanyStore, Lot, merge_awards
+
+WITH_SIRET = {'nom': 'SARL Dordogne-Climatisation', 'siret': '123 456 789 00012', 'ville': '24100 Bergerac',
+              'lot_title': 'Lot 1 - CVC', 'mots_cles_matches': 'CVC', 'avis_id': '26-1'}
+WITHOUT_SIRET = {'nom': 'DORDOGNE CLIMATISATION', 'ville': 'Bergerac', 'email': 'contact@dc.fr',
+                 'lot_title': 'Lot 3 - Plomberie', 'mots_cles_matches': 'plomberie', 'avis_id': '26-2'}
+OTHER = {'nom': 'Gironde Électricité', 'ville': 'Bordeaux', 'lot_title': 'Lot 2', 'avis_id': '26-1'}
+
+
+@pytest.mark.parametrize('rows', [
+    [WITH_SIRET, OTHER, WITHOUT_SIRET],
+    [WITHOUT_SIRET, OTHER, WITH_SIRET],
+], ids=['siret-first', 'siret-last'])
+def test_company_seen_with_and_without_siret_is_one_row(rows):
+    store = CompanyStore()
+    store.add_results(rows)
+    companies = store.companies()
+    assert len(companies) == 2
+    merged = next(c for c in companies if c['siret'])
+    assert merged['siret'] == '12345678900012'
+    assert merged['email'] == 'contact@dc.fr'
+    assert set(merged['avis_id'].split(', ')) == {'26-1', '26-2'}
+    assert set(merged['lot_title'].split(' | ')) == {'Lot 1 - CVC', 'Lot 3 - Plomberie'}
+    assert merged['nb_avis'] == 2
+    # Ordre de première apparition conservé
+    assert companies[0]['nom'] == rows[0]['nom']
+
+
+def make_results():
+    """Deux lots remportés par la même entreprise, et une seconde entreprise"""
+    acme = Company('ACME', email='contact@acme.fr', ville='75001 Paris', url_source='u')
+    lots = [Lot('Lot 1 - CVC', ('Lot 1 - CVC',), [acme]), Lot('Lot 2 - Plomberie', ('Lot 2 - Plomberie',), [acme]),
+            Lot('Lot 3 - CVC', ('Lot 3 - CVC',), [Company('BETA', ville='Lyon')])]
+    return merge_awards(lots, ['cvc', 'plomberie'])
+
+
+def test_company_result_reads_like_the_old_dict():
+    acme, beta = make_results()
+    assert isinstance(acme, CompanyResult)
+    assert dict(acme) == {'nom': 'ACME', 'email': 'contact@acme.fr', 'telephone': '', 'ville': '75001 Paris',
+                          'url_source': 'u', 'lot_title': 'Lot 1 - CVC | Lot 2 - Plomberie',
+                          'mots_cles_matches': 'cvc, plomberie'}
+    assert 'siret' not in beta and beta.get('siret') is None
+
+
+def test_company_result_accepts_arbitrary_keys():
+    acme, beta = make_results()
+    acme['avis_id'] = '26-1'
+    acme['note'] = 'à rappeler'
+    acme['email'] = 'achats@acme.fr' # Propre à ce résultat : l'attributaire partagé ne change pas
+    del acme['telephone']
+    assert acme['note'] == 'à rappeler' and acme['email'] == 'achats@acme.fr'
+    assert 'telephone' not in acme
+    assert list(acme)[-1] == 'note' and len(acme) == len(list(acme))
+    assert acme.company.email == 'contact@acme.fr'
+    acme.update(score=3)
+    assert acme.pop('score') == 3 and 'score' not in acme
+    del acme['note']
+    with pytest.raises(KeyError):
+        del acme['note']
+    assert json.loads(json.dumps(acme.to_dict()))['email'] == 'achats@acme.fr'
+    with pytest.raises(TypeError):
+        json.dumps(beta) # Pas un dict : to_dict() / as_dicts (documenté)
+
+    store = CompanyStore()
+    store.add_results([acme])
+    assert store.companies()[0]['email'] == 'achats@acme.fr'
@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+import pytest
+
+from boamp_http import BOAMPSession
+from boamp_scraper import BOAMPScraper, SearchIncomplete
+from boamp_sync import SyncState
+from conftest import SEARCH_URL
+
+
+def fail_older_windows(days):
+    """Panne sur les pages des fenêtres qui se terminent il y a plus de `days` jours"""
+    cutoff = (date.today() - timedelta(days=days)).isoformat()
+    def fail(path, params):
+        q = params.get('q', [''])[0]
+        return params.get('rows') != ['0'] and 'dateparution<"' in q and q.split('dateparution<"')[1][:10] <= cutoff
+    return fail
+
+
+def make_scraper(stub):
+    return BOAMPScraper(api_base=stub.base, session=BOAMPSession(rate=None, max_retries=0))
+
+
+def test_resync_recovers_notices_after_window_failure(stub):
+    state = SyncState(':memory:')
+    key = state.search_key(SEARCH_URL, [])
+    scraper = make_scraper(stub)
+
+    stub.fail = fail_older_windows(20)
+    with pytest.raises(SearchIncomplete):
+        scraper.sync_search_results(SEARCH_URL, [], state, max_results=1000)
+    partial = state.seen(key)
+    assert 0 < len(partial) < len(stub.notices)
+    assert state.high_water_mark(key) is None
+
+    stub.fail = None
+    scraper.sync_search_results(SEARCH_URL, [], state, max_results=1000)
+    assert set(state.seen(key)) == set(stub.dates)
+    assert state.high_water_mark(key) == date.today()
+
+
+def test_truncated_sync_keeps_high_water_mark(stub):
+    state = SyncState(':memory:')
+    key = state.search_key(SEARCH_URL, [])
+    scraper = make_scraper(stub)
+
+    scraper.sync_search_results(SEARCH_URL, [], state, max_results=100)
+    assert len(state.seen(key)) == 100
+    assert state.high_water_mark(key) is None
+
+    scraper.sync_search_results(SEARCH_URL, [], state, max_results=1000)
+    assert set(state.seen(key)) == set(stub.dates)
+    assert state.high_water_mark(key) == date.today()